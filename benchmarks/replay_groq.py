@@ -0,0 +1,159 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import httpx
+from groq import Groq, RateLimitError
+from groq.types import CompletionUsage
+from groq.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessage
+from groq.types.chat.chat_completion import Choice
+from groq.types.chat.chat_completion_chunk import Choice as ChunkChoice
+from groq.types.chat.chat_completion_chunk import ChoiceDelta, XGroq
+
+from visual_explainer.agents.prompts.animator import ANIMATOR_PROMPT
+from visual_explainer.agents.prompts.planner import PLANNER_PROMPT
+from visual_explainer.agents.prompts.storyboarder import STORYBOARDER_PROMPT
+from visual_explainer.agents.rate_limiter import estimate_tokens
+
+DEFAULT_RECORDING = os.path.join(os.path.abspath(os.path.curdir), "outputs", "videos", "test-thread", "state.json")
+
+
+def load_recording(recording_path: Union[str, os.PathLike] = DEFAULT_RECORDING) -> List[Dict[str, Any]]:
+    """
+    The scenes of a finished run, which hold every agent's answer. Takes an older `state.json`
+    (a list of scenes) or a `snapshot.json` of the state store (an AgentState).
+    """
+    with open(recording_path, "r") as f:
+        recording = json.load(f)
+    scenes = recording["scenes"] if isinstance(recording, dict) else recording
+    return [{**scene, "id": int(scene["id"])} for scene in scenes]
+
+
+class _ReplayCompletions:
+    def __init__(self, client: "ReplayGroq"):
+        self.client = client
+
+    def create(self, **params) -> ChatCompletion:
+        return self.client.replay(**params)
+
+
+class _ReplayChat:
+    def __init__(self, client: "ReplayGroq"):
+        self.completions = _ReplayCompletions(client)
+
+
+class ReplayGroq(Groq):
+    """
+    Offline stand-in for the Groq client: answers the Planner, Storyboarder and Animator with the
+    recorded outputs of an earlier run, after an injected latency, and fails a share of the calls
+    with a 429 the way the API does. Nothing leaves the machine.
+    """
+    def __init__(
+        self,
+        scenes: List[Dict[str, Any]],
+        latency: float = 0.5,
+        jitter: float = 0.25,
+        tokens_per_second: Optional[float] = None,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        seed: int = 0,
+    ):
+        super().__init__(api_key="replay")
+        self.scenes = {scene["id"]: scene for scene in scenes}
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "rate_limited": 0, "planner": 0, "storyboarder": 0, "animator": 0}
+
+    def __repr__(self):
+        return f"ReplayGroq(scenes={len(self.scenes)}, latency={self.latency}, rate_limit_rate={self.rate_limit_rate}, stats={self.stats})"
+
+    @property
+    def chat(self) -> _ReplayChat:
+        return _ReplayChat(self)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def _draw(self) -> tuple[float, bool]:
+        with self._lock:
+            return self._random.uniform(0, self.jitter), self._random.random() < self.rate_limit_rate
+
+    def _answer(self, messages: List[Dict[str, Any]]) -> tuple[str, str]:
+        """(agent, JSON answer) for a request, the agent is told apart by its system prompt."""
+        system_prompt = next((message["content"] for message in messages if message.get("role") == "system"), "")
+        if system_prompt == PLANNER_PROMPT:
+            scenes = [{"id": scene["id"], "scene_plan": scene["scene_plan"], "script": scene["script"]} for scene in self.scenes.values()]
+            return "planner", json.dumps({"scenes": scenes})
+
+        # The first user message is the scene itself (a repair attempt only adds messages after it)
+        request = next(message["content"] for message in messages if message.get("role") == "user")
+        # Instructions may follow the scene's JSON (the narration length), only the JSON is parsed
+        scene_json, _ = json.JSONDecoder().raw_decode(request.split(": ", 1)[1])
+        scene = self.scenes[int(scene_json["id"])]
+        if system_prompt == STORYBOARDER_PROMPT:
+            return "storyboarder", json.dumps({"storyboard": scene["storyboard"], "animation_instruction": scene["animation_instructions"]})
+        if system_prompt == ANIMATOR_PROMPT:
+            return "animator", json.dumps({"manim_code": scene["manim_code"]})
+        raise ValueError("ReplayGroq has no recording for this request")
+
+    def _stream(self, content: str, model: str, first_token: float, generation_time: float, usage: CompletionUsage, chunk_chars: int = 40) -> Iterator[ChatCompletionChunk]:
+        """The answer in chunks spread over `generation_time`, the usage comes with the last one as with Groq."""
+        completion_id = f"replay-{uuid.uuid4().hex[:12]}"
+        pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)] or [""]
+        time.sleep(first_token)
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(generation_time / len(pieces))
+            last = i == len(pieces) - 1
+            yield ChatCompletionChunk(
+                id=completion_id,
+                object="chat.completion.chunk",
+                created=int(time.time()),
+                model=model,
+                choices=[ChunkChoice(index=0, delta=ChoiceDelta(content=piece), finish_reason="stop" if last else None)],
+                x_groq=XGroq(id=completion_id, usage=usage) if last else None,
+            )
+
+    def replay(self, **params) -> Union[ChatCompletion, Iterator[ChatCompletionChunk]]:
+        self._count("calls")
+        jitter, rate_limited = self._draw()
+        if rate_limited:
+            self._count("rate_limited")
+            raise RateLimitError(
+                "Rate limit reached (injected by ReplayGroq)",
+                response=httpx.Response(429, headers={"retry-after": str(self.retry_after)}, request=httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")),
+                body=None,
+            )
+
+        agent, content = self._answer(params["messages"])
+        self._count(agent)
+
+        prompt_tokens = estimate_tokens(params["messages"])
+        completion_tokens = len(content) // 4 + 1
+        delay = self.latency + jitter
+        generation_time = completion_tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+        delay += generation_time
+        usage = CompletionUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens)
+        if params.get("stream"):
+            return self._stream(content, params.get("model", ""), delay - generation_time, generation_time, usage)
+        time.sleep(delay)
+
+        return ChatCompletion(
+            id=f"replay-{uuid.uuid4().hex[:12]}",
+            object="chat.completion",
+            created=int(time.time()),
+            model=params.get("model", ""),
+            choices=[Choice(index=0, finish_reason="stop", message=ChatCompletionMessage(role="assistant", content=content))],
+            usage=usage,
+        )
@@ -0,0 +1,204 @@
+"""
+Offline end-to-end benchmark: topic -> scenes -> real Manim renders -> final video, with the LLM
+answers replayed from a recorded run. Run from the repository root:
+
+    python -m benchmarks.run_benchmark --runs 3 --latency 0.8 --rate-limit-rate 0.05 --json-out report.json
+    python -m benchmarks.run_benchmark --baseline report.json   # exits with 1 on a regression
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# Every run renders for real: unless RENDER_CACHE_DIR is set, the render cache starts empty in a temp dir
+BENCHMARK_DIR = tempfile.mkdtemp(prefix="visual-explainer-bench-")
+os.environ.setdefault("RENDER_CACHE_DIR", os.path.join(BENCHMARK_DIR, "render-cache"))
+
+from benchmarks.replay_groq import DEFAULT_RECORDING, ReplayGroq, load_recording  # noqa: E402
+from visual_explainer import tracing  # noqa: E402
+from visual_explainer.agents.director import Director  # noqa: E402
+from visual_explainer.agents.rate_limiter import rate_limiter  # noqa: E402
+from visual_explainer.pipeline import Pipeline  # noqa: E402
+from visual_explainer.tools.narration import Narrator, StandInBackend  # noqa: E402
+from visual_explainer.tools.render_pool import RenderPool  # noqa: E402
+
+# Spans reported as stages, see `visual_explainer.tracing`
+STAGE_SPANS = ["plan", "stage.storyboard", "stage.animation", "llm.call", "animator.attempt", "manim.execute", "assemble"]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is in kilobytes on Linux; the children are the manim processes and render workers
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def collect_spans(thread_ids: List[str]) -> List[Dict[str, Any]]:
+    spans = []
+    for thread_id in thread_ids:
+        spans.extend(tracing.trace_sink.load(thread_id))
+    return spans
+
+
+def build_report(args, thread_ids: List[str], videos: int, wall_time: float, client: ReplayGroq) -> Dict[str, Any]:
+    spans = collect_spans(thread_ids)
+
+    stage_latency = {}
+    for name in STAGE_SPANS:
+        durations = [record["duration"] for record in spans if record["name"] == name]
+        if durations:
+            stage_latency[name] = {"count": len(durations), "p50": percentile(durations, 50), "p95": percentile(durations, 95)}
+
+    # A scene that rendered on its first attempt has no retries
+    attempts = defaultdict(int)
+    for record in spans:
+        if record["name"] == "animator.attempt":
+            attempts[(record["thread_id"], record["scene_id"])] += 1
+    retries = [count - 1 for count in attempts.values()]
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("baseline", "json_out")},
+        "videos": videos,
+        "runs": args.runs,
+        "wall_time": wall_time,
+        "videos_per_hour": videos / wall_time * 3600 if wall_time else 0.0,
+        "stage_latency": stage_latency,
+        "retries_per_scene": {
+            "mean": statistics.mean(retries) if retries else 0.0,
+            "max": max(retries, default=0),
+            "scenes": len(retries),
+        },
+        "llm": dict(client.stats),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{report['videos']}/{report['runs']} videos in {report['wall_time']:.1f}s -> {report['videos_per_hour']:.1f} videos/hour")
+    print(f"\n{'stage':<20}{'count':>7}{'p50 s':>9}{'p95 s':>9}")
+    for name, latency in report["stage_latency"].items():
+        print(f"{name:<20}{latency['count']:>7}{latency['p50']:>9.2f}{latency['p95']:>9.2f}")
+
+    retries = report["retries_per_scene"]
+    print(f"\nRetries per scene: mean {retries['mean']:.2f}, max {retries['max']} ({retries['scenes']} scenes)")
+    print(f"LLM calls: {report['llm']}")
+    print(f"Peak RSS: {report['peak_rss_mb']['self']:.0f} MB (pipeline), {report['peak_rss_mb']['children']:.0f} MB (largest render process)")
+
+
+def regressions(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """What got worse than the baseline by more than `tolerance` (a fraction)."""
+    problems = []
+    if report["videos_per_hour"] < baseline["videos_per_hour"] * (1 - tolerance):
+        problems.append(f"videos/hour {report['videos_per_hour']:.1f} < baseline {baseline['videos_per_hour']:.1f}")
+    for name, latency in report["stage_latency"].items():
+        baseline_latency = baseline["stage_latency"].get(name)
+        if baseline_latency and latency["p95"] > baseline_latency["p95"] * (1 + tolerance):
+            problems.append(f"{name} p95 {latency['p95']:.2f}s > baseline {baseline_latency['p95']:.2f}s")
+    if report["retries_per_scene"]["mean"] > baseline["retries_per_scene"]["mean"] * (1 + tolerance) + 0.1:
+        problems.append(f"retries per scene {report['retries_per_scene']['mean']:.2f} > baseline {baseline['retries_per_scene']['mean']:.2f}")
+    return problems
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    tracing.trace_sink = tracing.TraceSink(os.path.join(BENCHMARK_DIR, "traces"))
+    rate_limiter.default_requests_per_minute = args.rpm
+    rate_limiter.default_tokens_per_minute = args.tpm
+
+    client = ReplayGroq(
+        load_recording(args.recording),
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+    render_pool: Optional[RenderPool] = RenderPool(n_workers=args.render_workers) if args.render_workers else None
+    pipeline = Pipeline(
+        client,
+        max_concurrency=args.concurrency,
+        output_root=os.path.join(BENCHMARK_DIR, "videos"),
+        render_pool=render_pool,
+        speculative_k=args.speculative_k,
+        stream=args.stream,
+        # Deterministic clips, so runs compare the scheduling rather than the TTS engine
+        narrator=Narrator(StandInBackend(), cache_dir=os.path.join(BENCHMARK_DIR, "narration")) if args.narrate else None,
+    )
+
+    # The Director runs the same stages as a task graph on separate LLM and render pools
+    director = Director(pipeline, llm_workers=args.concurrency) if args.director else None
+
+    thread_ids, videos = [], 0
+    start = time.perf_counter()
+    try:
+        for run in range(args.runs):
+            thread_id = f"bench-{run}"
+            thread_ids.append(thread_id)
+            agent_state = (director or pipeline).run(args.topic, thread_id=thread_id)
+            if agent_state.final_video_path and os.path.exists(agent_state.final_video_path):
+                videos += 1
+    finally:
+        if director is not None:
+            director.close()
+        if render_pool is not None:
+            render_pool.close()
+    wall_time = time.perf_counter() - start
+
+    return build_report(args, thread_ids, videos, wall_time, client)
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark of the full pipeline, with replayed LLM answers and real renders.")
+    parser.add_argument("--recording", default=DEFAULT_RECORDING, help="state.json / snapshot.json of a finished run to replay")
+    parser.add_argument("--topic", default="Pythagoras theorem")
+    parser.add_argument("--runs", type=int, default=1, help="Videos to produce, one after the other")
+    parser.add_argument("--concurrency", type=int, default=4, help="Scenes in flight per video")
+    parser.add_argument("--render-workers", type=int, default=0, help="Size of the warm render pool, 0 renders through the manim CLI")
+    parser.add_argument("--speculative-k", type=int, default=1)
+    parser.add_argument("--stream", action="store_true", help="Stream completions, scenes start while the plan is still being written")
+    parser.add_argument("--narrate", action="store_true", help="Narrate every scene with the stand-in TTS backend and mux the audio")
+    parser.add_argument("--director", action="store_true", help="Run the stages through the Director's task graph instead of the per-scene pipeline")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds added to every LLM call")
+    parser.add_argument("--jitter", type=float, default=0.25, help="Random extra seconds per LLM call")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Simulated generation speed, on top of --latency")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of LLM calls answered with a 429")
+    # Far above Groq's real limits (rate_limiter.MODEL_LIMITS): each call reserves its prompt plus a completion
+    # allowance, and with the free-tier budgets a replayed run would mostly measure the limiter's waits
+    parser.add_argument("--rpm", type=int, default=1000, help="Client-side requests per minute budget, for every model")
+    parser.add_argument("--tpm", type=int, default=10_000_000, help="Client-side tokens per minute budget, for every model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-out", default=None, help="Write the report to this file")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare with, exits with 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline (fraction)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run_benchmark(args)
+    print_report(report)
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            problems = regressions(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        sys.exit(1 if problems else 0)
@@ -72,4 +72,230 @@ print(f"Result: {result}")
 assert isinstance(result, Result)
 assert result.answer == "3"
 
+
+# Test 3: Async client through ainvoke
+print("\nTest 3: Async client through ainvoke")
+import asyncio
+from unittest.mock import AsyncMock
+
+from groq import AsyncGroq
+
+async_client = MagicMock(spec=AsyncGroq)
+async_client.chat.completions.create = AsyncMock(side_effect=[
+    create_mock_response(tool_calls=[tool_call]),
+    create_mock_response(content='{"answer": "3"}')
+])
+
+async_agent = BaseAgent(
+    llm_client=async_client,
+    model="test-model",
+    system_prompt="System Prompt",
+    tools_registry=tools_registry,
+    tools_schemas=tools_schemas,
+    output_schema=Result
+)
+
+result = asyncio.run(async_agent.ainvoke([{"role": "user", "content": "Add 1 and 2"}]))
+print(f"Result: {result}")
+assert isinstance(result, Result)
+assert result.answer == "3"
+
+
+# Test 4: Structured-output fast path (no tools, so a response_format is requested)
+print("\nTest 4: Structured-output fast path")
+import httpx
+from groq import BadRequestError
+
+json_agent = BaseAgent(
+    llm_client=mock_client,
+    model="test-model",
+    system_prompt="System Prompt",
+    output_schema=Result,
+    response_format_mode="json_schema",
+)
+
+mock_client.chat.completions.create.reset_mock()
+mock_client.chat.completions.create.side_effect = None
+mock_client.chat.completions.create.return_value = create_mock_response(content='{"answer": "7"}')
+result = json_agent.invoke([{"role": "user", "content": "Answer in JSON"}])
+assert result.answer == "7"
+assert mock_client.chat.completions.create.call_args.kwargs["response_format"]["type"] == "json_schema"
+
+# A model without json_schema support falls back to JSON mode, fences and prose are repaired locally
+bad_request = BadRequestError(
+    "response_format json_schema is not supported",
+    response=httpx.Response(400, request=httpx.Request("POST", "https://api.groq.com")),
+    body=None,
+)
+mock_client.chat.completions.create.side_effect = [
+    bad_request,
+    create_mock_response(content='Sure!\n```json\n{"answer": "8",}\n```'),
+]
+result = json_agent.invoke([{"role": "user", "content": "Answer in JSON"}])
+print(f"Result: {result}, stats: {json_agent.output_stats}")
+assert result.answer == "8"
+assert mock_client.chat.completions.create.call_args.kwargs["response_format"]["type"] == "json_object"
+assert json_agent.output_stats == {"native": 1, "plain": 0, "repaired": 1, "extractor": 0, "format_fallbacks": 1}
+
+
+def create_bad_request(message, code):
+    return BadRequestError(
+        message,
+        response=httpx.Response(400, request=httpx.Request("POST", "https://api.groq.com")),
+        body={"error": {"message": message, "type": "invalid_request_error", "code": code}},
+    )
+
+
+# Any other 400 comes out as is, the model keeps its mode and no call is spent on a fallback
+mock_client.chat.completions.create.reset_mock()
+mock_client.chat.completions.create.side_effect = [create_bad_request("Please reduce the length of the messages", "context_length_exceeded")]
+try:
+    json_agent.invoke([{"role": "user", "content": "Answer in JSON"}])
+    raise AssertionError("The context length error was swallowed")
+except BadRequestError as e:
+    assert "reduce the length" in str(e)
+assert mock_client.chat.completions.create.call_count == 1
+assert json_agent._format_mode("test-model") == "json_object"
+
+# Output that failed Groq's validation is asked for again without a response_format, so it isn't "native"
+mock_client.chat.completions.create.side_effect = [
+    create_bad_request("Failed to generate JSON", "json_validate_failed"),
+    create_mock_response(content='{"answer": "9"}'),
+]
+result = json_agent.invoke([{"role": "user", "content": "Answer in JSON"}])
+assert result.answer == "9"
+assert "response_format" not in mock_client.chat.completions.create.call_args.kwargs
+assert json_agent.output_stats == {"native": 1, "plain": 1, "repaired": 1, "extractor": 0, "format_fallbacks": 2}
+
+
+# Test 5: Streamed completion, scenes are parsed as their objects close and a callback can stop the stream
+print("\nTest 5: Streamed completion")
+from visual_explainer.agents.agent import StreamAborted
+from visual_explainer.agents.json_stream import JsonArrayStream
+
+
+class Scenes(BaseModel):
+    scenes: list
+
+
+def create_mock_stream(content, chunk_size=5):
+    chunks = []
+    for i in range(0, len(content), chunk_size):
+        chunk = MagicMock()
+        chunk.choices = [MagicMock()]
+        chunk.choices[0].delta.content = content[i:i + chunk_size]
+        chunk.x_groq = None
+        chunks.append(chunk)
+    stream = MagicMock()
+    stream.__iter__.return_value = iter(chunks)
+    return stream
+
+
+stream_agent = BaseAgent(
+    llm_client=mock_client,
+    model="test-model",
+    system_prompt="System Prompt",
+    output_schema=Scenes,
+)
+
+mock_client.chat.completions.create.reset_mock()
+mock_client.chat.completions.create.side_effect = None
+mock_client.chat.completions.create.return_value = create_mock_stream('{"scenes": [{"id": 1}, {"id": 2}]}')
+parser, seen = JsonArrayStream("scenes"), []
+result = stream_agent.invoke_stream([{"role": "user", "content": "Plan"}], lambda text: seen.extend(parser.feed(text)))
+print(f"Result: {result}, scenes seen while streaming: {seen}")
+assert seen == [{"id": 1}, {"id": 2}]
+assert result.scenes == seen
+assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+assert "response_format" not in mock_client.chat.completions.create.call_args.kwargs
+
+
+def stop_after_first_scene(text):
+    if parser.feed(text):
+        raise StreamAborted("enough")
+
+
+stream = create_mock_stream('{"scenes": [{"id": 1}, {"id": 2}]}')
+mock_client.chat.completions.create.return_value = stream
+parser = JsonArrayStream("scenes")
+try:
+    stream_agent.invoke_stream([{"role": "user", "content": "Plan"}], stop_after_first_scene)
+    raise AssertionError("StreamAborted was swallowed")
+except StreamAborted as e:
+    assert str(e) == "enough"
+stream.close.assert_called_once()
+
+# The stream holds its in-flight slot until it is read, and its completion is charged from the streamed text
+from visual_explainer.agents.rate_limiter import rate_limiter
+
+content = '{"scenes": [{"id": 1, "script": "' + "word " * 400 + '"}]}'
+mock_client.chat.completions.create.return_value = create_mock_stream(content, chunk_size=50)
+rate_limiter.set_max_in_flight(1)
+slot_free_while_streaming = []
+stream_agent.invoke_stream([{"role": "user", "content": "Plan again"}], lambda text: slot_free_while_streaming.append(rate_limiter._slots._value))
+rate_limiter.set_max_in_flight(0)
+assert set(slot_free_while_streaming) == {0}
+charged = rate_limiter.budget("test-model")._events[-1][1]
+assert charged >= len(content) // 4, charged
+
+
+# Test 6: An agent whose invoke takes other arguments (the Animator) still works through ainvoke on a sync client
+print("\nTest 6: Animator.ainvoke on a sync client")
+from visual_explainer.agents.animator import Animator
+
+animator = Animator(mock_client)
+animator.render = lambda manim_code, scene_id, video_path, cancel_event=None, last_attempt=False, repair_context=None: (True, str(video_path))
+mock_client.chat.completions.create.reset_mock()
+mock_client.chat.completions.create.side_effect = None
+mock_client.chat.completions.create.return_value = create_mock_response(content='{"manim_code": "from manim import *"}')
+result = asyncio.run(animator.ainvoke([{"role": "user", "content": "Write manim code"}], scene_id=1, video_path="scene_1.mp4"))
+print(f"Result: {result}")
+assert result.manim_code == "from manim import *" and result.video_path == "scene_1.mp4"
+assert mock_client.chat.completions.create.call_count == 1
+
+# Test 7: On the Groq SDK client, the rate-limit headers of a successful response correct the budget
+print("\nTest 7: Rate-limit headers of every response")
+import httpx
+
+
+def groq_api(request):
+    completion = {
+        "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "tier-model",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": '{"answer": "9"}'}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    }
+    return httpx.Response(200, json=completion, headers={"x-ratelimit-limit-tokens": "60000", "x-ratelimit-remaining-tokens": "59985"})
+
+
+sdk_agent = BaseAgent(
+    llm_client=Groq(api_key="test", http_client=httpx.Client(transport=httpx.MockTransport(groq_api))),
+    model="tier-model",
+    system_prompt="System Prompt",
+    output_schema=Result,
+)
+result = sdk_agent.invoke([{"role": "user", "content": "What is the answer?"}])
+print(f"Result: {result}, budget: {rate_limiter.budget('tier-model')}")
+assert result.answer == "9"
+# DEFAULT_LIMITS assume 6000 tokens and 30 requests a minute, this account has ten times that
+assert rate_limiter.budget("tier-model").tokens_per_minute == 60000
+assert rate_limiter.budget("tier-model").requests_per_minute == 300
+
+# Test 8: A request is charged once, however many attempts it took
+print("\nTest 8: Failed attempts are not charged")
+from groq import RateLimitError
+
+from visual_explainer.agents.rate_limiter import RateLimitManager
+
+limiter = RateLimitManager(requests_per_minute=10, tokens_per_minute=100000, base_backoff=0.01)
+rate_limited = RateLimitError("Rate limit reached", response=httpx.Response(429, request=httpx.Request("POST", "https://api.groq.com")), body=None)
+flaky_create = MagicMock(side_effect=[rate_limited, rate_limited, create_mock_response(content="ok")])
+limiter.call("flaky-model", flaky_create, 100)
+assert flaky_create.call_count == 3 and len(limiter.budget("flaky-model")._events) == 1
+try:
+    limiter.call("flaky-model", MagicMock(side_effect=create_bad_request("Invalid model", "model_not_found")), 100)
+    raise AssertionError("The 400 should have been raised")
+except BadRequestError:
+    pass
+assert len(limiter.budget("flaky-model")._events) == 1
+
 print("\nAll tests passed!")
@@ -0,0 +1,69 @@
+import tempfile
+import time
+from unittest.mock import MagicMock
+
+from groq import Groq
+from pydantic import BaseModel
+
+from visual_explainer.agents.agent import BaseAgent
+from visual_explainer.agents.completion_cache import CompletionCache
+
+
+class Result(BaseModel):
+    answer: str
+
+def create_mock_response(content=None):
+    message = MagicMock()
+    message.content = content
+    message.tool_calls = None
+    message.role = "assistant"
+
+    choice = MagicMock()
+    choice.message = message
+
+    response = MagicMock()
+    response.choices = [choice]
+    return response
+
+
+# Test 1: A repeated invoke is served from the cache without calling the model
+print("Test 1: Cache hit skips the LLM call")
+mock_client = MagicMock(spec=Groq)
+mock_client.chat.completions.create = MagicMock(return_value=create_mock_response(content='{"answer": "42"}'))
+
+cache = CompletionCache(cache_dir=tempfile.mkdtemp())
+agent = BaseAgent(mock_client, "test-model", "System Prompt", output_schema=Result, cache=cache)
+
+first = agent.invoke([{"role": "user", "content": "What is the answer?"}])
+second = agent.invoke([{"role": "user", "content": "What is the answer?"}])
+print(f"Result: {second}, stats: {cache.stats}")
+assert isinstance(second, Result) and second == first
+assert mock_client.chat.completions.create.call_count == 1
+assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+# A different prompt is a different key
+agent.invoke([{"role": "user", "content": "Another question"}])
+assert mock_client.chat.completions.create.call_count == 2
+
+# Test 2: Size cap evicts the least recently used entry
+print("\nTest 2: LRU eviction")
+small_cache = CompletionCache(cache_dir=tempfile.mkdtemp(), max_bytes=250)
+small_cache.put("a", "x" * 50)
+time.sleep(0.01)
+small_cache.put("b", "y" * 50)
+time.sleep(0.01)
+assert small_cache.get("a") is not None     # "a" is now the most recently used
+small_cache.put("c", "z" * 50)
+print(f"Stats: {small_cache.stats}")
+assert small_cache.stats["evictions"] == 1
+assert small_cache.get("b") is None
+assert small_cache.get("a") is not None and small_cache.get("c") is not None
+
+# Test 3: Expired entries are misses
+print("\nTest 3: TTL expiry")
+ttl_cache = CompletionCache(cache_dir=tempfile.mkdtemp(), ttl_seconds=0.01)
+ttl_cache.put("a", "payload")
+time.sleep(0.05)
+assert ttl_cache.get("a") is None
+
+print("\nAll tests passed!")
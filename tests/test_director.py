@@ -0,0 +1,122 @@
+import threading
+import time
+
+from visual_explainer.agents.director import CANCELLED, DONE, FAILED, SKIPPED, Director, RetryFrom, Task
+
+order = []
+
+
+def step(name, seconds=0.01):
+    def fn(task):
+        order.append(name)
+        time.sleep(seconds)
+    return fn
+
+
+# Test 1: One worker runs the longest remaining chain first, then the earlier scene
+print("Test 1: Critical path first")
+with Director(llm_workers=1, render_workers=1) as director:
+    director.add_tasks([
+        Task("t1/storyboard:2", "storyboard", step("storyboard 2"), job="t1", scene_id=2),
+        Task("t1/animate:2", "animate", step("animate 2"), deps=["t1/storyboard:2"], job="t1", scene_id=2),
+        Task("t1/animate:1", "animate", step("animate 1"), job="t1", scene_id=1),
+        Task("t1/animate:0", "animate", step("animate 0"), job="t1", scene_id=0, estimate=0.0),
+    ])
+    director.wait("t1")
+
+print(order)
+assert order == ["storyboard 2", "animate 1", "animate 2", "animate 0"]
+
+# Test 2: A failed render runs its animate task again, then itself
+print("\nTest 2: Retry from upstream")
+renders = []
+
+
+def flaky_render(task):
+    renders.append(task.attempts)
+    if len(renders) == 1:
+        raise RetryFrom("t2/animate:1", "Error: NameError")
+
+
+with Director(llm_workers=1, render_workers=1) as director:
+    director.add_tasks([
+        Task("t2/animate:1", "animate", step("animate"), job="t2", scene_id=1, max_attempts=3),
+        Task("t2/render:1", "render", flaky_render, deps=["t2/animate:1"], job="t2", scene_id=1),
+    ])
+    director.wait("t2")
+    progress = {snapshot["task"]: snapshot for snapshot in director.progress("t2")}
+
+print(progress)
+assert progress["t2/animate:1"]["attempts"] == 2 and progress["t2/render:1"]["status"] == DONE
+assert director.report("t2")["retries"] == 1
+
+# Test 3: Cancelling a scene stops its running render and drops its later tasks, the video still assembles
+print("\nTest 3: Cancel")
+started = threading.Event()
+
+
+def long_render(task):
+    started.set()
+    task.cancel_event.wait(timeout=5)
+
+
+with Director(llm_workers=1, render_workers=1) as director:
+    director.add_tasks([
+        Task("t3/render:1", "render", long_render, job="t3", scene_id=1),
+        Task("t3/render:2", "render", step("render 2"), job="t3", scene_id=2),
+        Task("t3/after:1", "storyboard", step("after"), deps=["t3/render:1"], job="t3", scene_id=1),
+        Task("t3/assemble", "assemble", step("assemble"), deps=["t3/after:1", "t3/render:2"], job="t3", allow_failed_deps=True),
+    ])
+    started.wait(timeout=5)
+    director.cancel("t3", scene_id=1)
+    director.wait("t3")
+    statuses = {snapshot["task"]: snapshot["status"] for snapshot in director.progress("t3")}
+
+print(statuses)
+assert statuses == {"t3/render:1": CANCELLED, "t3/render:2": DONE, "t3/after:1": CANCELLED, "t3/assemble": DONE}
+
+# Test 4: A failed task skips its dependents
+print("\nTest 4: Failure")
+
+
+def broken(task):
+    raise ValueError("no storyboard")
+
+
+with Director(llm_workers=1, render_workers=1) as director:
+    director.add_tasks([
+        Task("t4/storyboard:1", "storyboard", broken, job="t4", scene_id=1, max_attempts=2),
+        Task("t4/animate:1", "animate", step("animate"), deps=["t4/storyboard:1"], job="t4", scene_id=1),
+    ])
+    director.wait("t4")
+    progress = {snapshot["task"]: snapshot for snapshot in director.progress("t4")}
+
+print(progress)
+assert progress["t4/storyboard:1"]["status"] == FAILED and progress["t4/storyboard:1"]["attempts"] == 2
+assert progress["t4/animate:1"]["status"] == SKIPPED
+
+# Test 5: A plan task stands for its whole video until it adds the video's tasks
+print("\nTest 5: Plan before a shorter chain")
+order.clear()
+release = threading.Event()
+
+
+def blocker(task):
+    release.wait(timeout=5)
+
+
+with Director(llm_workers=1, render_workers=1) as director:
+    director.add_tasks([Task("t5a/blocker", "blocker", blocker, job="t5a")])
+    director.add_tasks([
+        Task("t5a/storyboard:1", "storyboard", step("storyboard a"), job="t5a", scene_id=1),
+        Task("t5a/animate:1", "animate", step("animate a"), deps=["t5a/storyboard:1"], job="t5a", scene_id=1),
+        Task("t5b/plan", "plan", step("plan b"), job="t5b"),
+    ])
+    release.set()
+    director.wait("t5a")
+    director.wait("t5b")
+
+print(order)
+assert order[0] == "plan b"
+
+print("\nAll tests passed!")
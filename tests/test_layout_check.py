@@ -0,0 +1,101 @@
+from visual_explainer.agents.repair_context import RepairContext
+from visual_explainer.tools import manim_validate
+from visual_explainer.tools.manim_layout import EDGE_BUFF, SAFE_X, SAFE_Y, find_violations, format_violations
+
+REGION = (-SAFE_X - EDGE_BUFF, SAFE_X + EDGE_BUFF, -SAFE_Y - EDGE_BUFF, SAFE_Y + EDGE_BUFF)
+CODE = "from manim import *\n\nclass VideoScene(Scene):\n    def construct(self):\n        self.wait()\n"
+
+# Test 1: A title put where to_edge(UP) puts it passes, a diagram past x = -6.5 does not
+print("Test 1: Out of frame")
+title = ("`title` (Text 'Area')", (-2.0, 2.0, 3.0, 3.5))
+axes = ("`axes` (Axes)", (-7.5, 5.0, -3.0, 2.5))
+violations = find_violations(0, REGION, [title, axes], [])
+print(violations)
+assert [violation["mobjects"] for violation in violations] == [["`axes` (Axes)"]]
+assert violations[0]["kind"] == "out_of_frame" and violations[0]["box"] == [-7.5, 5.0, -3.0, 2.5]
+
+# Test 2: Labels that touch are fine, labels on top of each other are not
+print("Test 2: Overlapping text")
+label_a = ("`a` (MathTex 'a^2')", (0.0, 1.0, 0.0, 0.5))
+label_b = ("`b` (MathTex 'b^2')", (1.0, 2.0, 0.0, 0.5))
+label_c = ("`c` (MathTex 'c^2')", (0.5, 1.5, 0.1, 0.6))
+violations = find_violations(4, REGION, [], [label_a, label_b, label_c])
+print(violations)
+assert [violation["mobjects"] for violation in violations] == [[label_a[0], label_c[0]], [label_b[0], label_c[0]]]
+
+# Test 3: Violations fail the validation with feedback that survives the repair context whole
+print("Test 3: Feedback for the Animator")
+
+
+def fake_dry_run(code, scene_id, timeout=20, pool=None):
+    manim_validate._remember(code, {"num_plays": 5, "layout": violations})
+    return None
+
+
+manim_validate.dry_run = fake_dry_run
+execution_bool, status_str = manim_validate.validate_manim_code(CODE, scene_id=1, enforce_layout=True)
+assert not execution_bool and status_str == f"Error:\n{format_violations(violations)}"
+assert "call #5, `a` (MathTex 'a^2') overlaps `c` (MathTex 'c^2')" in status_str
+
+repair_context = RepairContext([{"role": "user", "content": "Write manim code for this scene"}])
+repair_context.record_failure(CODE, status_str)
+assert repair_context.latest_error == status_str
+
+# Test 4: On the last attempt the same code goes on to the render, and its animation count is still known
+print("Test 4: Not enforced")
+assert manim_validate.validate_manim_code(CODE, scene_id=1, enforce_layout=False) == (True, "")
+assert manim_validate.count_animations(CODE, scene_id=1) == 5
+
+# Test 5: Validations on many threads share the bounded report cache safely
+print("Test 5: Concurrent reports")
+import threading
+
+manim_validate.MAX_DRY_RUNS = 8
+errors = []
+
+
+def validate_many(thread_index):
+    try:
+        for i in range(200):
+            code = f"{CODE}        # {thread_index}-{i}\n"
+            manim_validate.validate_manim_code(code, scene_id=thread_index, enforce_layout=False)
+            manim_validate.count_animations(code, scene_id=thread_index)
+    except Exception as e:
+        errors.append(e)
+
+
+threads = [threading.Thread(target=validate_many, args=(index,)) for index in range(8)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+assert not errors, errors
+assert len(manim_validate._dry_runs) == 8
+
+# Test 6: On by default, the Animator retries a scene once for its layout and then renders it as it is
+print("Test 6: One layout retry per scene")
+from unittest.mock import MagicMock
+
+from groq import Groq
+
+from visual_explainer.agents import animator as animator_module
+
+assert manim_validate.LAYOUT_CHECK and manim_validate.LAYOUT_RETRIES == 1
+manim_validate.dry_run = fake_dry_run
+animator_module.validate_manim_code = manim_validate.validate_manim_code
+animator_module.reuse_cached_render = lambda code, scene_id, video_path, quality="l": False
+animator_module.execute_manim_code = lambda code, scene_id, video_path, pool=None, cancel_event=None: (True, str(video_path))
+
+animator = animator_module.Animator(MagicMock(spec=Groq))
+animator._generate = MagicMock(return_value=(animator_module.AnimatorOutput(manim_code=CODE), None))
+result = animator.invoke([{"role": "user", "content": "Write manim code"}], scene_id=1, video_path="scene_1.mp4", n_retries=3)
+# The first attempt failed on the layout, the second rendered despite it, the third never ran
+assert result.video_path == "scene_1.mp4" and animator._generate.call_count == 2
+
+repair_context = RepairContext([{"role": "user", "content": "Write manim code"}])
+repair_context.record_failure(CODE, status_str)
+assert repair_context.layout_failures == 1
+assert animator.render(CODE, 1, "scene_1.mp4") == (False, status_str)
+assert animator.render(CODE, 1, "scene_1.mp4", repair_context=repair_context) == (True, "scene_1.mp4")
+
+print("\nAll tests passed!")
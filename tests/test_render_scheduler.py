@@ -0,0 +1,49 @@
+import threading
+import time
+
+from visual_explainer.tools import render_scheduler
+from visual_explainer.tools.render_pool import CANCELLED_MESSAGE
+from visual_explainer.tools.render_scheduler import RenderScheduler
+
+rendered = []
+
+
+def fake_execute_manim_code(code, scene_id, video_path, timeout=30, quality="l", pool=None, cancel_event=None, limits=None):
+    rendered.append((scene_id, limits.cores))
+    time.sleep(0.05)
+    return True, video_path
+
+
+render_scheduler.execute_manim_code = fake_execute_manim_code
+
+# Test 1: With one slot, queued renders run by scene id, not by arrival
+print("Test 1: Priority order")
+scheduler = RenderScheduler(max_concurrency=1, cores_per_render=1)
+first = threading.Thread(target=scheduler.render, args=("", 9, "9.mp4"))
+first.start()
+time.sleep(0.01)  # scene 9 holds the slot while the others queue up
+threads = [threading.Thread(target=scheduler.render, args=("", scene_id, f"{scene_id}.mp4")) for scene_id in (5, 2, 7)]
+for thread in threads:
+    thread.start()
+    time.sleep(0.01)
+for thread in [first, *threads]:
+    thread.join()
+
+print(rendered)
+assert [scene_id for scene_id, _ in rendered] == [9, 2, 5, 7]
+report = scheduler.report()
+assert report["jobs"] == 4 and report["queue_wait_max"] > report["render_time_max"]
+
+# Test 2: A render cancelled while it waits for a slot never starts
+print("Test 2: Cancelled while queued")
+rendered.clear()
+cancel_event = threading.Event()
+holder = threading.Thread(target=scheduler.render, args=("", 0, "0.mp4"))
+holder.start()
+time.sleep(0.01)
+cancel_event.set()
+assert scheduler.render("", 1, "1.mp4", cancel_event=cancel_event) == (False, CANCELLED_MESSAGE)
+holder.join()
+assert [scene_id for scene_id, _ in rendered] == [0]
+
+print("\nAll tests passed!")
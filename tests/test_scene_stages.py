@@ -0,0 +1,42 @@
+from visual_explainer.state import Scene, merge_scenes
+
+scene = Scene(id=1, scene_plan="Plan", script="Narration")
+
+# Test 1: A fresh scene needs every stage
+print("Test 1: Fresh scene")
+print(f"Stale stages: {scene.stale_stages()}")
+assert scene.stale_stages() == ["storyboard", "animation", "render"]
+
+# Test 2: Completed stages are up to date
+print("\nTest 2: Completed scene")
+scene = scene.mark_done("storyboard").model_copy(update={"storyboard": "Board", "animation_instructions": "Steps"})
+scene = scene.model_copy(update={"manim_code": "from manim import *"}).mark_done("animation", "render")
+print(f"Stale stages: {scene.stale_stages()}")
+assert scene.stale_stages() == []
+
+# Test 3: Editing the narration invalidates that stage and everything downstream of it
+print("\nTest 3: Edited script")
+edited = scene.model_copy(update={"script": "New narration"})
+print(f"Stale stages: {edited.stale_stages()}")
+assert edited.stale_stages() == ["storyboard", "animation", "render"]
+
+# Test 4: Editing the code only needs a render
+print("\nTest 4: Edited code")
+edited = scene.model_copy(update={"manim_code": "from manim import *\n"})
+assert edited.stale_stages() == ["render"]
+
+# Test 5: The reducer keeps the stage hashes, and the hashes never reach the LLM schema
+print("\nTest 5: Reducer and schema")
+merged = merge_scenes([Scene(id=1, scene_plan="Plan", script="Narration")], [scene])
+assert merged[0].stale_stages() == []
+assert "stage_hashes" not in Scene.model_json_schema()["properties"]
+
+# Test 6: Narration only depends on the script, and is not part of the linear chain
+print("\nTest 6: Narration stage")
+narrated = scene.mark_done("narration")
+assert not narrated.is_stale("narration") and narrated.stale_stages() == []
+assert narrated.model_copy(update={"script": "New narration"}).is_stale("narration")
+assert not narrated.model_copy(update={"manim_code": "from manim import *\n"}).is_stale("narration")
+assert "audio_duration" not in Scene.model_json_schema()["properties"]
+
+print("\nAll tests passed!")
@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+from visual_explainer.state import AgentState, Scene
+from visual_explainer.state_store import StateStore
+
+thread_dir = tempfile.mkdtemp()
+agent_state = AgentState(
+    thread_id="test-thread",
+    topic="Pythagoras theorem",
+    scenes=[Scene(id=1, scene_plan="Plan 1", script="Script 1"), Scene(id=2, scene_plan="Plan 2", script="Script 2")],
+)
+
+# Test 1: Deltas are journaled and folded back through merge_scenes
+print("Test 1: Journal replay")
+store = StateStore(thread_dir, compact_every=100)
+store.reset(agent_state)
+store.append_scenes([Scene(id=2, scene_plan="Plan 2", script="Script 2", storyboard="Board 2")])
+store.append_meta(agent_state.model_copy(update={"final_video_path": "final.mp4"}))
+store.flush()
+
+loaded = StateStore(thread_dir).load()
+print(f"Loaded: {loaded}")
+assert loaded.thread_id == "test-thread" and loaded.topic == "Pythagoras theorem"
+assert loaded.final_video_path == "final.mp4"
+assert [scene.storyboard for scene in loaded.scenes] == ["", "Board 2"]
+
+# Test 2: A torn write at the end of the journal is dropped, the records before it survive
+print("\nTest 2: Torn journal tail")
+with open(store.journal_path, "a") as f:
+    f.write('{"op": "scenes", "scenes": [{"id": 1, "scene_pl')
+
+recovered_store = StateStore(thread_dir)
+loaded = recovered_store.load()
+assert [scene.storyboard for scene in loaded.scenes] == ["", "Board 2"]
+recovered_store.append_scenes([Scene(id=1, scene_plan="Plan 1", script="Script 1", storyboard="Board 1")])
+recovered_store.flush()
+assert [scene.storyboard for scene in StateStore(thread_dir).load().scenes] == ["Board 1", "Board 2"]
+
+# Test 3: Compaction folds the journal into the snapshot
+print("\nTest 3: Compaction")
+recovered_store.close()
+assert os.path.getsize(recovered_store.journal_path) == 0
+assert [scene.storyboard for scene in StateStore(thread_dir).load().scenes] == ["Board 1", "Board 2"]
+
+print("\nAll tests passed!")
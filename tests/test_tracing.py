@@ -0,0 +1,48 @@
+import contextvars
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from visual_explainer import tracing
+from visual_explainer.tracing import TraceSink, critical_path, span, trace_scope
+
+tracing.trace_sink = TraceSink(tempfile.mkdtemp())
+
+
+def render_scene(scene_id: int, seconds: float):
+    with trace_scope(scene_id=scene_id), span("scene"):
+        with span("llm.call", prompt_tokens=10, completion_tokens=5):
+            time.sleep(0.01)
+        with span("manim.execute"):
+            time.sleep(seconds)
+
+
+# Test 1: Spans are keyed by thread and scene, and nest across executor threads
+print("Test 1: Nesting and keys")
+with trace_scope(thread_id="trace-test"), span("rerun"):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, render_scene, i, 0.05 * (i + 1)) for i in range(2)]
+        [future.result() for future in futures]
+
+# Outside a run nothing is written
+with span("orphan"):
+    pass
+
+spans = tracing.trace_sink.load("trace-test")
+by_name = {}
+for record in spans:
+    by_name.setdefault(record["name"], []).append(record)
+
+assert len(spans) == 7
+assert "orphan" not in by_name
+rerun_id = by_name["rerun"][0]["span_id"]
+assert all(record["parent_id"] == rerun_id for record in by_name["scene"])
+assert {record["scene_id"] for record in by_name["manim.execute"]} == {0, 1}
+
+# Test 2: The critical path follows the slowest scene
+print("Test 2: Critical path")
+path = [(depth, record["name"], record["scene_id"]) for depth, record in critical_path(spans)]
+print(path)
+assert path == [(0, "rerun", None), (1, "scene", 1), (2, "llm.call", 1), (2, "manim.execute", 1)]
+
+print("\nAll tests passed!")
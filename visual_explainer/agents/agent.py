@@ -1,10 +1,33 @@
+import asyncio
 import json
+import os
+import threading
+import time
 from typing import Any, Callable, Dict, List, Optional, Union
 
 import instructor
-from groq import AsyncGroq, Groq
+from groq import AsyncGroq, BadRequestError, Groq
+from groq.resources.chat.completions import AsyncCompletions, Completions
 from pydantic import BaseModel
 
+from visual_explainer.tracing import span
+
+from .completion_cache import CompletionCache
+from .json_repair import repair_json
+from .rate_limiter import estimate_tokens, rate_limiter, usage_breakdown, usage_tokens
+
+# Ways to ask the model for structured output, best first. A model that rejects one moves down to the next
+RESPONSE_FORMAT_MODES = ["json_schema", "json_object", "off"]
+# A 400 mentioning one of these is about the structured-output request, anything else (context length, model, messages) is not
+FORMAT_ERROR_MARKERS = ("response_format", "json_schema", "json_object", "json_validate_failed")
+
+
+class StreamAborted(Exception):
+    """Raised from an `on_text` callback to stop a streamed completion early, e.g. once the output is unusable."""
+    def __init__(self, reason: str, partial: str = ""):
+        super().__init__(reason)
+        self.partial = partial
+
 
 class BaseAgent:
     def __init__(
@@ -17,6 +40,8 @@ class BaseAgent:
         tools_schemas: Optional[List[Dict[str, Any]]] = None, 
         output_schema: Optional[BaseModel] = None, 
         extractor_model: Optional[str] = "meta-llama/llama-4-scout-17b-16e-instruct",
+        cache: Optional[CompletionCache] = None,
+        response_format_mode: Optional[str] = None,
     ):
         assert isinstance(llm_client, Groq) or isinstance(llm_client, AsyncGroq), "You must provide an LLM client"
         assert isinstance(model, str), "The model must be a string"
@@ -38,11 +63,57 @@ class BaseAgent:
             self.output_extractor = instructor.from_groq(llm_client) # instructor handles async groq too
             
         self.extractor_model = extractor_model
+        # Opt-in completion cache, a hit skips both the chat call and the extractor
+        self.cache = cache
+
+        self.response_format_mode = response_format_mode or os.getenv("STRUCTURED_OUTPUT_MODE", "json_schema")
+        assert self.response_format_mode in RESPONSE_FORMAT_MODES, f"response_format_mode must be one of {RESPONSE_FORMAT_MODES}"
+        self._model_format_modes: Dict[str, str] = {}
+        # How each structured output was obtained: parsed as is (with or without a response_format),
+        # after local repair, or through the extractor LLM call
+        self.output_stats = {"native": 0, "plain": 0, "repaired": 0, "extractor": 0, "format_fallbacks": 0}
+        self._stats_lock = threading.Lock()
     
     def __repr__(self):
         return f"Agent(name={self.agent_name}, model={self.model})"
     
-    def _make_llm_call(self, messages):
+    def _count(self, path: str) -> None:
+        with self._stats_lock:
+            self.output_stats[path] += 1
+
+    def _format_mode(self, model: str) -> str:
+        # Groq doesn't combine tool calls with a response_format, agents with tools keep free-form output
+        if not self.output_schema or self.tool_schemas:
+            return "off"
+        return self._model_format_modes.get(model, self.response_format_mode)
+
+    def _response_format_params(self, messages, model: str) -> Dict[str, Any]:
+        mode = self._format_mode(model)
+        if mode == "off":
+            return {}
+
+        if mode == "json_schema":
+            schema = self.output_schema.model_json_schema()
+            return {"response_format": {"type": "json_schema", "json_schema": {"name": self.output_schema.__name__, "schema": schema}}}
+
+        # JSON mode only guarantees valid JSON, the keys have to be asked for in the prompt
+        return {"response_format": {"type": "json_object"}, "messages": list(messages) + [self._schema_message()]}
+
+    def _schema_message(self) -> Dict[str, str]:
+        return {"role": "system", "content": f"Respond with a single JSON object that follows this JSON schema:\n{json.dumps(self.output_schema.model_json_schema())}"}
+
+    @property
+    def _create(self) -> Callable:
+        """
+        The client's `chat.completions.create`. On the Groq SDK's own resource its raw-response variant, so the
+        rate limiter sees the rate-limit headers of every response, not only of the 429s.
+        """
+        completions = self.llm.chat.completions
+        if isinstance(completions, (Completions, AsyncCompletions)):
+            return completions.with_raw_response.create
+        return completions.create
+
+    def _llm_params(self, messages, **llm_params):
         params = {
             "messages": messages,
             "model": self.model,
@@ -50,10 +121,148 @@ class BaseAgent:
         if self.tool_schemas:
             params["tools"] = self.tool_schemas
             params["tool_choice"] = "auto"
-            
-        return self.llm.chat.completions.create(**params)
-    
-    def _extract_structured_output(self, content: Optional[str]):
+        params.update(self._response_format_params(messages, llm_params.get("model", self.model)))
+        # Per-call overrides, e.g. a different model or temperature for speculative candidates
+        params.update(llm_params)
+        return params
+
+    def _stream_params(self, messages, **llm_params):
+        params = self._llm_params(messages, **llm_params)
+        # Groq doesn't stream structured outputs, the schema goes into the prompt as in JSON mode
+        if params.pop("response_format", None) is not None and params["messages"] is messages:
+            params["messages"] = list(messages) + [self._schema_message()]
+        params["stream"] = True
+        return params
+
+    def _handle_format_error(self, error: BadRequestError, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The params to retry with after a 400 on a response_format request, the error is re-raised for any other 400.
+        A model that doesn't support the mode is moved down to the next one for good, while output that failed
+        Groq's JSON validation is asked for once more without a response_format (the local repair handles the rest).
+        """
+        error_text = f"{error} {json.dumps(error.body, default=str) if error.body is not None else ''}".lower()
+        if "response_format" not in params or not any(marker in error_text for marker in FORMAT_ERROR_MARKERS):
+            raise error
+
+        self._count("format_fallbacks")
+        model = params["model"]
+        if "json_validate_failed" in error_text:
+            print(f"[{self.agent_name}] {model} output failed JSON validation, retrying without a response_format")
+            retry_params = dict(params)
+            retry_params.pop("response_format")
+            return retry_params
+
+        mode = self._format_mode(model)
+        next_mode = RESPONSE_FORMAT_MODES[RESPONSE_FORMAT_MODES.index(mode) + 1]
+        print(f"[{self.agent_name}] {model} rejected response_format {mode}, falling back to {next_mode}")
+        self._model_format_modes[model] = next_mode
+
+        retry_params = {key: value for key, value in params.items() if key != "response_format"}
+        retry_params.update(self._response_format_params(params["messages"] if mode == "json_schema" else params["messages"][:-1], model))
+        return retry_params
+
+    def _make_llm_call(self, messages, **llm_params):
+        """The response, and whether it was asked for with a response_format (after any fallback)."""
+        params = self._llm_params(messages, **llm_params)
+        with span("llm.call", agent=self.agent_name, model=params["model"]) as current:
+            while True:
+                try:
+                    response = rate_limiter.call(
+                        params["model"], self._create, estimate_tokens(messages), **params
+                    )
+                    current.set(response_format="response_format" in params, **usage_breakdown(response))
+                    return response, "response_format" in params
+                except BadRequestError as e:
+                    params = self._handle_format_error(e, params)
+
+    async def _amake_llm_call(self, messages, **llm_params):
+        params = self._llm_params(messages, **llm_params)
+        with span("llm.call", agent=self.agent_name, model=params["model"]) as current:
+            while True:
+                try:
+                    response = await rate_limiter.acall(
+                        params["model"], self._create, estimate_tokens(messages), **params
+                    )
+                    current.set(response_format="response_format" in params, **usage_breakdown(response))
+                    return response, "response_format" in params
+                except BadRequestError as e:
+                    params = self._handle_format_error(e, params)
+
+    def _make_stream_call(self, messages, on_text: Callable[[str], None], **llm_params) -> tuple[str, int]:
+        """The streamed content, passed to `on_text` chunk by chunk, and its token count (0 when not reported)."""
+        params = self._stream_params(messages, **llm_params)
+        with span("llm.call", agent=self.agent_name, model=params["model"], stream=True) as current:
+            start = time.perf_counter()
+            content, x_groq = [], None
+            # The call counts as in flight, and its tokens are charged, once the stream is read or closed
+            with rate_limiter.stream(params["model"], self._create, estimate_tokens(messages), **params) as usage:
+                try:
+                    for chunk in usage.stream:
+                        # Groq reports the usage on the last chunk
+                        x_groq = getattr(chunk, "x_groq", None) or x_groq
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            if not content:
+                                current.set(first_token=time.perf_counter() - start)
+                            content.append(delta)
+                            on_text(delta)
+                except StreamAborted:
+                    current.set(aborted=True, streamed_chars=sum(len(delta) for delta in content))
+                    raise
+                finally:
+                    usage.stream.close()
+                    usage.completion_chars, usage.total_tokens = sum(len(delta) for delta in content), usage_tokens(x_groq)
+            current.set(**usage_breakdown(x_groq))
+            return "".join(content), usage_tokens(x_groq) or 0
+
+    async def _amake_stream_call(self, messages, on_text: Callable[[str], None], **llm_params) -> tuple[str, int]:
+        params = self._stream_params(messages, **llm_params)
+        with span("llm.call", agent=self.agent_name, model=params["model"], stream=True) as current:
+            start = time.perf_counter()
+            content, x_groq = [], None
+            async with rate_limiter.astream(params["model"], self._create, estimate_tokens(messages), **params) as usage:
+                try:
+                    async for chunk in usage.stream:
+                        x_groq = getattr(chunk, "x_groq", None) or x_groq
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            if not content:
+                                current.set(first_token=time.perf_counter() - start)
+                            content.append(delta)
+                            on_text(delta)
+                except StreamAborted:
+                    current.set(aborted=True, streamed_chars=sum(len(delta) for delta in content))
+                    raise
+                finally:
+                    await usage.stream.close()
+                    usage.completion_chars, usage.total_tokens = sum(len(delta) for delta in content), usage_tokens(x_groq)
+            current.set(**usage_breakdown(x_groq))
+            return "".join(content), usage_tokens(x_groq) or 0
+
+    def _parse_locally(self, content: str, native: bool = False):
+        """
+        The output schema from the content as is, or after local repair. None if only the extractor can help.
+        `native` tells whether the completion was requested with a response_format.
+        """
+        try:
+            parsed = self.output_schema.model_validate_json(content)
+            self._count("native" if native else "plain")
+            return parsed
+        except Exception:
+            pass
+
+        # Markdown fences, prose around the object, trailing commas, ...
+        repaired = repair_json(content)
+        if repaired is not None:
+            try:
+                parsed = self.output_schema.model_validate(repaired)
+                self._count("repaired")
+                return parsed
+            except Exception:
+                pass
+        return None
+
+    def _extract_structured_output(self, content: Optional[str], native: bool = False):
         if not self.output_schema:
             return content
             
@@ -62,17 +271,33 @@ class BaseAgent:
             # to see if it can generate the output from the conversation context (less likely)
             # or we just return an empty/default model if possible.
             # But usually, we expect content if tools are finished.
+            self._count("extractor")
             return self._run_extractor("No content provided by model.")
 
-        try:
-            return self.output_schema.model_validate_json(content)
-        except Exception:
-            return self._run_extractor(content)
+        parsed = self._parse_locally(content, native)
+        if parsed is not None:
+            return parsed
+        self._count("extractor")
+        return self._run_extractor(content)
 
-    def _run_extractor(self, content: str):
-        return self.output_extractor.chat.completions.create(   # type: ignore
-            response_model=self.output_schema,
-            messages=[
+    async def _aextract_structured_output(self, content: Optional[str], native: bool = False):
+        if not self.output_schema:
+            return content
+
+        if not content:
+            self._count("extractor")
+            return await self._arun_extractor("No content provided by model.")
+
+        parsed = self._parse_locally(content, native)
+        if parsed is not None:
+            return parsed
+        self._count("extractor")
+        return await self._arun_extractor(content)
+
+    def _extractor_params(self, content: str):
+        return {
+            "response_model": self.output_schema,
+            "messages": [
                 {
                     "role": "system",
                     "content": "Extract the following structured data from the provided text."
@@ -82,10 +307,27 @@ class BaseAgent:
                     "content": content
                 }
             ],
-            model=self.extractor_model,
-            strict=True,
-            
-        )
+            "model": self.extractor_model,
+            "strict": True,
+        }
+
+    def _run_extractor(self, content: str):
+        params = self._extractor_params(content)
+        with span("extractor.call", agent=self.agent_name, model=self.extractor_model) as current:
+            response = rate_limiter.call(   # type: ignore
+                self.extractor_model, self.output_extractor.chat.completions.create, estimate_tokens(params["messages"]), **params
+            )
+            current.set(**usage_breakdown(response))
+            return response
+
+    async def _arun_extractor(self, content: str):
+        params = self._extractor_params(content)
+        with span("extractor.call", agent=self.agent_name, model=self.extractor_model) as current:
+            response = await rate_limiter.acall(   # type: ignore
+                self.extractor_model, self.output_extractor.chat.completions.create, estimate_tokens(params["messages"]), **params
+            )
+            current.set(**usage_breakdown(response))
+            return response
     
     def _handle_tool_call(self, tool_calls):
         messages = []
@@ -94,31 +336,104 @@ class BaseAgent:
             function_args = json.loads(tool_call.function.arguments)
             
             if self.tools and function_name in self.tools:
+                with span("tool.call", agent=self.agent_name, tool=function_name) as current:
+                    try:
+                        function_response = self.tools[function_name](**function_args)
+                    except Exception as e:
+                        function_response = f"Error: {str(e)}"
+                        current.set(failed=True)
+                    
+                messages.append(self._tool_message(tool_call, function_name, function_response))
+        return messages
+
+    async def _ahandle_tool_call(self, tool_calls):
+        async def run_tool(tool_call):
+            function_name = tool_call.function.name
+            function_args = json.loads(tool_call.function.arguments)
+
+            if not (self.tools and function_name in self.tools):
+                return None
+
+            tool = self.tools[function_name]
+            with span("tool.call", agent=self.agent_name, tool=function_name) as current:
                 try:
-                    function_response = self.tools[function_name](**function_args)
+                    # Coroutine tools are awaited directly, blocking ones are pushed off the event loop
+                    if asyncio.iscoroutinefunction(tool):
+                        function_response = await tool(**function_args)
+                    else:
+                        function_response = await asyncio.to_thread(tool, **function_args)
                 except Exception as e:
                     function_response = f"Error: {str(e)}"
-                    
-                messages.append(
-                    {
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": function_name,
-                        "content": str(function_response),
-                    }
-                )
-        return messages
-    
-    def invoke(self, messages: List[Dict[str, str]]):
+                    current.set(failed=True)
+
+            return self._tool_message(tool_call, function_name, function_response)
+
+        tool_messages = await asyncio.gather(*(run_tool(tool_call) for tool_call in tool_calls))
+        return [message for message in tool_messages if message is not None]
+
+    @staticmethod
+    def _tool_message(tool_call, function_name: str, function_response: Any) -> Dict[str, str]:
+        return {
+            "tool_call_id": tool_call.id,
+            "role": "tool",
+            "name": function_name,
+            "content": str(function_response),
+        }
+
+    def _prepare_messages(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
         current_messages = messages.copy()
         
         # Check for system prompt, if it's not present, then we need to add it to the chain.
         if self.system_prompt:
              if not any(m.get("role") == "system" for m in current_messages):
                  current_messages.insert(0, {"role": "system", "content": self.system_prompt})
+        return current_messages
+    
+    def _cache_key(self, messages: List[Dict[str, str]], **llm_params) -> Optional[str]:
+        if self.cache is None:
+            return None
+        llm_params = dict(llm_params)
+        model = llm_params.pop("model", self.model)
+        return self.cache.make_key(model, self.system_prompt, messages, self.tool_schemas, self.output_schema, **llm_params)
+
+    def _cache_lookup(self, cache_key: Optional[str]):
+        if cache_key is None:
+            return None
+
+        payload = self.cache.get(cache_key)
+        if payload is None or not self.output_schema:
+            return payload
+
+        try:
+            return self.output_schema.model_validate_json(payload)
+        except Exception:
+            # Stale entry from an older schema, drop it and call the model instead
+            self.cache.discard(cache_key)
+            return None
+
+    def _cache_store(self, cache_key: Optional[str], response, elapsed: float, tokens: int) -> None:
+        if cache_key is None or response is None:
+            return
+        payload = response.model_dump_json() if isinstance(response, BaseModel) else str(response)
+        self.cache.put(cache_key, payload, elapsed=elapsed, tokens=tokens)
+    
+    def invoke(self, messages: List[Dict[str, str]], **llm_params):
+        if isinstance(self.llm, AsyncGroq):
+            raise TypeError(f"{self.agent_name} was created with an AsyncGroq client, use `await ainvoke(...)` instead")
+
+        current_messages = self._prepare_messages(messages)
+
+        cache_key = self._cache_key(current_messages, **llm_params)
+        cached_response = self._cache_lookup(cache_key)
+        if cached_response is not None:
+            messages.append({"role": "assistant", "content": str(cached_response)})
+            return cached_response
+
+        start, tokens = time.perf_counter(), 0
         
         while True:
-            response = self._make_llm_call(current_messages)
+            response, native = self._make_llm_call(current_messages, **llm_params)
+            tokens += usage_tokens(response) or 0
             response_message = response.choices[0].message
             
             current_messages.append(response_message)
@@ -128,10 +443,91 @@ class BaseAgent:
                 tool_messages = self._handle_tool_call(response_message.tool_calls)
                 current_messages.extend(tool_messages)
             else:
-                response = self._extract_structured_output(response_message.content)
+                response = self._extract_structured_output(response_message.content, native)
+                self._cache_store(cache_key, response, time.perf_counter() - start, tokens)
+                messages.append({"role": "assistant", "content": str(response)})
+                return response
+
+    async def ainvoke(self, messages: List[Dict[str, str]], **llm_params):
+        # A sync client still works here, it just runs the blocking loop on a worker thread
+        if not isinstance(self.llm, AsyncGroq):
+            return await asyncio.to_thread(BaseAgent.invoke, self, messages, **llm_params)
+
+        current_messages = self._prepare_messages(messages)
+
+        cache_key = self._cache_key(current_messages, **llm_params)
+        cached_response = self._cache_lookup(cache_key)
+        if cached_response is not None:
+            messages.append({"role": "assistant", "content": str(cached_response)})
+            return cached_response
+
+        start, tokens = time.perf_counter(), 0
+
+        while True:
+            response, native = await self._amake_llm_call(current_messages, **llm_params)
+            tokens += usage_tokens(response) or 0
+            response_message = response.choices[0].message
+
+            current_messages.append(response_message)
+
+            if response_message.tool_calls:
+                tool_messages = await self._ahandle_tool_call(response_message.tool_calls)
+                current_messages.extend(tool_messages)
+            else:
+                response = await self._aextract_structured_output(response_message.content, native)
+                self._cache_store(cache_key, response, time.perf_counter() - start, tokens)
                 messages.append({"role": "assistant", "content": str(response)})
                 return response
     
+    def invoke_stream(self, messages: List[Dict[str, str]], on_text: Callable[[str], None], **llm_params):
+        """
+        `invoke` with a streamed completion: `on_text` gets the text as it is generated, so a caller can act on
+        a partial answer (see `JsonArrayStream`) or raise `StreamAborted` to stop a generation it can't use.
+        A cached answer is passed to `on_text` in one piece. Only for agents without tools.
+        """
+        if isinstance(self.llm, AsyncGroq):
+            raise TypeError(f"{self.agent_name} was created with an AsyncGroq client, use `await ainvoke_stream(...)` instead")
+        assert not self.tool_schemas, "Streamed completions don't support tool calls"
+
+        current_messages = self._prepare_messages(messages)
+
+        cache_key = self._cache_key(current_messages, **llm_params)
+        cached_response = self._cache_lookup(cache_key)
+        if cached_response is not None:
+            on_text(cached_response.model_dump_json() if isinstance(cached_response, BaseModel) else str(cached_response))
+            messages.append({"role": "assistant", "content": str(cached_response)})
+            return cached_response
+
+        start = time.perf_counter()
+        content, tokens = self._make_stream_call(current_messages, on_text, **llm_params)
+        # Streamed completions are asked for without a response_format
+        response = self._extract_structured_output(content)
+        self._cache_store(cache_key, response, time.perf_counter() - start, tokens)
+        messages.append({"role": "assistant", "content": str(response)})
+        return response
+
+    async def ainvoke_stream(self, messages: List[Dict[str, str]], on_text: Callable[[str], None], **llm_params):
+        # With a sync client `on_text` is called from a worker thread
+        if not isinstance(self.llm, AsyncGroq):
+            return await asyncio.to_thread(BaseAgent.invoke_stream, self, messages, on_text, **llm_params)
+        assert not self.tool_schemas, "Streamed completions don't support tool calls"
+
+        current_messages = self._prepare_messages(messages)
+
+        cache_key = self._cache_key(current_messages, **llm_params)
+        cached_response = self._cache_lookup(cache_key)
+        if cached_response is not None:
+            on_text(cached_response.model_dump_json() if isinstance(cached_response, BaseModel) else str(cached_response))
+            messages.append({"role": "assistant", "content": str(cached_response)})
+            return cached_response
+
+        start = time.perf_counter()
+        content, tokens = await self._amake_stream_call(current_messages, on_text, **llm_params)
+        response = await self._aextract_structured_output(content)
+        self._cache_store(cache_key, response, time.perf_counter() - start, tokens)
+        messages.append({"role": "assistant", "content": str(response)})
+        return response
+
 
 if __name__ == "__main__":
     import os
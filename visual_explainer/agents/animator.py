@@ -1,16 +1,32 @@
+import asyncio
+import contextvars
+import json
 import os
-from typing import Dict, List, Optional, Union
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Union
 
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 
-from visual_explainer.tools.manim_execute import execute_manim_code
+from visual_explainer.tools.manim_execute import clear_scene_work_dir, execute_manim_code, reuse_cached_render, scene_work_dir
+from visual_explainer.tools.manim_validate import LAYOUT_CHECK, LAYOUT_RETRIES, validate_manim_code
+from visual_explainer.tools.render_pool import CANCELLED_MESSAGE, RenderPool
+from visual_explainer.tools.render_scheduler import RenderScheduler
+from visual_explainer.tracing import span
 
-from .agent import BaseAgent
+from .agent import BaseAgent, StreamAborted
+from .json_stream import JsonStringStream, unparseable_prefix
 from .prompts.animator import ANIMATOR_PROMPT
+from .rate_limiter import estimate_tokens
+from .repair_context import RepairContext
 
 load_dotenv()
 
+# Spread of the speculative candidates, cycled through when K is larger
+SPECULATIVE_TEMPERATURES = [0.2, 0.6, 1.0]
+
 """
 PLANNED TOOLS FOR THIS AGENT:
 - First iteration:
@@ -26,108 +42,396 @@ class AnimatorOutput(BaseModel):
     video_path: str = Field(default="", description="Path to which you need to store the video for this scene. IF YOU ARE AN AI AGENT, DO NOT UPDATE THIS FIELD")
 
 class Animator(BaseAgent):
-    def __init__(self, llm_client):
+    def __init__(self, llm_client, render_pool: Optional[RenderPool] = None, max_renders: Optional[int] = None, renderer: Optional[RenderScheduler] = None, stream: bool = False):
+        # No completion cache: generated code is only worth replaying once it renders
         super().__init__(
             llm_client=llm_client,
             model=os.getenv("ANIMATOR_LLM", ""),
             system_prompt=ANIMATOR_PROMPT,
+            agent_name="Animator",
             tools_registry={},
             tools_schemas=[],
             output_schema=AnimatorOutput
         )
+        self.render_pool = render_pool
+        # With a scheduler, renders are queued by priority and run within their share of cores and memory
+        self.renderer = renderer
+        # Caps the validations + renders running at once, shared by every scene (and thread) using this Animator
+        self.render_slots = threading.BoundedSemaphore(max_renders) if max_renders else None
+        self.speculation_reports: List[Dict[str, float]] = []
+        # Streamed generations are checked as they arrive, and stopped once the code can't parse anymore
+        self.stream = stream
+
+    def _acquire_render_slot(self, cancel_event: Optional[threading.Event]) -> bool:
+        if self.render_slots is None:
+            return True
+        with span("render.wait"):
+            while not self.render_slots.acquire(timeout=0.25):
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+        return True
+
+    def render(
+        self,
+        manim_code: str,
+        scene_id: int,
+        video_path: Optional[Union[str, os.PathLike]],
+        cancel_event: Optional[threading.Event] = None,
+        last_attempt: bool = False,
+        repair_context: Optional[RepairContext] = None,
+    ) -> tuple[bool, str]:
+        """
+        Validate the code cheaply first, only code that passes every check is sent to the full render.
+        On the `last_attempt`, or once the scene's `repair_context` has spent LAYOUT_RETRIES attempts on layout
+        violations, they don't block the render anymore: a cramped scene beats a missing one.
+        Code whose render is cached is neither validated nor rendered, its video is placed right away.
+        """
+        if video_path is not None and reuse_cached_render(manim_code, scene_id, video_path):
+            return True, video_path
+        if not self._acquire_render_slot(cancel_event):
+            return False, CANCELLED_MESSAGE
+        try:
+            # The dry run goes to a warm render worker when there is one, it needs the same manim import
+            pool = self.renderer.pool if self.renderer is not None else self.render_pool
+            layout_retries_left = repair_context is None or repair_context.layout_failures < LAYOUT_RETRIES
+            enforce_layout = LAYOUT_CHECK and not last_attempt and layout_retries_left
+            execution_bool, status_str = validate_manim_code(manim_code, scene_id=scene_id, enforce_layout=enforce_layout, pool=pool)
+            if not execution_bool:
+                return execution_bool, status_str
+            if cancel_event is not None and cancel_event.is_set():
+                return False, CANCELLED_MESSAGE
+            if self.renderer is not None:
+                return self.renderer.render(manim_code, scene_id, video_path, cancel_event=cancel_event)
+            return execute_manim_code(manim_code, scene_id=scene_id, video_path=video_path, pool=self.render_pool, cancel_event=cancel_event)
+        finally:
+            if self.render_slots is not None:
+                self.render_slots.release()
+
+    @staticmethod
+    def _code_check() -> Callable[[str], None]:
+        """`on_text` of a streamed attempt, checks the code every time a line of it is complete."""
+        code_stream = JsonStringStream("manim_code")
+        checked_lines = [0]
+
+        def on_text(text: str) -> None:
+            code = code_stream.feed(text)
+            if code.count("\n") > checked_lines[0]:
+                checked_lines[0] = code.count("\n")
+                error = unparseable_prefix(code)
+                if error:
+                    raise StreamAborted(error, partial=code)
+        return on_text
+
+    def _generate(self, messages: List[Dict[str, str]], **llm_params) -> tuple[AnimatorOutput, Optional[str]]:
+        """The generated code, and the syntax error it was stopped for (None when it was generated in full)."""
+        if not self.stream:
+            return BaseAgent.invoke(self, messages, **llm_params), None
+        try:
+            return BaseAgent.invoke_stream(self, messages, self._code_check(), **llm_params), None
+        except StreamAborted as e:
+            return AnimatorOutput(manim_code=e.partial), f"Error:\n{e}"
+
+    async def _agenerate(self, messages: List[Dict[str, str]], **llm_params) -> tuple[AnimatorOutput, Optional[str]]:
+        if not self.stream:
+            return await BaseAgent.ainvoke(self, messages, **llm_params), None
+        try:
+            return await BaseAgent.ainvoke_stream(self, messages, self._code_check(), **llm_params), None
+        except StreamAborted as e:
+            return AnimatorOutput(manim_code=e.partial), f"Error:\n{e}"
 
-    def invoke(self, messages: List[Dict[str, str]], scene_id: int, video_path: Optional[Union[str, os.PathLike]], n_retries: int = 3, ):
+    def _log_attempt(self, scene_id: int, retry: int, n_retries: int, attempt_messages: List[Dict[str, str]]) -> None:
+        prompt_tokens = estimate_tokens([{"role": "system", "content": self.system_prompt}] + attempt_messages)
+        print(f"[Scene {scene_id}] Attempt {retry + 1}/{n_retries}: ~{prompt_tokens} prompt tokens")
+
+    def generate(self, repair_context: RepairContext, scene_id: int, retry: int = 0, n_retries: int = 1) -> tuple[AnimatorOutput, Optional[str]]:
+        """One attempt's code from the repair context, without rendering it (the Director renders on its own pool)."""
+        attempt_messages = repair_context.messages()
+        self._log_attempt(scene_id, retry, n_retries, attempt_messages)
+        code_dict, aborted = self._generate(attempt_messages)
+        if aborted:
+            print(f"[Scene {scene_id}] Attempt {retry + 1}/{n_retries} stopped mid-generation, the code can't parse")
+        return code_dict, aborted
+
+    def invoke(self, messages: List[Dict[str, str]], scene_id: int, video_path: Optional[Union[str, os.PathLike]], n_retries: int = 3, repair_context: Optional[RepairContext] = None):
+        # Each retry only carries the latest candidate and its condensed error, not the whole history
+        repair_context = repair_context or RepairContext(messages)
             
         for retry in range(n_retries):            
-            # Code generation
-            code_dict: AnimatorOutput = super().invoke(messages)
+            with span("animator.attempt", attempt=retry + 1, repair=repair_context.latest_code is not None) as attempt:
+                # Code generation
+                code_dict, aborted = self.generate(repair_context, scene_id, retry, n_retries)
 
-            # Try to execute the extract manim script
-            execution_bool, status_str = execute_manim_code(code_dict.manim_code, scene_id=scene_id, video_path=video_path)
+                # Try to execute the extract manim script
+                if aborted:
+                    execution_bool, status_str = False, aborted
+                else:
+                    execution_bool, status_str = self.render(code_dict.manim_code, scene_id, video_path, last_attempt=retry == n_retries - 1, repair_context=repair_context)
+                attempt.set(success=execution_bool, aborted=aborted is not None)
             
             if execution_bool:
                 code_dict.video_path = status_str
                 return code_dict
             else:
                 print(f"[Scene {scene_id}] Attempt {retry + 1}/{n_retries} failed.")
-                
-                messages.extend([
-                    {"role": "assistant", "content": json.dumps(code_dict.model_dump())},
-                    {"role": "user", "content": f"The code you generated failed to execute with this error:\n\n{status_str}"}
-                ])
+                repair_context.record_failure(code_dict.manim_code, status_str)
 
         print(f"Animator failed after {n_retries} attempts, returning last output")
         return code_dict
 
-if __name__ == "__main__":
-    import json
-    import time
+    async def ainvoke(self, messages: List[Dict[str, str]], scene_id: int, video_path: Optional[Union[str, os.PathLike]], n_retries: int = 3, repair_context: Optional[RepairContext] = None):
+        repair_context = repair_context or RepairContext(messages)
 
-    from dotenv import load_dotenv
-    from groq import Groq
+        for retry in range(n_retries):
+            with span("animator.attempt", attempt=retry + 1, repair=repair_context.latest_code is not None) as attempt:
+                attempt_messages = repair_context.messages()
+                self._log_attempt(scene_id, retry, n_retries, attempt_messages)
+                code_dict, aborted = await self._agenerate(attempt_messages)
+
+                if aborted:
+                    print(f"[Scene {scene_id}] Attempt {retry + 1}/{n_retries} stopped mid-generation, the code can't parse")
+                    execution_bool, status_str = False, aborted
+                else:
+                    # Rendering is a blocking subprocess, keep it off the event loop
+                    execution_bool, status_str = await asyncio.to_thread(self.render, code_dict.manim_code, scene_id, video_path, None, retry == n_retries - 1, repair_context)
+                attempt.set(success=execution_bool, aborted=aborted is not None)
+
+            if execution_bool:
+                code_dict.video_path = status_str
+                return code_dict
+            else:
+                print(f"[Scene {scene_id}] Attempt {retry + 1}/{n_retries} failed.")
+                repair_context.record_failure(code_dict.manim_code, status_str)
+
+        print(f"Animator failed after {n_retries} attempts, returning last output")
+        return code_dict
+
+    @staticmethod
+    def _candidate_result(index: int, code_dict: Optional[AnimatorOutput], execution_bool: bool, status_str: str, candidate_path: str, start: float) -> Dict:
+        return {
+            "index": index,
+            "code_dict": code_dict,
+            "success": execution_bool,
+            "status": status_str,
+            "path": candidate_path,
+            "duration": time.perf_counter() - start,
+        }
+
+    def _run_candidate(self, messages: List[Dict[str, str]], scene_id: int, index: int, candidate_path: str, cancel_event: threading.Event, llm_params: Dict) -> Dict:
+        start = time.perf_counter()
+        if cancel_event.is_set():
+            return self._candidate_result(index, None, False, CANCELLED_MESSAGE, candidate_path, start)
+
+        with span("animator.candidate", candidate=index, **llm_params) as candidate:
+            # A copy, the base invoke appends its answer to the messages it was given
+            code_dict, aborted = self._generate(list(messages), **llm_params)
+            if aborted:
+                candidate.set(success=False, aborted=True)
+                return self._candidate_result(index, code_dict, False, aborted, candidate_path, start)
+            if cancel_event.is_set():
+                candidate.set(success=False, cancelled=True)
+                return self._candidate_result(index, code_dict, False, CANCELLED_MESSAGE, candidate_path, start)
+
+            execution_bool, status_str = self.render(code_dict.manim_code, scene_id, candidate_path, cancel_event)
+            candidate.set(success=execution_bool, cancelled=status_str == CANCELLED_MESSAGE)
+        return self._candidate_result(index, code_dict, execution_bool, status_str, candidate_path, start)
+
+    async def _arun_candidate(self, messages: List[Dict[str, str]], scene_id: int, index: int, candidate_path: str, cancel_event: threading.Event, llm_params: Dict) -> Dict:
+        start = time.perf_counter()
+        with span("animator.candidate", candidate=index, **llm_params) as candidate:
+            code_dict, aborted = await self._agenerate(list(messages), **llm_params)
+            if aborted:
+                candidate.set(success=False, aborted=True)
+                return self._candidate_result(index, code_dict, False, aborted, candidate_path, start)
+            if cancel_event.is_set():
+                candidate.set(success=False, cancelled=True)
+                return self._candidate_result(index, code_dict, False, CANCELLED_MESSAGE, candidate_path, start)
 
-    from visual_explainer.state import AgentState, merge_scenes
-
-    from .planner import Planner, PlannerOutput
-    from .storyboarder import Storyboarder, StoryboarderOutput
-    load_dotenv()
-
-    def save_state(agent_state: AgentState, output_dir: str, checkpoint_name: str) -> None:
-        """Save the current state to a checkpoint file."""
-        os.makedirs(output_dir, exist_ok=True)
-        checkpoint_path = os.path.join(output_dir, f"{checkpoint_name}.json")
-        with open(checkpoint_path, "w") as f:
-            json.dump([scene.model_dump() for scene in agent_state.scenes], f, indent=4)
-        print(f"State saved: {checkpoint_path}")
-
-    client = Groq()
-    planner = Planner(client)
-    storyboarder = Storyboarder(client)
-    animator = Animator(client)
-
-    planner_output: PlannerOutput = planner.invoke([
-        {"role": "user", "content": "Explain the concept of 'Pythagoras theorem'"}
-    ])
-    print("Planner has generated the script")
-
-    agent_state = AgentState(thread_id="test-thread", topic="Pythagoras theorem", scenes=planner_output.scenes)
-    VIDEO_OUTPUT_DIR = os.path.join(os.path.abspath(os.path.curdir), "outputs", "videos", agent_state.thread_id)
-
-    save_state(agent_state, VIDEO_OUTPUT_DIR, "state")
-
-    for scene in agent_state.scenes:
-        # ===============================
-        #       Storyboarder step
-        # ===============================
-        print(f"Starting storyboarding for scene {scene.id}")
-        scene_input = [
-            {"role": "user", "content": f"Storyboard this scene: {json.dumps(scene.model_dump())}"}
+            render = asyncio.ensure_future(asyncio.to_thread(self.render, code_dict.manim_code, scene_id, candidate_path, cancel_event))
+            try:
+                execution_bool, status_str = await asyncio.shield(render)
+            except asyncio.CancelledError:
+                # The render thread runs on until it sees `cancel_event`, it has to stop before its files are removed
+                await asyncio.gather(render, return_exceptions=True)
+                raise
+            candidate.set(success=execution_bool, cancelled=status_str == CANCELLED_MESSAGE)
+        return self._candidate_result(index, code_dict, execution_bool, status_str, candidate_path, start)
+
+    @staticmethod
+    def _discard_candidate(candidate_path: str) -> None:
+        """Done callback of a candidate still running when another one won, removes what it leaves behind."""
+        if os.path.exists(candidate_path):
+            os.remove(candidate_path)
+        clear_scene_work_dir(candidate_path)
+
+    def _candidates(self, video_path: Union[str, os.PathLike], k: int, temperatures: Optional[List[float]], models: Optional[List[str]]) -> List[tuple[str, Dict]]:
+        """(video path, llm params) of each candidate, spread over the temperatures and models."""
+        temperatures = temperatures or SPECULATIVE_TEMPERATURES
+        models = models or [self.model]
+        base_path, extension = os.path.splitext(str(video_path))
+        return [
+            (f"{base_path}_candidate{i}{extension}", {"temperature": temperatures[i % len(temperatures)], "model": models[i % len(models)]})
+            for i in range(k)
         ]
-        storyboarder_output: StoryboarderOutput = storyboarder.invoke(scene_input)
-        updated_scene = scene.model_copy(update={
-            "storyboard": storyboarder_output.storyboard,
-            "animation_instructions": storyboarder_output.animation_instruction
-        })
-
-        agent_state.scenes = merge_scenes(agent_state.scenes, [updated_scene])        
-        save_state(agent_state, VIDEO_OUTPUT_DIR, "state")
-
-        # ===============================
-        #         Animator step
-        # ===============================
-        print(f"Starting animation for scene {scene.id}. Sleeping for 15 seconds first")
-        time.sleep(15)
-        
-        scene_input = [
-            {"role": "user", "content": f"Write manim code for this scene: {json.dumps(scene.model_dump())}"}
+
+    def _settle_speculation(
+        self,
+        messages: List[Dict[str, str]],
+        scene_id: int,
+        video_path: Union[str, os.PathLike],
+        k: int,
+        results: List[Dict],
+        wall_time: float,
+        pending: Optional[List[int]] = None,
+    ) -> tuple[Optional[AnimatorOutput], RepairContext]:
+        """
+        Keep the winning video and report the saved latency. Without a winner, returns None and
+        the repair context to continue sequentially from, seeded with the first real failure.
+        `pending` are the indices of the candidates still running when the winner was picked.
+        """
+        winner = next((result for result in results if result["success"]), None)
+
+        failures = [result for result in results if result["code_dict"] is not None and not result["success"] and result["status"] != CANCELLED_MESSAGE]
+        repair_context = RepairContext(messages)
+        if winner is None and failures:
+            # The sequential repair of this failure renders in the scene's work dir, with the failure's partial movies
+            clear_scene_work_dir(video_path)
+            if os.path.isdir(scene_work_dir(failures[0]["path"])):
+                os.replace(scene_work_dir(failures[0]["path"]), scene_work_dir(video_path))
+
+        # Only finished candidate videos and the work dirs of the other candidates are left over
+        for result in results:
+            if result is not winner and os.path.exists(result["path"]):
+                os.remove(result["path"])
+            clear_scene_work_dir(result["path"])
+
+        if winner is None:
+            print(f"[Scene {scene_id}] All {k} speculative candidates failed, falling back to sequential repairs")
+            if failures:
+                repair_context.record_failure(failures[0]["code_dict"].manim_code, failures[0]["status"])
+            return None, repair_context
+
+        os.replace(winner["path"], video_path)
+        winner["code_dict"].video_path = str(video_path)
+
+        # The retry loop would have tried the candidates in order and paid for each one before the winner.
+        # A cancelled candidate only counts for the time it ran, and one still running for the time so far,
+        # so this is a lower bound
+        sequential_time = sum(result["duration"] for result in results if result["index"] <= winner["index"])
+        sequential_time += wall_time * sum(1 for index in pending or [] if index < winner["index"])
+        report = {
+            "scene_id": scene_id,
+            "k": k,
+            "failed_candidates": len(failures),
+            "wall_time": wall_time,
+            "sequential_estimate": sequential_time,
+            "saved_seconds": sequential_time - wall_time,
+        }
+        self.speculation_reports.append(report)
+        print(
+            f"[Scene {scene_id}] Speculative K={k}: first success after {wall_time:.1f}s, "
+            f"sequential retries would take ~{sequential_time:.1f}s (saved {report['saved_seconds']:.1f}s)"
+        )
+        return winner["code_dict"], repair_context
+
+    def invoke_speculative(
+        self,
+        messages: List[Dict[str, str]],
+        scene_id: int,
+        video_path: Union[str, os.PathLike],
+        k: int = 3,
+        temperatures: Optional[List[float]] = None,
+        models: Optional[List[str]] = None,
+        n_retries: int = 3,
+    ):
+        """
+        Generate `k` candidate scripts in parallel (spread over `temperatures` and `models`) and render them
+        concurrently, the first one that renders wins and the other renders are cancelled.
+        If every candidate fails, the usual repair loop takes over from the first failure.
+        """
+        if k <= 1:
+            return self.invoke(messages, scene_id, video_path, n_retries=n_retries)
+
+        cancel_event = threading.Event()
+        results: List[Dict] = []
+        start = time.perf_counter()
+        candidates = self._candidates(video_path, k, temperatures, models)
+        executor = ThreadPoolExecutor(max_workers=k)
+        futures = [
+            # Each candidate thread gets a copy of the caller's context, so its spans stay under this scene
+            executor.submit(contextvars.copy_context().run, self._run_candidate, messages, scene_id, i, candidate_path, cancel_event, llm_params)
+            for i, (candidate_path, llm_params) in enumerate(candidates)
         ]
-        animator_output: AnimatorOutput = animator.invoke(scene_input, scene.id, os.path.join(VIDEO_OUTPUT_DIR, f"scene_{scene.id}.mp4"))
-        updated_scene = scene.model_copy(update={
-            "manim_code": animator_output.manim_code
-        })
-
-        agent_state.scenes = merge_scenes(agent_state.scenes, [updated_scene])        
-        save_state(agent_state, VIDEO_OUTPUT_DIR, "state")
-    
-    # Final state save
-    save_state(agent_state, VIDEO_OUTPUT_DIR, "state")
\ No newline at end of file
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"[Scene {scene_id}] Speculative candidate failed: {e}")
+                continue
+            if results[-1]["success"]:
+                cancel_event.set()
+                break
+        wall_time = time.perf_counter() - start
+
+        # The first success wins now, the losers stop at their next cancellation check and are cleaned up once done
+        finished = {result["index"] for result in results}
+        pending = [i for i in range(k) if i not in finished]
+        for i in pending:
+            futures[i].add_done_callback(lambda _, candidate_path=candidates[i][0]: self._discard_candidate(candidate_path))
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        code_dict, repair_context = self._settle_speculation(messages, scene_id, video_path, k, results, wall_time, pending)
+        if code_dict is None:
+            return self.invoke(messages, scene_id, video_path, n_retries=n_retries, repair_context=repair_context)
+        return code_dict
+
+    async def ainvoke_speculative(
+        self,
+        messages: List[Dict[str, str]],
+        scene_id: int,
+        video_path: Union[str, os.PathLike],
+        k: int = 3,
+        temperatures: Optional[List[float]] = None,
+        models: Optional[List[str]] = None,
+        n_retries: int = 3,
+    ):
+        if k <= 1:
+            return await self.ainvoke(messages, scene_id, video_path, n_retries=n_retries)
+
+        cancel_event = threading.Event()
+        results: List[Dict] = []
+        start = time.perf_counter()
+        candidates = self._candidates(video_path, k, temperatures, models)
+        tasks = [
+            asyncio.ensure_future(self._arun_candidate(messages, scene_id, i, candidate_path, cancel_event, llm_params))
+            for i, (candidate_path, llm_params) in enumerate(candidates)
+        ]
+        for task in asyncio.as_completed(tasks):
+            try:
+                results.append(await task)
+            except Exception as e:
+                print(f"[Scene {scene_id}] Speculative candidate failed: {e}")
+                continue
+            if results[-1]["success"]:
+                cancel_event.set()
+                break
+        wall_time = time.perf_counter() - start
+
+        # The first success wins now, the losers' LLM calls are cancelled and their files removed once they stop
+        finished = {result["index"] for result in results}
+        pending = [i for i in range(k) if i not in finished]
+        for i in pending:
+            tasks[i].add_done_callback(lambda _, candidate_path=candidates[i][0]: self._discard_candidate(candidate_path))
+            tasks[i].cancel()
+
+        code_dict, repair_context = self._settle_speculation(messages, scene_id, video_path, k, results, wall_time, pending)
+        if code_dict is None:
+            return await self.ainvoke(messages, scene_id, video_path, n_retries=n_retries, repair_context=repair_context)
+        return code_dict
+
+if __name__ == "__main__":
+    from groq import Groq
+
+    from visual_explainer.pipeline import Pipeline
+
+    # The scenes are storyboarded and animated concurrently by the pipeline runner
+    Pipeline(Groq()).run("Pythagoras theorem", thread_id="test-thread")
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+COMPLETION_CACHE_DIR = os.path.join(os.path.abspath(os.path.curdir), "outputs", "cache", "completions")
+
+
+def _to_jsonable(obj: Any) -> Any:
+    # Messages can hold Groq message objects next to plain dicts
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(exclude_none=True)
+    return str(obj)
+
+
+class CompletionCache:
+    """
+    Content-addressed, on-disk store of final agent outputs.
+    Entries expire after `ttl_seconds` and the least recently used ones are evicted once the
+    store grows past `max_bytes`. Hit/miss/eviction counters live in `stats`.
+    """
+    def __init__(
+        self,
+        cache_dir: Union[str, os.PathLike] = COMPLETION_CACHE_DIR,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "saved_seconds": 0.0, "saved_tokens": 0}
+
+        self._lock = threading.Lock()
+        # key -> (size in bytes, last access time), rebuilt from the files on disk
+        self._index: Dict[str, tuple] = {}
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".json"):
+                file_stat = os.stat(os.path.join(self.cache_dir, file_name))
+                self._index[file_name[:-len(".json")]] = (file_stat.st_size, file_stat.st_mtime)
+
+    def __repr__(self):
+        return f"CompletionCache(entries={len(self._index)}, size={self.size_bytes}, stats={self.stats})"
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(size for size, _ in self._index.values())
+
+    @staticmethod
+    def make_key(
+        model: str,
+        system_prompt: str,
+        messages: List[Any],
+        tool_schemas: Optional[List[Dict[str, Any]]],
+        output_schema: Optional[type],
+        **llm_params: Any,
+    ) -> str:
+        key_material = {
+            "model": model,
+            "system_prompt": system_prompt,
+            "messages": messages,
+            "tool_schemas": tool_schemas or [],
+            "output_schema": output_schema.model_json_schema() if output_schema else None,
+            "llm_params": llm_params,
+        }
+        serialized = json.dumps(key_material, sort_keys=True, default=_to_jsonable)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached payload, or None on a miss (expired entries count as misses)."""
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.stats["misses"] += 1
+                self._index.pop(key, None)
+            return None
+
+        now = time.time()
+        if self.ttl_seconds is not None and now - entry.get("created", 0) > self.ttl_seconds:
+            self.discard(key)
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        # The file's mtime doubles as its last access time for the LRU order
+        os.utime(path, (now, now))
+        with self._lock:
+            self.stats["hits"] += 1
+            self.stats["saved_seconds"] += entry.get("elapsed", 0.0)
+            self.stats["saved_tokens"] += entry.get("tokens", 0)
+            self._index[key] = (self._index.get(key, (0, now))[0], now)
+        return entry["payload"]
+
+    def put(self, key: str, payload: str, elapsed: float = 0.0, tokens: int = 0) -> None:
+        entry = json.dumps({"created": time.time(), "elapsed": elapsed, "tokens": tokens, "payload": payload})
+
+        # Write then rename, so concurrent readers never see a half written entry
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(entry)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._index[key] = (len(entry.encode("utf-8")), time.time())
+        self._evict()
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._index.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        with self._lock:
+            total = sum(size for size, _ in self._index.values())
+            if total <= self.max_bytes:
+                return
+            lru_order = sorted(self._index.items(), key=lambda item: item[1][1])
+
+        for key, (size, _) in lru_order:
+            if total <= self.max_bytes:
+                break
+            self.discard(key)
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
@@ -1,3 +1,558 @@
+import contextvars
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from visual_explainer.state import AgentState, Scene, merge_scenes
+from visual_explainer.state_store import StateStore
+from visual_explainer.tools.render_pool import CANCELLED_MESSAGE
+from visual_explainer.tools.render_timeout import DEFAULT_DURATION, estimate_scene, render_speed
+from visual_explainer.tracing import span, trace_scope
+
+from .repair_context import RepairContext
+
+# Task states; a task is finished once it is done, failed, cancelled or skipped
+PENDING, RUNNING, DONE, FAILED, CANCELLED, SKIPPED = "pending", "running", "done", "failed", "cancelled", "skipped"
+FINISHED = {DONE, FAILED, CANCELLED, SKIPPED}
+
+# Executor pool of each stage, LLM calls and renders never wait on each other's workers
+STAGE_POOLS = {"plan": "llm", "storyboard": "llm", "animate": "llm", "render": "render", "assemble": "render", "narrate": "audio"}
+
+# Span of a task run where the Pipeline has one by another name, so traces and the benchmark read the same
+TASK_SPANS = {"plan": "plan", "animate": "animator.attempt", "narrate": "stage.narration"}
+
+# Seconds a stage takes until one has been measured, only their proportions matter for the priorities
+DEFAULT_STAGE_SECONDS = {"plan": 20.0, "storyboard": 10.0, "animate": 20.0, "render": 30.0, "assemble": 5.0, "narrate": 3.0}
+# The plan task adds every other task of its video when it finishes, until then it stands for the whole path
+VIDEO_PATH = ("plan", "storyboard", "animate", "render", "assemble")
+
+
+class RetryFrom(Exception):
+    """Raised by a task to run an upstream task again (and everything after it), e.g. a failed render asks for new code."""
+    def __init__(self, task_id: str, reason: str):
+        super().__init__(reason)
+        self.task_id = task_id
+
+
+class Task:
+    def __init__(
+        self,
+        task_id: str,
+        stage: str,
+        fn: Callable[["Task"], Any],
+        deps: Iterable[str] = (),
+        job: str = "",
+        scene_id: Optional[int] = None,
+        max_attempts: int = 1,
+        allow_failed_deps: bool = False,
+        estimate: Optional[float] = None,
+        context: Optional[contextvars.Context] = None,
+    ):
+        self.task_id = task_id
+        self.stage = stage
+        self.pool = STAGE_POOLS.get(stage, "llm")
+        self.fn = fn
+        self.deps = list(deps)
+        self.dependents: List[str] = []
+        self.job = job
+        self.scene_id = scene_id
+        self.max_attempts = max_attempts
+        # A sink like `assemble` runs once its dependencies finished, whether or not they succeeded
+        self.allow_failed_deps = allow_failed_deps
+        # Expected seconds, None falls back to the measured time of the stage
+        self.estimate = estimate
+
+        self.status = PENDING
+        self.attempts = 0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+        # The trace the task belongs to (by default the one it was created in), whichever worker runs it
+        self.context = context.copy() if context is not None else contextvars.copy_context()
+
+    def __repr__(self):
+        return f"Task({self.task_id}, status={self.status}, attempts={self.attempts})"
+
+    def snapshot(self) -> Dict[str, Any]:
+        end = self.finished_at or time.perf_counter()
+        return {
+            "task": self.task_id,
+            "job": self.job,
+            "stage": self.stage,
+            "scene_id": self.scene_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "elapsed": end - self.started_at if self.started_at else 0.0,
+            "error": self.error[-200:] if self.error else None,
+        }
+
+
+class StageTimes:
+    """Exponential moving average of how long each stage takes, the edge weights of the critical path."""
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.seconds: Dict[str, float] = dict(DEFAULT_STAGE_SECONDS)
+        self.counts: Dict[str, int] = {}
+
+    def get(self, stage: str) -> float:
+        return self.seconds.get(stage, DEFAULT_DURATION)
+
+    def path(self, stages) -> float:
+        return sum(self.get(stage) for stage in stages)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        # The first measurement replaces the default outright
+        previous = self.seconds.get(stage) if self.counts.get(stage) else None
+        self.seconds[stage] = seconds if previous is None else self.alpha * seconds + (1 - self.alpha) * previous
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+
 class Director:
-    def __init__(self):
-        pass
\ No newline at end of file
+    """
+    Runs each video as a DAG of stage tasks: plan -> (storyboard -> animate -> render) per scene -> assemble,
+    with the scene's narration (when the Pipeline has a narrator) next to its storyboard and before its animate task.
+    LLM stages, renders and narration are dispatched to separate pools of `llm_workers`, `render_workers` and `audio_workers` threads; among the
+    ready tasks of a pool the one with the longest remaining path to its video's end goes first, then the earlier scene.
+    A failed render sends its scene back to `animate` with the error (up to `n_retries` attempts) and any other
+    failing task is tried again up to `n_retries` times, so the retry loops live here rather than in the agents.
+    `progress` is a live view of every task and `on_progress` gets each task on every change of state.
+    Several videos can share one Director, their tasks compete for the same pools.
+    """
+    def __init__(
+        self,
+        pipeline=None,
+        llm_workers: int = 4,
+        render_workers: Optional[int] = None,
+        audio_workers: int = 2,
+        n_retries: int = 3,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        assert llm_workers >= 1, "llm_workers must be at least 1"
+        # The Pipeline supplies the agents and the per-scene helpers of `run`, plain task graphs don't need one
+        self.pipeline = pipeline
+        renderer = pipeline.animator.renderer if pipeline is not None else None
+        # Without a bound of its own, as many renders as the render scheduler has slots for
+        render_workers = render_workers or (renderer.max_concurrency if renderer is not None else 2)
+
+        self.capacity = {"llm": llm_workers, "render": render_workers, "audio": audio_workers}
+        self.running = {pool: 0 for pool in self.capacity}
+        self.pools = {pool: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"director-{pool}") for pool, workers in self.capacity.items()}
+        self.n_retries = n_retries
+        self.on_progress = on_progress
+
+        self.tasks: Dict[str, Task] = {}
+        self.stage_times = StageTimes()
+        self._sequence = itertools.count()
+        self._order: Dict[str, int] = {}
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return f"Director(capacity={self.capacity}, running={self.running}, tasks={len(self.tasks)})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        for pool in self.pools.values():
+            pool.shutdown(wait=True)
+
+    # ===============================
+    #        Task graph
+    # ===============================
+    def add_tasks(self, tasks: List[Task]) -> None:
+        """Add tasks whose dependencies are already known (or among `tasks`), they start as soon as they are ready."""
+        with self._condition:
+            for task in tasks:
+                assert task.task_id not in self.tasks, f"Duplicate task {task.task_id}"
+                self.tasks[task.task_id] = task
+                self._order[task.task_id] = next(self._sequence)
+            for task in tasks:
+                for dep in task.deps:
+                    self.tasks[dep].dependents.append(task.task_id)
+            for task in tasks:
+                failed_deps = [dep for dep in task.deps if self.tasks[dep].status in FINISHED - {DONE}]
+                if failed_deps and not task.allow_failed_deps:
+                    self._skip(task, f"{failed_deps[0]} {self.tasks[failed_deps[0]].status}")
+                else:
+                    self._notify(task)
+            self._dispatch()
+
+    def _ready(self, task: Task) -> bool:
+        if task.status != PENDING:
+            return False
+        finished = FINISHED if task.allow_failed_deps else {DONE}
+        return all(self.tasks[dep].status in finished for dep in task.deps)
+
+    def _remaining(self, task_id: str, memo: Dict[str, float]) -> float:
+        """Expected seconds from the start of this task to the end of its video's last task."""
+        if task_id not in memo:
+            task = self.tasks[task_id]
+            downstream = [self._remaining(dependent, memo) for dependent in task.dependents if self.tasks[dependent].status not in FINISHED]
+            if task.estimate is not None:
+                seconds = task.estimate
+            elif task.stage == "plan" and not task.dependents:
+                seconds = self.stage_times.path(VIDEO_PATH)
+            else:
+                seconds = self.stage_times.get(task.stage)
+            memo[task_id] = seconds + max(downstream, default=0.0)
+        return memo[task_id]
+
+    def _dispatch(self) -> None:
+        """Start the most urgent ready tasks while their pools have free workers. Called with the lock held."""
+        memo: Dict[str, float] = {}
+        for pool, capacity in self.capacity.items():
+            if self.running[pool] >= capacity:
+                continue
+            ready = [task for task in self.tasks.values() if task.pool == pool and self._ready(task)]
+            # Critical path first, then the earlier scene, then the earlier task
+            ready.sort(key=lambda task: (-self._remaining(task.task_id, memo), task.scene_id if task.scene_id is not None else -1, self._order[task.task_id]))
+            for task in ready[:capacity - self.running[pool]]:
+                task.status, task.error = RUNNING, None
+                task.attempts += 1
+                task.started_at, task.finished_at = time.perf_counter(), None
+                self.running[pool] += 1
+                self._notify(task)
+                self.pools[pool].submit(self._execute, task)
+
+    def _execute(self, task: Task) -> None:
+        start = time.perf_counter()
+        result, error = None, None
+        try:
+            result = task.context.run(self._call, task)
+        except Exception as e:
+            error = e
+
+        with self._condition:
+            self.running[task.pool] -= 1
+            task.finished_at = time.perf_counter()
+            if task.cancel_event.is_set():
+                self._cancel(task)
+            elif isinstance(error, RetryFrom):
+                self._retry_from(task, error)
+            elif error is not None:
+                task.error = f"{type(error).__name__}: {error}"
+                if task.attempts < task.max_attempts:
+                    print(f"[Director] {task.task_id} failed ({task.error[:100]}), attempt {task.attempts + 1}/{task.max_attempts} next")
+                    task.status = PENDING
+                    self._notify(task)
+                else:
+                    self._fail(task, task.error)
+            else:
+                task.status, task.result = DONE, result
+                self.stage_times.observe(task.stage, time.perf_counter() - start)
+                self._notify(task)
+            self._dispatch()
+            self._condition.notify_all()
+
+    @staticmethod
+    def _call(task: Task) -> Any:
+        with trace_scope(scene_id=task.scene_id), span(TASK_SPANS.get(task.stage, f"stage.{task.stage}"), attempt=task.attempts):
+            return task.fn(task)
+
+    def _retry_from(self, task: Task, retry: RetryFrom) -> None:
+        upstream = self.tasks.get(retry.task_id)
+        if upstream is None or upstream.attempts >= upstream.max_attempts:
+            self._fail(task, str(retry))
+            return
+
+        print(f"[Director] {task.task_id} failed, running {upstream.task_id} again (attempt {upstream.attempts + 1}/{upstream.max_attempts})")
+        task.error = str(retry)
+        # The upstream task and whatever ran after it start over, the later tasks with a fresh count of attempts
+        for task_id in self._descendants(upstream.task_id):
+            downstream = self.tasks[task_id]
+            if downstream.status == PENDING or (downstream.status == RUNNING and downstream is not task):
+                continue
+            downstream.status = PENDING
+            if downstream is not upstream:
+                downstream.attempts = 0
+            self._notify(downstream)
+
+    def _descendants(self, task_id: str) -> List[str]:
+        found, stack = [], [task_id]
+        while stack:
+            current = stack.pop()
+            if current not in found:
+                found.append(current)
+                stack.extend(self.tasks[current].dependents)
+        return found
+
+    def _fail(self, task: Task, error: str) -> None:
+        task.status, task.error = FAILED, error
+        self._notify(task)
+        self._skip_dependents(task)
+
+    def _cancel(self, task: Task) -> None:
+        task.status, task.error = CANCELLED, task.error or CANCELLED_MESSAGE
+        self._notify(task)
+        self._skip_dependents(task)
+
+    def _skip(self, task: Task, reason: str) -> None:
+        task.status, task.error = SKIPPED, reason
+        self._notify(task)
+        self._skip_dependents(task)
+
+    def _skip_dependents(self, task: Task) -> None:
+        for dependent_id in task.dependents:
+            dependent = self.tasks[dependent_id]
+            if dependent.status == PENDING and not dependent.allow_failed_deps:
+                self._skip(dependent, f"{task.task_id} {task.status}")
+
+    def _notify(self, task: Task) -> None:
+        if task.status in (RUNNING, FAILED, CANCELLED):
+            attempt = f" (attempt {task.attempts}/{task.max_attempts})" if task.max_attempts > 1 else ""
+            print(f"[Director] {task.task_id}: {task.status}{attempt}")
+        if self.on_progress is not None:
+            try:
+                self.on_progress(task.snapshot())
+            except Exception as e:
+                print(f"[Director] Progress callback failed: {e}")
+
+    def cancel(self, job: str, scene_id: Optional[int] = None) -> None:
+        """Cancel the unfinished tasks of a video (or only of one of its scenes), running renders are stopped."""
+        with self._condition:
+            for task in list(self.tasks.values()):
+                if task.job != job or (scene_id is not None and task.scene_id != scene_id) or task.status in FINISHED:
+                    continue
+                task.cancel_event.set()
+                if task.status == PENDING:
+                    self._cancel(task)
+            self._dispatch()
+            self._condition.notify_all()
+
+    def forget(self, job: str) -> None:
+        """Drop the finished tasks of a video, e.g. before running its thread again."""
+        with self._condition:
+            assert not any(task.job == job and task.status not in FINISHED for task in self.tasks.values()), f"{job} is still running"
+            for task_id in [task_id for task_id, task in self.tasks.items() if task.job == job]:
+                del self.tasks[task_id]
+                del self._order[task_id]
+
+    def wait(self, job: str) -> None:
+        """Block until every task of a video finished."""
+        with self._condition:
+            while any(task.job == job and task.status not in FINISHED for task in self.tasks.values()):
+                self._condition.wait(timeout=0.5)
+
+    def progress(self, job: Optional[str] = None) -> List[Dict[str, Any]]:
+        """A snapshot of every task (of one video), in the order they were added."""
+        with self._condition:
+            tasks = sorted(self.tasks.values(), key=lambda task: self._order[task.task_id])
+            return [task.snapshot() for task in tasks if job is None or task.job == job]
+
+    def report(self, job: Optional[str] = None) -> Dict[str, Any]:
+        snapshots = self.progress(job)
+        statuses: Dict[str, int] = {}
+        for snapshot in snapshots:
+            statuses[snapshot["status"]] = statuses.get(snapshot["status"], 0) + 1
+        return {
+            "tasks": len(snapshots),
+            "statuses": statuses,
+            "retries": sum(max(0, snapshot["attempts"] - 1) for snapshot in snapshots),
+            "stage_seconds": {stage: round(seconds, 1) for stage, seconds in self.stage_times.seconds.items()},
+        }
+
+    # ===============================
+    #        Video pipeline
+    # ===============================
+    def run(self, topic: str, thread_id: str) -> AgentState:
+        """
+        Same contract as `Pipeline.run`: resumes a thread from its saved state, only stale stages become tasks.
+        Speculative candidates are not raced here, each animate attempt writes one script.
+        """
+        assert self.pipeline is not None, "The Director needs a Pipeline to run videos"
+        pipeline = self.pipeline
+        video_output_dir = os.path.join(pipeline.output_root, thread_id)
+
+        self.forget(thread_id)
+        agent_state = pipeline.load(thread_id)
+        with trace_scope(thread_id=thread_id), span("director"), StateStore(video_output_dir) as store:
+            video = _Video(self, thread_id, video_output_dir, store)
+            start = time.perf_counter()
+
+            if agent_state is not None and agent_state.scenes:
+                print(f"Resuming thread {thread_id} from its saved state")
+                video.start(agent_state)
+            else:
+                self.add_tasks([video.task("plan", lambda task: video.plan(topic), max_attempts=self.n_retries)])
+
+            self.wait(thread_id)
+            if video.agent_state is None:
+                raise RuntimeError(f"Planning failed: {self.tasks[video.task_id('plan')].error}")
+
+            pipeline.print_report(len(video.dirty_ids), time.perf_counter() - start)
+            print(f"Director: {self.report(thread_id)}")
+            return video.agent_state
+
+
+class _Video:
+    """The state one `Director.run` builds its tasks around: the AgentState, its journal and the scenes being worked on."""
+    def __init__(self, director: Director, thread_id: str, video_output_dir: str, store: StateStore):
+        self.director = director
+        self.pipeline = director.pipeline
+        self.thread_id = thread_id
+        self.video_output_dir = video_output_dir
+        self.store = store
+
+        self.agent_state: Optional[AgentState] = None
+        self.scenes: Dict[int, Scene] = {}
+        self.repair_contexts: Dict[int, RepairContext] = {}
+        self.dirty_ids: List[int] = []
+        self.preview = None
+        self._lock = threading.Lock()
+        # Every task of the video traces under the run's span, not under the task that happened to create it
+        self.context = contextvars.copy_context()
+
+    def task_id(self, stage: str, scene_id: Optional[int] = None) -> str:
+        return f"{self.thread_id}/{stage}" + (f":{scene_id}" if scene_id is not None else "")
+
+    def task(self, stage: str, fn: Callable[[Task], Any], scene_id: Optional[int] = None, **kwargs) -> Task:
+        return Task(self.task_id(stage, scene_id), stage, fn, job=self.thread_id, scene_id=scene_id, context=self.context, **kwargs)
+
+    def plan(self, topic: str) -> None:
+        planner_output = self.pipeline.planner.invoke(self.pipeline._planner_input(topic))
+        print("Planner has generated the script")
+        self.start(AgentState(thread_id=self.thread_id, topic=topic, scenes=planner_output.scenes))
+
+    def start(self, agent_state: AgentState) -> None:
+        """Add the tasks of every stale stage of every scene, and the assembly after them."""
+        self.agent_state = agent_state
+        self.store.reset(agent_state)
+        dirty_scenes = [scene for scene in agent_state.scenes if self.pipeline._stale_stages(scene)]
+        self.dirty_ids = [scene.id for scene in dirty_scenes]
+        print(f"{len(dirty_scenes)}/{len(agent_state.scenes)} scenes need work")
+        self.preview = self.pipeline._start_preview(agent_state, self.video_output_dir, dirty_scenes)
+
+        tasks = []
+        for scene in dirty_scenes:
+            self.scenes[scene.id] = scene.model_copy()
+            tasks.extend(self._scene_tasks(scene))
+        tasks.append(self.task("assemble", lambda task: self.assemble(), deps=[task.task_id for task in tasks], allow_failed_deps=True))
+        self.director.add_tasks(tasks)
+
+    def _scene_tasks(self, scene: Scene) -> List[Task]:
+        stale_stages = self.pipeline._stale_stages(scene)
+        n_retries = self.director.n_retries
+        tasks: List[Task] = []
+
+        # A failed narration leaves the scene silent, its task still ends done so the animation goes on
+        narrate = self.task("narrate", lambda task: self.narrate(scene.id), scene.id) if "narration" in stale_stages else None
+        storyboard = None
+        if "storyboard" in stale_stages:
+            storyboard = self.task("storyboard", lambda task: self.storyboard(scene.id), scene.id, max_attempts=n_retries)
+            tasks.append(storyboard)
+
+        if "animation" in stale_stages:
+            # The Animator aims at the narration's length, so it waits for both
+            deps = [task.task_id for task in (storyboard, narrate) if task is not None]
+            animate = self.task("animate", lambda task: self.animate(task, scene.id), scene.id, deps=deps, max_attempts=n_retries)
+            # Retried through the render, which sends the scene back to animate with its error
+            render = self.task("render", lambda task: self.render(task, scene.id, retry_from=animate.task_id), scene.id, deps=[animate.task_id])
+            tasks.extend([animate, render])
+        elif "render" in stale_stages:
+            tasks.append(self.task("render", lambda task: self.render(task, scene.id), scene.id, estimate=self._render_estimate(scene.manim_code)))
+
+        if narrate is not None:
+            tasks.insert(0, narrate)
+        return tasks
+
+    @staticmethod
+    def _render_estimate(code: str) -> float:
+        return render_speed.get("l") * max(estimate_scene(code).seconds, DEFAULT_DURATION)
+
+    def _update(self, scene_id: int, change: Callable[[Scene], Scene]) -> Scene:
+        """Apply `change` to the latest copy of the scene, the narration and the storyboard of a scene land concurrently."""
+        with self._lock:
+            scene = change(self.scenes[scene_id])
+            self.scenes[scene_id] = scene
+            self.agent_state.scenes = merge_scenes(self.agent_state.scenes, [scene])
+            self.store.append_scenes([scene])
+            return scene
+
+    def narrate(self, scene_id: int) -> None:
+        execution_bool, status_str = self.pipeline.narrate(self.scenes[scene_id], self.video_output_dir)
+        self._update(scene_id, lambda scene: self.pipeline._apply_narration(scene, execution_bool, status_str))
+
+    def storyboard(self, scene_id: int) -> None:
+        scene = self.scenes[scene_id]
+        print(f"Starting storyboarding for scene {scene_id}")
+        storyboarder_output = self.pipeline.storyboarder.invoke(self.pipeline._storyboarder_input(scene))
+        self._update(scene_id, lambda scene: self.pipeline._apply_storyboard(scene, storyboarder_output))
+
+    def animate(self, task: Task, scene_id: int) -> None:
+        scene = self.scenes[scene_id]
+        if scene_id not in self.repair_contexts:
+            print(f"Starting animation for scene {scene_id}")
+            self.repair_contexts[scene_id] = RepairContext(self.pipeline._animator_input(scene))
+        repair_context = self.repair_contexts[scene_id]
+
+        code_dict, aborted = self.pipeline.animator.generate(repair_context, scene_id, task.attempts - 1, task.max_attempts)
+        # Kept even when it fails, like the Animator's last output
+        self._update(scene_id, lambda scene: scene.model_copy(update={"manim_code": code_dict.manim_code, "video_path": ""}))
+        if aborted:
+            repair_context.record_failure(code_dict.manim_code, aborted)
+            raise RuntimeError(aborted)
+
+        render_task = self.director.tasks[self.task_id("render", scene_id)]
+        render_task.estimate = self._render_estimate(code_dict.manim_code)
+
+    def render(self, task: Task, scene_id: int, retry_from: Optional[str] = None) -> None:
+        scene = self.scenes[scene_id]
+        video_path = self.pipeline._scene_video_path(scene, self.video_output_dir)
+        if retry_from is None:
+            print(f"Re-rendering scene {scene_id}")
+        # A re-render, or the animate task's last attempt, renders whatever the layout
+        last_attempt = retry_from is None or self.director.tasks[retry_from].attempts >= self.director.tasks[retry_from].max_attempts
+        execution_bool, status_str = self.pipeline.animator.render(
+            scene.manim_code, scene_id, video_path, task.cancel_event, last_attempt=last_attempt, repair_context=self.repair_contexts.get(scene_id)
+        )
+
+        if execution_bool:
+            stages = ("animation", "render") if retry_from else ("render",)
+            self._update(scene_id, lambda scene: scene.model_copy(update={"video_path": status_str}).mark_done(*stages))
+            self._add_preview(scene_id, status_str)
+            return
+        if task.cancel_event.is_set():
+            raise RuntimeError(status_str)
+
+        if retry_from is not None:
+            self.repair_contexts[scene_id].record_failure(scene.manim_code, status_str)
+            if self.director.tasks[retry_from].attempts < self.director.tasks[retry_from].max_attempts:
+                raise RetryFrom(retry_from, status_str)
+        # Out of attempts, the scene keeps its last code without a video
+        self._add_preview(scene_id, None)
+        raise RuntimeError(status_str[-500:])
+
+    def _add_preview(self, scene_id: int, video_path: Optional[str]) -> None:
+        if self.preview is not None:
+            self.preview.add_scene(scene_id, video_path)
+
+    def assemble(self) -> None:
+        if self.preview is not None:
+            self.preview.close()
+        if self.dirty_ids or not os.path.exists(self.agent_state.final_video_path):
+            self.pipeline.assemble(self.agent_state, self.video_output_dir)
+            self.store.append_meta(self.agent_state)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from groq import Groq
+
+    from visual_explainer.pipeline import Pipeline
+    from visual_explainer.tools.render_scheduler import RenderScheduler
+
+    load_dotenv()
+
+    pipeline = Pipeline(Groq(), renderer=RenderScheduler())
+    with Director(pipeline, llm_workers=int(os.getenv("SCENE_CONCURRENCY", "4"))) as director:
+        director.run("Pythagoras theorem", thread_id="test-thread")
+        for snapshot in director.progress("test-thread"):
+            print(snapshot)
@@ -0,0 +1,80 @@
+import ast
+import json
+import re
+from typing import Any, List, Optional
+
+CODE_FENCE = re.compile(r"```[\w+-]*[ \t]*\n?(.*?)```", re.DOTALL)
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+def strip_code_fences(text: str) -> str:
+    """The contents of the markdown code blocks in `text` (joined), or the text itself when there are none."""
+    blocks = CODE_FENCE.findall(text)
+    if not blocks:
+        return text.strip()
+    return "\n".join(block.strip() for block in blocks)
+
+
+def json_object_spans(text: str) -> List[str]:
+    """Every balanced top-level `{...}` in the text, braces inside string literals are skipped."""
+    spans = []
+    depth, start, in_string, quote, escaped = 0, None, False, "", False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                in_string = False
+        elif char in "\"'" and depth > 0:
+            in_string, quote = True, char
+        elif char == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                spans.append(text[start:i + 1])
+    return spans
+
+
+def tolerant_loads(text: str) -> Any:
+    """`json.loads` that also accepts raw newlines in strings, trailing commas and Python-style literals."""
+    try:
+        # strict=False lets through the literal newlines and tabs that models put inside code strings
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        pass
+
+    try:
+        return json.loads(TRAILING_COMMA.sub(r"\1", text), strict=False)
+    except json.JSONDecodeError:
+        pass
+
+    # Single quotes, True/False/None: the model wrote a Python dict
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def repair_json(content: str) -> Optional[Any]:
+    """
+    Best-effort recovery of the JSON object in a model response: strip the markdown fences, then parse
+    the largest balanced object in what is left. Returns None when nothing parses.
+    """
+    # The unstripped content goes second, in case the fences were inside a JSON string (e.g. in generated code)
+    for text in (strip_code_fences(content), content):
+        candidates = sorted(json_object_spans(text), key=len, reverse=True)
+        for candidate in candidates or [text]:
+            parsed = tolerant_loads(candidate)
+            if isinstance(parsed, dict):
+                return parsed
+    return None
+
+
+if __name__ == "__main__":
+    response = 'Here is the scene:\n```json\n{"manim_code": "from manim import *\nclass VideoScene(Scene): ...",}\n```'
+    print(repair_json(response))
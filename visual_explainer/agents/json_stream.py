@@ -0,0 +1,145 @@
+import codeop
+import json
+import warnings
+from typing import Any, List, Optional
+
+from .json_repair import tolerant_loads
+
+
+class JsonArrayStream:
+    """
+    Incremental parser for the array under `key` in a streamed JSON object (`{"scenes": [{...}, {...}]}`):
+    `feed` the text as it arrives and get back each element object as soon as its closing brace does.
+    Text around the object, such as markdown fences, is ignored.
+    """
+    def __init__(self, key: str):
+        self.key = key
+        self.buffer = ""
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_key: Optional[str] = None
+        self._array_depth: Optional[int] = None   # depth inside the array once it is open
+        self._element_start: Optional[int] = None
+        self.emitted = 0
+
+    def feed(self, text: str) -> List[Any]:
+        self.buffer += text
+        elements = []
+        while self._position < len(self.buffer):
+            i, char = self._position, self.buffer[self._position]
+            self._position += 1
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    # Keys of the outer object, the array is the value of the one named `key`
+                    if self._depth == 1:
+                        self._last_key = self.buffer[self._string_start:i]
+                continue
+
+            if char == '"':
+                self._in_string, self._string_start = True, i + 1
+            elif char in "{[":
+                if char == "[" and self._array_depth is None and self._depth == 1 and self._last_key == self.key:
+                    self._array_depth = self._depth + 1
+                elif char == "{" and self._array_depth is not None and self._depth == self._array_depth:
+                    self._element_start = i
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if char == "}" and self._element_start is not None and self._depth == self._array_depth:
+                    element = tolerant_loads(self.buffer[self._element_start:i + 1])
+                    self._element_start = None
+                    if isinstance(element, dict):
+                        elements.append(element)
+                elif char == "]" and self._array_depth is not None and self._depth == self._array_depth - 1:
+                    # The array is complete, later arrays under other keys are not ours
+                    self._array_depth = -1
+        self.emitted += len(elements)
+        return elements
+
+
+class JsonStringStream:
+    """The value of the string field `key` in a streamed JSON object, decoded as far as it has arrived."""
+    def __init__(self, key: str):
+        self.marker = f'"{key}"'
+        self.buffer = ""
+        self._value_start: Optional[int] = None
+        self.closed = False
+
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        if self._value_start is None:
+            marker_at = self.buffer.find(self.marker)
+            if marker_at < 0:
+                return ""
+            # "key" : "value..."
+            rest = self.buffer[marker_at + len(self.marker):]
+            stripped = rest.lstrip()
+            if not stripped.startswith(":"):
+                return ""
+            after_colon = stripped[1:].lstrip()
+            if not after_colon.startswith('"'):
+                return ""
+            self._value_start = len(self.buffer) - len(after_colon) + 1
+        return self.value()
+
+    def value(self) -> str:
+        if self._value_start is None:
+            return ""
+        raw, escaped = [], False
+        for char in self.buffer[self._value_start:]:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                self.closed = True
+                break
+            raw.append(char)
+        # An escape sequence cut in half by the stream waits for the next chunk
+        text = "".join(raw)
+        while text:
+            try:
+                return json.loads(f'"{text}"', strict=False)
+            except json.JSONDecodeError:
+                text = text[:-1]
+        return ""
+
+
+def unparseable_prefix(code: str) -> Optional[str]:
+    """
+    The syntax error of a code prefix that no continuation can fix, None while it may still become valid.
+    Only complete lines are checked, and an error on the last of them counts as "not finished yet".
+    """
+    complete = code[:code.rfind("\n") + 1]
+    if not complete.strip():
+        return None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            codeop.compile_command(complete, "<stream>", "exec")
+    except (SyntaxError, ValueError, OverflowError) as e:
+        line_count = complete.count("\n")
+        if getattr(e, "lineno", None) and e.lineno < line_count:
+            return f"SyntaxError: {e.msg} (line {e.lineno})\n{(e.text or '').rstrip()}"
+    return None
+
+
+if __name__ == "__main__":
+    stream = JsonArrayStream("scenes")
+    response = '```json\n{"scenes": [{"id": 1, "script": "a {brace} in a string"}, {"id": 2, "script": "b"}]}\n```'
+    for i in range(0, len(response), 7):
+        for scene in stream.feed(response[i:i + 7]):
+            print(f"Scene ready after {i + 7} characters: {scene}")
+
+    code_stream = JsonStringStream("manim_code")
+    print(code_stream.feed('{"manim_code": "from manim import *\\nclass VideoScene(Scene)\\n    def construct(self):\\n'))
+    print(unparseable_prefix(code_stream.value()))
@@ -1,11 +1,13 @@
 import os
-from typing import List
+from typing import Callable, List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 
 from visual_explainer.state import Scene
 
 from .agent import BaseAgent
+from .completion_cache import CompletionCache
+from .json_stream import JsonArrayStream
 from .prompts.planner import PLANNER_PROMPT
 
 
@@ -13,14 +15,40 @@ class PlannerOutput(BaseModel):
     scenes: List[Scene] = Field(description="The chronological list of scenes for the video.")
 
 class Planner(BaseAgent):
-    def __init__(self, client):
+    def __init__(self, client, cache: Optional[CompletionCache] = None):
         super().__init__(
             llm_client=client,
             model=os.getenv("PLANNER_LLM", ""),
             system_prompt=PLANNER_PROMPT,
             agent_name="Planner",
-            output_schema=PlannerOutput
+            output_schema=PlannerOutput,
+            cache=cache
         )
+
+    @staticmethod
+    def _scene_parser(on_scene: Callable[[Scene], None]) -> Callable[[str], None]:
+        scenes = JsonArrayStream("scenes")
+
+        def on_text(text: str) -> None:
+            for item in scenes.feed(text):
+                try:
+                    scene = Scene.model_validate(item)
+                except ValidationError:
+                    # Left to the validation of the full output
+                    continue
+                on_scene(scene)
+        return on_text
+
+    def stream_scenes(self, messages, on_scene: Callable[[Scene], None]) -> PlannerOutput:
+        """
+        `invoke` that hands every scene to `on_scene` as soon as it is complete in the token stream, so work on
+        the first scenes can start while the later ones are still being written. The full output is returned
+        as usual, its scenes may differ from the streamed ones if the answer needed repairs.
+        """
+        return self.invoke_stream(messages, self._scene_parser(on_scene))
+
+    async def astream_scenes(self, messages, on_scene: Callable[[Scene], None]) -> PlannerOutput:
+        return await self.ainvoke_stream(messages, self._scene_parser(on_scene))
         
 if __name__ == "__main__":
     from dotenv import load_dotenv
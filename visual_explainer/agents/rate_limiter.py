@@ -0,0 +1,372 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Mapping, Optional
+
+from groq import APIResponse, AsyncAPIResponse, RateLimitError
+
+WINDOW_SECONDS = 60.0
+
+# Rough allowance for the completion when reserving tokens before a call, corrected with the real usage afterwards
+COMPLETION_TOKEN_ALLOWANCE = 1024
+
+# (requests, tokens) per minute of Groq's free tier for the models the agents default to, at the time of writing.
+# Other models get DEFAULT_LIMITS, GROQ_RPM / GROQ_TPM override both. They are only the starting point: the
+# rate-limit headers of every response correct them as the calls go, so another tier is not held to these.
+# Offline runs (the benchmark's ReplayGroq) have no headers and should raise them, or every call waits for the budget.
+MODEL_LIMITS = {
+    "openai/gpt-oss-20b": (30, 8000),
+    "moonshotai/kimi-k2-instruct-0905": (60, 10000),
+    "meta-llama/llama-4-scout-17b-16e-instruct": (30, 30000),
+}
+DEFAULT_LIMITS = (30, 6000)
+
+
+def estimate_tokens(messages: List[Any]) -> int:
+    """Cheap prompt-size estimate (~4 characters per token), good enough for budgeting."""
+    n_chars = 0
+    for message in messages:
+        if isinstance(message, dict):
+            n_chars += len(json.dumps(message, default=str))
+        else:
+            n_chars += len(str(getattr(message, "content", "") or ""))
+    return n_chars // 4 + 1
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse Groq's reset/retry values, e.g. "7.66s", "2m59.56s", "120ms" or a plain number of seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    matches = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if not matches:
+        return None
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(amount) * units[unit] for amount, unit in matches)
+
+
+def _find_rate_limit_error(error: BaseException) -> Optional[RateLimitError]:
+    # Instructor wraps the errors of the underlying client, so walk the exception chain
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, RateLimitError):
+            return error
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def usage_tokens(response: Any) -> Optional[int]:
+    # Instructor returns the pydantic model, the raw completion sits on `_raw_response`
+    usage = getattr(response, "usage", None) or getattr(getattr(response, "_raw_response", None), "usage", None)
+    total_tokens = getattr(usage, "total_tokens", None)
+    return total_tokens if isinstance(total_tokens, int) else None
+
+
+def usage_breakdown(response: Any) -> Dict[str, int]:
+    """Prompt and completion tokens of a response, for whichever of the two the API reported."""
+    usage = getattr(response, "usage", None) or getattr(getattr(response, "_raw_response", None), "usage", None)
+    breakdown = {}
+    for key in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, key, None)
+        if isinstance(value, int):
+            breakdown[key] = value
+    return breakdown
+
+
+class ModelBudget:
+    """Sliding one-minute window of the requests and tokens spent against a single model."""
+    def __init__(self, model: str, requests_per_minute: int, tokens_per_minute: int, scale_requests: bool = False):
+        self.model = model
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # Whether the requests per minute are MODEL_LIMITS' guess, to be scaled with the tokens the headers report
+        self.scale_requests = scale_requests
+
+        self._lock = threading.Lock()
+        self._events: deque = deque()   # (timestamp, tokens) of every reserved request
+        self._blocked_until = 0.0
+
+    def __repr__(self):
+        return f"ModelBudget(model={self.model}, rpm={self.requests_per_minute}, tpm={self.tokens_per_minute})"
+
+    def _expire(self, now: float) -> None:
+        while self._events and now - self._events[0][0] >= WINDOW_SECONDS:
+            self._events.popleft()
+
+    def try_reserve(self, tokens: int) -> float:
+        """Reserve a request of `tokens` tokens. Returns 0 on success, otherwise the seconds to wait before retrying."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+
+            self._expire(now)
+            used_tokens = sum(event[1] for event in self._events)
+
+            if len(self._events) >= self.requests_per_minute:
+                return self._events[0][0] + WINDOW_SECONDS - now
+
+            # A single request larger than the whole budget is let through once the window is empty
+            if self._events and used_tokens + tokens > self.tokens_per_minute:
+                freed, wait = 0, 0.0
+                for timestamp, event_tokens in self._events:
+                    freed += event_tokens
+                    wait = timestamp + WINDOW_SECONDS - now
+                    if used_tokens - freed + tokens <= self.tokens_per_minute:
+                        break
+                return max(wait, 0.01)
+
+            event = [now, tokens]
+            self._events.append(event)
+            return 0.0
+
+    def record_usage(self, reserved_tokens: int, actual_tokens: int) -> None:
+        """Swap the estimate of the latest matching reservation for the real token count."""
+        with self._lock:
+            for event in reversed(self._events):
+                if event[1] == reserved_tokens:
+                    event[1] = actual_tokens
+                    return
+
+    def release(self, reserved_tokens: int) -> None:
+        """Drop the latest matching reservation, for a request that failed and will be reserved again or not at all."""
+        with self._lock:
+            for event in reversed(self._events):
+                if event[1] == reserved_tokens:
+                    self._events.remove(event)
+                    return
+
+    def block_for(self, seconds: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> Optional[float]:
+        """
+        Sync the budget with Groq's rate-limit headers, returns the server's retry-after (if any).
+        On Groq, `*-tokens` headers are per minute while `*-requests` headers are per day.
+        """
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        if limit_tokens and limit_tokens.isdigit() and int(limit_tokens) != self.tokens_per_minute:
+            with self._lock:
+                if self.scale_requests:
+                    # No header reports the requests per minute: an account on another tier than the one
+                    # MODEL_LIMITS assumes gets them scaled like its tokens per minute
+                    self.requests_per_minute = max(1, round(self.requests_per_minute * int(limit_tokens) / self.tokens_per_minute))
+                self.tokens_per_minute = int(limit_tokens)
+
+        if headers.get("x-ratelimit-remaining-tokens") == "0":
+            reset = parse_reset_duration(headers.get("x-ratelimit-reset-tokens"))
+            if reset:
+                self.block_for(reset)
+
+        if headers.get("x-ratelimit-remaining-requests") == "0":
+            reset = parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+            if reset:
+                self.block_for(reset)
+
+        return parse_reset_duration(headers.get("retry-after"))
+
+
+class StreamUsage:
+    """The tokens of a streamed completion, filled in by its consumer as the stream ends."""
+    def __init__(self, stream: Any, prompt_tokens: int):
+        self.stream = stream
+        self.prompt_tokens = prompt_tokens
+        self.completion_chars = 0
+        self.total_tokens: Optional[int] = None   # as reported on the last chunk
+
+    def tokens(self) -> int:
+        return self.total_tokens or self.prompt_tokens + self.completion_chars // 4 + 1
+
+
+class RateLimitManager:
+    """
+    Process-wide gate in front of every Groq call. Each model gets its own budget (Groq limits are per model),
+    calls wait for room in the budget instead of sleeping a fixed amount, and 429s are retried with
+    jittered exponential backoff that respects the server's retry-after.
+    `max_in_flight` (0 for no limit, default GROQ_MAX_IN_FLIGHT) caps the requests open at the same time, across all models;
+    a streamed completion holds its slot until it has been read to the end or closed.
+    Without explicit limits, a model's budget starts from the environment or MODEL_LIMITS when it is first used.
+    """
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = 6,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        max_in_flight: Optional[int] = None,
+    ):
+        self.default_requests_per_minute = requests_per_minute
+        self.default_tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._budgets: Dict[str, ModelBudget] = {}
+        self._lock = threading.Lock()
+        self.set_max_in_flight(max_in_flight if max_in_flight is not None else int(os.getenv("GROQ_MAX_IN_FLIGHT", "0")))
+
+    def set_max_in_flight(self, max_in_flight: int) -> None:
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+
+    def configure(self, model: str, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None) -> ModelBudget:
+        budget = self.budget(model)
+        if requests_per_minute:
+            budget.requests_per_minute = requests_per_minute
+        if tokens_per_minute:
+            budget.tokens_per_minute = tokens_per_minute
+        return budget
+
+    def budget(self, model: str) -> ModelBudget:
+        with self._lock:
+            if model not in self._budgets:
+                requests_per_minute, tokens_per_minute = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+                explicit_requests = self.default_requests_per_minute or os.getenv("GROQ_RPM")
+                self._budgets[model] = ModelBudget(
+                    model,
+                    int(explicit_requests or requests_per_minute),
+                    self.default_tokens_per_minute or int(os.getenv("GROQ_TPM", tokens_per_minute)),
+                    scale_requests=not explicit_requests,
+                )
+            return self._budgets[model]
+
+    def _acquire_slot(self) -> Optional[threading.BoundedSemaphore]:
+        """Take an in-flight slot, returns the semaphore to release it on (None without a cap)."""
+        slots = self._slots
+        if slots is not None:
+            slots.acquire()
+        return slots
+
+    async def _aacquire_slot(self) -> Optional[threading.BoundedSemaphore]:
+        slots = self._slots
+        if slots is not None:
+            # Polled, so a coroutine waiting for a slot never blocks the event loop
+            while not slots.acquire(blocking=False):
+                await asyncio.sleep(0.05)
+        return slots
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        delay = random.uniform(delay / 2, delay)
+        return max(delay, retry_after or 0.0)
+
+    def _on_rate_limited(self, budget: ModelBudget, error: RateLimitError, attempt: int) -> float:
+        retry_after = budget.update_from_headers(error.response.headers)
+        delay = self._backoff(attempt, retry_after)
+        budget.block_for(delay)
+        print(f"[RateLimit] 429 from {budget.model}, backing off for {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+        return delay
+
+    def _reserve_and_call(self, budget: ModelBudget, reserved: int, fn: Callable, args, kwargs):
+        """
+        The response, and the semaphore of the in-flight slot it holds (None without a cap). The slot is only
+        taken for the request itself, not while waiting for the budget or backing off.
+        A raw response (`with_raw_response.create`) updates the budget from its headers and is returned parsed.
+        """
+        for attempt in range(self.max_retries + 1):
+            while (wait := budget.try_reserve(reserved)) > 0:
+                time.sleep(wait)
+
+            slots = self._acquire_slot()
+            try:
+                response = fn(*args, **kwargs)
+                if isinstance(response, APIResponse):
+                    budget.update_from_headers(response.headers)
+                    response = response.parse()
+                return response, slots
+            except BaseException as e:
+                if slots is not None:
+                    slots.release()
+                # A failed (or cancelled) attempt is charged nothing, a retry reserves anew
+                budget.release(reserved)
+                rate_limit_error = _find_rate_limit_error(e)
+                if rate_limit_error is None or attempt == self.max_retries:
+                    raise
+                time.sleep(self._on_rate_limited(budget, rate_limit_error, attempt))
+
+    async def _areserve_and_call(self, budget: ModelBudget, reserved: int, fn: Callable, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            while (wait := budget.try_reserve(reserved)) > 0:
+                await asyncio.sleep(wait)
+
+            slots = await self._aacquire_slot()
+            try:
+                response = await fn(*args, **kwargs)
+                if isinstance(response, AsyncAPIResponse):
+                    budget.update_from_headers(response.headers)
+                    response = await response.parse()
+                return response, slots
+            except BaseException as e:
+                if slots is not None:
+                    slots.release()
+                budget.release(reserved)
+                rate_limit_error = _find_rate_limit_error(e)
+                if rate_limit_error is None or attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._on_rate_limited(budget, rate_limit_error, attempt))
+
+    def call(self, model: str, fn: Callable, estimated_tokens: int, /, *args, **kwargs):
+        budget = self.budget(model)
+        reserved = estimated_tokens + COMPLETION_TOKEN_ALLOWANCE
+        response, slots = self._reserve_and_call(budget, reserved, fn, args, kwargs)
+        if slots is not None:
+            slots.release()
+        budget.record_usage(reserved, usage_tokens(response) or estimated_tokens)
+        return response
+
+    async def acall(self, model: str, fn: Callable, estimated_tokens: int, /, *args, **kwargs):
+        budget = self.budget(model)
+        reserved = estimated_tokens + COMPLETION_TOKEN_ALLOWANCE
+        response, slots = await self._areserve_and_call(budget, reserved, fn, args, kwargs)
+        if slots is not None:
+            slots.release()
+        budget.record_usage(reserved, usage_tokens(response) or estimated_tokens)
+        return response
+
+    @contextmanager
+    def stream(self, model: str, fn: Callable, estimated_tokens: int, /, *args, **kwargs) -> Iterator[StreamUsage]:
+        """
+        `call` for a streamed completion: the request stays in flight until the block exits, and the usage the
+        consumer recorded on the yielded StreamUsage (or an estimate from the streamed characters) is charged then.
+        """
+        budget = self.budget(model)
+        reserved = estimated_tokens + COMPLETION_TOKEN_ALLOWANCE
+        response, slots = self._reserve_and_call(budget, reserved, fn, args, kwargs)
+        usage = StreamUsage(response, estimated_tokens)
+        try:
+            yield usage
+        finally:
+            if slots is not None:
+                slots.release()
+            budget.record_usage(reserved, usage.tokens())
+
+    @asynccontextmanager
+    async def astream(self, model: str, fn: Callable, estimated_tokens: int, /, *args, **kwargs) -> AsyncIterator[StreamUsage]:
+        budget = self.budget(model)
+        reserved = estimated_tokens + COMPLETION_TOKEN_ALLOWANCE
+        response, slots = await self._areserve_and_call(budget, reserved, fn, args, kwargs)
+        usage = StreamUsage(response, estimated_tokens)
+        try:
+            yield usage
+        finally:
+            if slots is not None:
+                slots.release()
+            budget.record_usage(reserved, usage.tokens())
+
+
+# Shared by every agent in the process
+rate_limiter = RateLimitManager()
@@ -0,0 +1,95 @@
+import json
+import re
+from typing import Dict, List, Optional
+
+from visual_explainer.tools.manim_layout import is_layout_error
+
+from .rate_limiter import estimate_tokens
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+# Rich's traceback boxes (manim CLI) and the plain Python ones
+RICH_FRAME = re.compile(r"(?P<file>[^\s│]+\.py):(?P<line>\d+) in (?P<func>[\w<>]+)")
+PLAIN_FRAME = re.compile(r'File "(?P<file>[^"]+)", line (?P<line>\d+), in (?P<func>[\w<>]+)')
+EXCEPTION_LINE = re.compile(r"^[A-Za-z_][\w.]*(Error|Exception|Exit|Interrupt)\b.*")
+
+
+def condense_traceback(error: str, max_chars: int = 1500) -> str:
+    """
+    Boil a Manim/Python error down to the failing frame of the generated script and the exception,
+    the frames inside manim itself only cost tokens. Errors without a traceback are just capped.
+    """
+    lines = [ANSI_ESCAPE.sub("", line).strip(" │╭╮╰╯─\t").rstrip() for line in error.splitlines()]
+    lines = [line for line in lines if line]
+
+    failing_frame: Optional[str] = None
+    failing_source: Optional[str] = None
+    for i, line in enumerate(lines):
+        match = RICH_FRAME.search(line) or PLAIN_FRAME.search(line)
+        if not match or "script_scene_" not in match.group("file"):
+            continue
+        failing_frame = f'File "{match.group("file").rsplit("/", 1)[-1]}", line {match.group("line")}, in {match.group("func")}'
+
+        # Plain tracebacks print the source on the next line, rich ones mark it with ❱
+        failing_source = None
+        for source_line in lines[i + 1:i + 8]:
+            if "❱" in source_line:
+                failing_source = source_line.split("❱", 1)[1].strip().lstrip("0123456789").strip(" │")
+                break
+        if failing_source is None and i + 1 < len(lines) and PLAIN_FRAME.search(line):
+            failing_source = lines[i + 1].strip()
+
+    exception_lines = [line for line in lines if EXCEPTION_LINE.match(line)]
+    if failing_frame is None and not exception_lines:
+        return error if len(error) <= max_chars else f"...\n{error[-max_chars:]}"
+
+    condensed = ["Traceback (condensed):"]
+    if failing_frame:
+        condensed.append(f"  {failing_frame}")
+        if failing_source:
+            condensed.append(f"    {failing_source}")
+    if exception_lines:
+        condensed.append(exception_lines[-1])
+    return "\n".join(condensed)[:max_chars]
+
+
+class RepairContext:
+    """
+    The conversation for the Animator's repair attempts. Instead of piling every failed attempt
+    and its full stderr onto the messages, it keeps the original request, the latest candidate
+    code and its condensed error, within `token_budget` (the system prompt is not counted).
+    """
+    def __init__(self, base_messages: List[Dict[str, str]], token_budget: int = 6000):
+        self.base_messages = list(base_messages)
+        self.token_budget = token_budget
+        self.latest_code: Optional[str] = None
+        self.latest_error: Optional[str] = None
+        # Attempts spent on layout violations, bounded by the Animator's layout retry budget
+        self.layout_failures = 0
+
+    def __repr__(self):
+        return f"RepairContext(has_failure={self.latest_code is not None}, tokens={estimate_tokens(self.messages())})"
+
+    def record_failure(self, manim_code: str, error: str) -> None:
+        if is_layout_error(error):
+            self.layout_failures += 1
+        self.latest_code = manim_code
+        self.latest_error = condense_traceback(error)
+
+    def _repair_messages(self, error: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "assistant", "content": json.dumps({"manim_code": self.latest_code})},
+            {"role": "user", "content": f"The code you generated failed to execute with this error:\n\n{error}"},
+        ]
+
+    def messages(self) -> List[Dict[str, str]]:
+        if self.latest_code is None:
+            return list(self.base_messages)
+
+        error = self.latest_error or ""
+        messages = self.base_messages + self._repair_messages(error)
+
+        # Over budget: keep the exception (last lines) and give up the rest of the error first
+        while estimate_tokens(messages) > self.token_budget and "\n" in error:
+            error = error.split("\n", 1)[1]
+            messages = self.base_messages + self._repair_messages(error)
+        return messages
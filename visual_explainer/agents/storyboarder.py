@@ -1,8 +1,10 @@
 import os
+from typing import Optional
 
 from pydantic import BaseModel, Field
 
 from .agent import BaseAgent
+from .completion_cache import CompletionCache
 from .prompts.storyboarder import STORYBOARDER_PROMPT
 
 
@@ -11,13 +13,14 @@ class StoryboarderOutput(BaseModel):
     animation_instruction: str = Field(description="The instruction to give to the Animator for the animation of this scene")
 
 class Storyboarder(BaseAgent):
-    def __init__(self, client):
+    def __init__(self, client, cache: Optional[CompletionCache] = None):
         super().__init__(
             llm_client=client,
             model=os.getenv("STORYBOARDER_LLM", ""),
             system_prompt=STORYBOARDER_PROMPT,
             agent_name="Storyboarder",
-            output_schema=StoryboarderOutput
+            output_schema=StoryboarderOutput,
+            cache=cache
         )
 
 if __name__ == "__main__":
@@ -1,5 +1,189 @@
-def main():
-    print("Hello from visual-explainer!")
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Union
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def topic_thread_id(topic: str) -> str:
+    """Stable thread id for a topic, so a rerun of the batch finds the saved state of its threads."""
+    slug = re.sub(r"[^a-z0-9]+", "-", topic.lower()).strip("-")[:40]
+    return f"{slug}-{hashlib.sha256(topic.encode('utf-8')).hexdigest()[:8]}"
+
+
+def read_queue(queue_path: Union[str, os.PathLike]) -> List[Dict[str, Any]]:
+    """Queue lines are `{"topic": ...}`, optionally with their own `thread_id`. Blank lines are skipped."""
+    items = []
+    with open(queue_path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get("topic"):
+                raise ValueError(f"{queue_path}:{line_number} has no topic")
+            item.setdefault("thread_id", topic_thread_id(item["topic"]))
+            items.append(item)
+    return items
+
+
+def finished_thread_ids(results_path: Union[str, os.PathLike]) -> set:
+    if not os.path.exists(results_path):
+        return set()
+    finished = set()
+    with open(results_path, "r") as f:
+        for line in f:
+            try:
+                finished.add(json.loads(line)["thread_id"])
+            except (json.JSONDecodeError, KeyError):
+                # A line torn by a crash, its topic simply runs again
+                continue
+    return finished
+
+
+class JsonlWriter:
+    """Appends records to a JSONL file from many threads, each record is on disk before `write` returns."""
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def run_topic(pipeline, item: Dict[str, Any]) -> Dict[str, Any]:
+    """`pipeline` is a Pipeline or a Director, both resume a thread through `run(topic, thread_id)`."""
+    start = time.perf_counter()
+    record = {"thread_id": item["thread_id"], "topic": item["topic"]}
+    try:
+        # Pipeline.run resumes a thread from its saved state, a topic cut off by a crash keeps its finished scenes
+        agent_state = pipeline.run(item["topic"], thread_id=item["thread_id"])
+    except Exception as e:
+        return {**record, "status": "failed", "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc(), "duration": time.perf_counter() - start}
+
+    failed_scenes = [scene.id for scene in agent_state.scenes if not scene.video_path or not os.path.exists(scene.video_path)]
+    record.update({
+        "final_video_path": agent_state.final_video_path,
+        "failed_scenes": failed_scenes,
+        "duration": time.perf_counter() - start,
+    })
+    if not agent_state.final_video_path or not os.path.exists(agent_state.final_video_path):
+        return {**record, "status": "failed", "error": "No final video was assembled"}
+    return {**record, "status": "done"}
+
+
+def run_batch(
+    queue_path: Union[str, os.PathLike],
+    results_path: Union[str, os.PathLike],
+    failures_path: Union[str, os.PathLike],
+    concurrency: int = 2,
+    scene_concurrency: int = 4,
+    max_llm_calls: int = 4,
+    max_renders: int = 0,
+    render_workers: int = 0,
+    use_director: bool = False,
+    narrate: bool = False,
+    llm_client=None,
+) -> Dict[str, int]:
+    """
+    Produce a video for every topic of the queue, `concurrency` topics at a time.
+    Topics already in `results_path` are skipped, so an interrupted batch picks up where it stopped;
+    failed topics go to `failures_path` and are tried again on the next run.
+    With `use_director`, every topic's stages are tasks of one Director, on LLM and render pools shared by all topics.
+    With `narrate`, scenes are narrated with the offline TTS engine picked by TTS_BACKEND.
+    """
+    from groq import Groq
+
+    from visual_explainer.agents.director import Director
+    from visual_explainer.agents.rate_limiter import rate_limiter
+    from visual_explainer.pipeline import Pipeline
+    from visual_explainer.tools.narration import Narrator
+    from visual_explainer.tools.render_pool import RenderPool
+    from visual_explainer.tools.render_scheduler import RenderScheduler
+
+    items = read_queue(queue_path)
+    finished = finished_thread_ids(results_path)
+    pending = [item for item in items if item["thread_id"] not in finished]
+    print(f"[Batch] {len(items)} topics in the queue, {len(items) - len(pending)} already done, {len(pending)} to run")
+
+    # Both caps are shared by every topic: LLM calls at the rate limiter, renders at the scheduler
+    rate_limiter.set_max_in_flight(max_llm_calls)
+    render_pool = RenderPool(n_workers=render_workers) if render_workers else None
+    renderer = RenderScheduler(max_concurrency=max_renders or None, pool=render_pool)
+    pipeline = Pipeline(
+        llm_client or Groq(), max_concurrency=scene_concurrency, render_pool=render_pool, renderer=renderer,
+        narrator=Narrator() if narrate else None,
+    )
+    director = Director(pipeline, llm_workers=max_llm_calls) if use_director else None
+
+    results, failures = JsonlWriter(results_path), JsonlWriter(failures_path)
+    counts = {"done": 0, "failed": 0, "skipped": len(items) - len(pending)}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(run_topic, director or pipeline, item): item for item in pending}
+            for future in as_completed(futures):
+                record = future.result()
+                record["finished_at"] = datetime.now(timezone.utc).isoformat()
+                if record["status"] == "done":
+                    results.write(record)
+                else:
+                    failures.write(record)
+                counts[record["status"]] += 1
+                print(f"[Batch] {record['status']}: {record['topic']} ({counts['done'] + counts['failed']}/{len(pending)})")
+    finally:
+        if director is not None:
+            director.close()
+        if render_pool is not None:
+            render_pool.close()
+
+    print(f"[Batch] {counts}, render queue: {renderer.report()}")
+    return counts
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Generate explainer videos for a JSONL queue of topics.")
+    parser.add_argument("queue", help='JSONL file, one {"topic": "..."} per line (an optional "thread_id" is kept)')
+    parser.add_argument("--results", default=None, help="Where finished topics are appended (default: <queue>.results.jsonl)")
+    parser.add_argument("--failures", default=None, help="Where failed topics are appended (default: <queue>.failures.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("TOPIC_CONCURRENCY", "2")), help="Topics in flight")
+    parser.add_argument("--scene-concurrency", type=int, default=int(os.getenv("SCENE_CONCURRENCY", "4")), help="Scenes in flight per topic")
+    parser.add_argument("--max-llm-calls", type=int, default=int(os.getenv("GROQ_MAX_IN_FLIGHT", "4")), help="LLM requests in flight, across all topics")
+    parser.add_argument("--max-renders", type=int, default=int(os.getenv("MAX_RENDERS", "0")), help="Renders in flight across all topics, 0 sizes it to the cores and memory")
+    parser.add_argument("--render-workers", type=int, default=int(os.getenv("RENDER_WORKERS", "0")), help="Warm render processes, 0 renders through the manim CLI")
+    parser.add_argument("--director", action="store_true", default=os.getenv("USE_DIRECTOR", "0") != "0", help="Schedule every topic's stages as one task graph")
+    parser.add_argument("--narrate", action="store_true", default=os.getenv("NARRATION", "0") != "0", help="Add a narration track with an offline TTS engine")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    base_path = os.path.splitext(args.queue)[0]
+    run_batch(
+        args.queue,
+        args.results or f"{base_path}.results.jsonl",
+        args.failures or f"{base_path}.failures.jsonl",
+        concurrency=args.concurrency,
+        scene_concurrency=args.scene_concurrency,
+        max_llm_calls=args.max_llm_calls,
+        max_renders=args.max_renders,
+        render_workers=args.render_workers,
+        use_director=args.director,
+        narrate=args.narrate,
+    )
 
 
 if __name__ == "__main__":
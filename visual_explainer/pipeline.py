@@ -0,0 +1,583 @@
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Set, Union
+
+from groq import AsyncGroq, Groq
+
+from visual_explainer.agents.animator import Animator, AnimatorOutput
+from visual_explainer.agents.completion_cache import CompletionCache
+from visual_explainer.agents.planner import Planner, PlannerOutput
+from visual_explainer.agents.storyboarder import Storyboarder, StoryboarderOutput
+from visual_explainer.state import AgentState, Scene, merge_scenes
+from visual_explainer.state_store import StateStore
+from visual_explainer.tools.narration import Narrator, audio_duration
+from visual_explainer.tools.preview_stream import PreviewStream
+from visual_explainer.tools.render_pool import RenderPool
+from visual_explainer.tools.render_scheduler import RenderScheduler
+from visual_explainer.tools.video_assembly import assemble_video
+from visual_explainer.tracing import span, trace_scope
+
+VIDEO_OUTPUT_ROOT = os.path.join(os.path.abspath(os.path.curdir), "outputs", "videos")
+
+# Bookkeeping the agents have no use for, and thread-specific paths would only split the completion cache
+AGENT_EXCLUDED_FIELDS = {"stage_hashes", "audio_path", "audio_duration"}
+
+
+class StreamedCheckpoint:
+    """
+    Checkpoint of the scenes started while the Planner is still streaming. There is no plan to journal them
+    against yet, and a partial plan must never be resumed, so they are held until `commit` resets the store
+    with the final plan. From then on only the scenes the final plan kept as they were streamed are journaled.
+    """
+    def __init__(self, store: StateStore):
+        self.store = store
+        self._held: Dict[int, Scene] = {}
+        self._kept_ids: Optional[Set[int]] = None
+        self._lock = threading.Lock()
+
+    def __call__(self, scene: Scene) -> None:
+        with self._lock:
+            if self._kept_ids is None:
+                self._held[scene.id] = scene
+                return
+        if scene.id in self._kept_ids:
+            self.store.append_scenes([scene])
+
+    def commit(self, agent_state: AgentState, kept_ids: Set[int]) -> None:
+        with self._lock:
+            self.store.reset(agent_state)
+            held = [scene for scene_id, scene in self._held.items() if scene_id in kept_ids]
+            if held:
+                self.store.append_scenes(held)
+            self._kept_ids = kept_ids
+
+
+class Pipeline:
+    """
+    Runs the Planner once, then fans the scenes out so that the Storyboarder -> Animator chain
+    of every scene runs concurrently (at most `max_concurrency` scenes at a time).
+    With `speculative_k` > 1 (one value, or per scene id), the Animator races that many candidate scripts per scene.
+    `max_renders` caps the renders in flight, also across threads that share the pipeline, and a `renderer`
+    (RenderScheduler) queues them by scene id within a share of the machine's cores and memory.
+    With `preview`, finished scenes are appended to an HLS playlist in `<thread dir>/preview/` as they land.
+    With `stream`, completions are streamed: a fresh run starts on each scene as soon as the Planner has
+    written it, and the Animator stops generating code that can no longer parse.
+    With a `narrator`, each scene's script is spoken next to its storyboard, the Animator is given the clip's
+    length to aim for, and the clips become the final video's audio track.
+    A completion `cache` replays the Planner's and Storyboarder's answers on reruns.
+    Finished scenes are folded back into the AgentState through the `merge_scenes` reducer.
+    """
+    def __init__(
+        self,
+        llm_client: Union[Groq, AsyncGroq],
+        max_concurrency: int = 4,
+        output_root: Union[str, os.PathLike] = VIDEO_OUTPUT_ROOT,
+        cache: Optional[CompletionCache] = None,
+        render_pool: Optional[RenderPool] = None,
+        speculative_k: Union[int, Dict[int, int]] = 1,
+        max_renders: Optional[int] = None,
+        renderer: Optional[RenderScheduler] = None,
+        preview: bool = False,
+        stream: bool = False,
+        narrator: Optional[Narrator] = None,
+    ):
+        assert max_concurrency >= 1, "max_concurrency must be at least 1"
+
+        self.planner = Planner(llm_client, cache=cache)
+        self.storyboarder = Storyboarder(llm_client, cache=cache)
+        # Not the Animator: its code is only worth replaying once it renders, and a cached failing script would
+        # come back on every retry and every rerun
+        self.animator = Animator(llm_client, render_pool=render_pool, max_renders=max_renders, renderer=renderer, stream=stream)
+        self.cache = cache
+
+        self.max_concurrency = max_concurrency
+        self.speculative_k = speculative_k
+        self.output_root = output_root
+        self.preview = preview
+        self.stream = stream
+        self.narrator = narrator
+
+    def plan(self, topic: str, thread_id: str) -> AgentState:
+        with trace_scope(thread_id=thread_id), span("plan"):
+            planner_output: PlannerOutput = self.planner.invoke(self._planner_input(topic))
+        print("Planner has generated the script")
+
+        return AgentState(thread_id=thread_id, topic=topic, scenes=planner_output.scenes)
+
+    async def aplan(self, topic: str, thread_id: str) -> AgentState:
+        with trace_scope(thread_id=thread_id), span("plan"):
+            planner_output: PlannerOutput = await self.planner.ainvoke(self._planner_input(topic))
+        print("Planner has generated the script")
+
+        return AgentState(thread_id=thread_id, topic=topic, scenes=planner_output.scenes)
+
+    def run_scene(self, scene: Scene, video_output_dir: Union[str, os.PathLike], checkpoint: Optional[Callable[[Scene], None]] = None) -> Scene:
+        """
+        Bring a single scene up to date and return the updated copy. Only the stages whose inputs
+        changed since they last completed are run again, e.g. an edited script costs one storyboard,
+        one animation and one render, while an untouched scene costs nothing.
+        `checkpoint` is called with the scene after each intermediate stage, so progress survives a crash.
+        """
+        stale_stages = self._stale_stages(scene)
+
+        with trace_scope(scene_id=scene.id), span("scene", stages=stale_stages), ThreadPoolExecutor(max_workers=1) as narration_executor:
+            # ===============================
+            #        Narration step
+            # ===============================
+            # Spoken next to the storyboard, only the Animator waits for its length
+            narration = None
+            if "narration" in stale_stages:
+                narration = narration_executor.submit(contextvars.copy_context().run, self.narrate, scene, video_output_dir)
+
+            # ===============================
+            #       Storyboarder step
+            # ===============================
+            if "storyboard" in stale_stages:
+                print(f"Starting storyboarding for scene {scene.id}")
+                with span("stage.storyboard"):
+                    storyboarder_output: StoryboarderOutput = self.storyboarder.invoke(self._storyboarder_input(scene))
+                scene = self._apply_storyboard(scene, storyboarder_output)
+                if checkpoint:
+                    checkpoint(scene)
+
+            if narration is not None and scene.is_stale("animation"):
+                scene = self._apply_narration(scene, *narration.result())
+                narration = None
+
+            # ===============================
+            #         Animator step
+            # ===============================
+            # Groq rate limits are handled by the shared rate limiter inside every agent call
+            if scene.is_stale("animation"):
+                print(f"Starting animation for scene {scene.id}")
+                with span("stage.animation", k=self._scene_k(scene)):
+                    animator_output: AnimatorOutput = self.animator.invoke_speculative(
+                        self._animator_input(scene), scene.id, self._scene_video_path(scene, video_output_dir), k=self._scene_k(scene)
+                    )
+                scene = self._apply_animation(scene, animator_output)
+            elif "render" in stale_stages:
+                print(f"Re-rendering scene {scene.id}")
+                with span("stage.render"):
+                    # Nothing regenerates the code here, a layout violation can't be fixed by failing
+                    execution_bool, status_str = self.animator.render(scene.manim_code, scene.id, self._scene_video_path(scene, video_output_dir), last_attempt=True)
+                scene = self._apply_render(scene, execution_bool, status_str)
+
+            if narration is not None:
+                scene = self._apply_narration(scene, *narration.result())
+
+        return scene
+
+    async def arun_scene(self, scene: Scene, video_output_dir: Union[str, os.PathLike], checkpoint: Optional[Callable[[Scene], None]] = None) -> Scene:
+        stale_stages = self._stale_stages(scene)
+
+        with trace_scope(scene_id=scene.id), span("scene", stages=stale_stages):
+            narration = None
+            if "narration" in stale_stages:
+                # TTS engines block, the clip is synthesized on a worker thread while the storyboard is written
+                narration = asyncio.ensure_future(asyncio.to_thread(self.narrate, scene, video_output_dir))
+
+            if "storyboard" in stale_stages:
+                print(f"Starting storyboarding for scene {scene.id}")
+                with span("stage.storyboard"):
+                    storyboarder_output: StoryboarderOutput = await self.storyboarder.ainvoke(self._storyboarder_input(scene))
+                scene = self._apply_storyboard(scene, storyboarder_output)
+                if checkpoint:
+                    checkpoint(scene)
+
+            if narration is not None and scene.is_stale("animation"):
+                scene = self._apply_narration(scene, *await narration)
+                narration = None
+
+            if scene.is_stale("animation"):
+                print(f"Starting animation for scene {scene.id}")
+                with span("stage.animation", k=self._scene_k(scene)):
+                    animator_output: AnimatorOutput = await self.animator.ainvoke_speculative(
+                        self._animator_input(scene), scene.id, self._scene_video_path(scene, video_output_dir), k=self._scene_k(scene)
+                    )
+                scene = self._apply_animation(scene, animator_output)
+            elif "render" in stale_stages:
+                print(f"Re-rendering scene {scene.id}")
+                with span("stage.render"):
+                    execution_bool, status_str = await asyncio.to_thread(
+                        self.animator.render, scene.manim_code, scene.id, self._scene_video_path(scene, video_output_dir), None, True
+                    )
+                scene = self._apply_render(scene, execution_bool, status_str)
+
+            if narration is not None:
+                scene = self._apply_narration(scene, *await narration)
+
+        return scene
+
+    @staticmethod
+    def _same_plan(streamed_scene: Optional[Scene], scene: Scene) -> bool:
+        # A scene streamed from the Planner is only as good as the final plan's, if the repaired answer changed it
+        # the work already started on it is dropped
+        return streamed_scene is not None and streamed_scene.model_dump(exclude={"stage_hashes"}) == scene.model_dump(exclude={"stage_hashes"})
+
+    def _scene_k(self, scene: Scene) -> int:
+        if isinstance(self.speculative_k, dict):
+            return self.speculative_k.get(scene.id, 1)
+        return self.speculative_k
+
+    def _stale_stages(self, scene: Scene) -> List[str]:
+        stale_stages = scene.stale_stages()
+        # A render whose video went missing has to be redone even though its code didn't change
+        if not stale_stages and not os.path.exists(scene.video_path):
+            stale_stages = ["render"]
+        if self.narrator is not None and (scene.is_stale("narration") or not os.path.exists(scene.audio_path)):
+            stale_stages = stale_stages + ["narration"]
+        return stale_stages
+
+    @staticmethod
+    def _planner_input(topic: str):
+        return [{"role": "user", "content": f"Explain the concept of '{topic}'"}]
+
+    @staticmethod
+    def _storyboarder_input(scene: Scene):
+        return [{"role": "user", "content": f"Storyboard this scene: {json.dumps(scene.model_dump(exclude=AGENT_EXCLUDED_FIELDS))}"}]
+
+    @staticmethod
+    def _animator_input(scene: Scene):
+        content = f"Write manim code for this scene: {json.dumps(scene.model_dump(exclude=AGENT_EXCLUDED_FIELDS))}"
+        if scene.audio_duration:
+            content += (
+                f"\nThe narration of this scene lasts {scene.audio_duration:.1f} seconds: "
+                "time the animations (their run_time and the waits) to add up to about that long."
+            )
+        return [{"role": "user", "content": content}]
+
+    def narrate(self, scene: Scene, video_output_dir: Union[str, os.PathLike]) -> tuple[bool, str]:
+        """Speak the scene's script to `scene_<id>.wav`, same contract as `Narrator.narrate`."""
+        with span("stage.narration") as current:
+            execution_bool, status_str = self.narrator.narrate(scene.script, os.path.join(video_output_dir, f"scene_{scene.id}.wav"))
+            current.set(success=execution_bool)
+        return execution_bool, status_str
+
+    @staticmethod
+    def _scene_video_path(scene: Scene, video_output_dir: Union[str, os.PathLike]) -> str:
+        return os.path.join(video_output_dir, f"scene_{scene.id}.mp4")
+
+    @staticmethod
+    def _apply_storyboard(scene: Scene, storyboarder_output: StoryboarderOutput) -> Scene:
+        return scene.mark_done("storyboard").model_copy(update={
+            "storyboard": storyboarder_output.storyboard,
+            "animation_instructions": storyboarder_output.animation_instruction
+        })
+
+    @staticmethod
+    def _apply_animation(scene: Scene, animator_output: AnimatorOutput) -> Scene:
+        scene = scene.model_copy(update={
+            "manim_code": animator_output.manim_code,
+            "video_path": animator_output.video_path,
+        })
+        # The Animator renders as part of its retry loop, an empty video path means every attempt failed
+        return scene.mark_done("animation", "render") if animator_output.video_path else scene
+
+    @staticmethod
+    def _apply_narration(scene: Scene, execution_bool: bool, status_str: str) -> Scene:
+        if not execution_bool:
+            print(f"[Scene {scene.id}] Narration failed, the scene stays silent:\n{status_str[-100:]}")
+            return scene
+        return scene.mark_done("narration").model_copy(update={"audio_path": status_str, "audio_duration": audio_duration(status_str)})
+
+    @staticmethod
+    def _apply_render(scene: Scene, execution_bool: bool, status_str: str) -> Scene:
+        if not execution_bool:
+            print(f"[Scene {scene.id}] Re-render failed:\n{status_str[-100:]}")
+            return scene
+        return scene.mark_done("render").model_copy(update={"video_path": status_str})
+
+    def assemble(self, agent_state: AgentState, video_output_dir: Union[str, os.PathLike]) -> AgentState:
+        """Join the rendered scenes (in scene order) into the final video, with their narration when they have one."""
+        scenes = [scene for scene in agent_state.scenes if scene.video_path and os.path.exists(scene.video_path)]
+        if len(scenes) < len(agent_state.scenes):
+            print(f"Assembling {len(scenes)}/{len(agent_state.scenes)} scenes, the rest failed to render")
+
+        scene_paths = [scene.video_path for scene in scenes]
+        audio_paths = [scene.audio_path if scene.audio_path and os.path.exists(scene.audio_path) else None for scene in scenes]
+        with span("assemble", scenes=len(scene_paths), narrated=sum(1 for audio_path in audio_paths if audio_path)):
+            execution_bool, status_str = assemble_video(scene_paths, os.path.join(video_output_dir, "final.mp4"), audio_paths if any(audio_paths) else None)
+        if execution_bool:
+            agent_state.final_video_path = status_str
+        else:
+            print(status_str)
+        return agent_state
+
+    def structured_output_stats(self) -> Dict[str, Dict[str, int]]:
+        """How each agent's outputs were parsed, see `BaseAgent.output_stats`."""
+        return {agent.agent_name: dict(agent.output_stats) for agent in (self.planner, self.storyboarder, self.animator)}
+
+    def print_report(self, scene_count: int, seconds: float) -> None:
+        print(f"Rendered {scene_count} scenes in {seconds:.1f}s")
+        if self.cache is not None:
+            print(f"Completion cache: {self.cache.stats}")
+        print(f"Structured output paths: {self.structured_output_stats()}")
+        if self.animator.renderer is not None:
+            print(f"Render queue: {self.animator.renderer.report()}")
+        if self.animator.speculation_reports:
+            print(f"Speculation saved {sum(report['saved_seconds'] for report in self.animator.speculation_reports):.1f}s of tail latency")
+
+    def _start_preview(self, agent_state: AgentState, video_output_dir: str, dirty_scenes: List[Scene]) -> Optional[PreviewStream]:
+        if not self.preview:
+            return None
+        preview = PreviewStream(os.path.join(video_output_dir, "preview"), [scene.id for scene in agent_state.scenes])
+        # Scenes that are already up to date can be watched right away
+        dirty_ids = {scene.id for scene in dirty_scenes}
+        for scene in agent_state.scenes:
+            if scene.id not in dirty_ids:
+                preview.add_scene(scene.id, scene.video_path)
+        return preview
+
+    @staticmethod
+    def _checkpoint(store: StateStore) -> Callable[[Scene], None]:
+        return lambda scene: store.append_scenes([scene])
+
+    def load(self, thread_id: str) -> Optional[AgentState]:
+        """The last durable state of a thread, e.g. to edit a scene before calling `rerun`."""
+        return StateStore(os.path.join(self.output_root, thread_id)).load()
+
+    def run(self, topic: str, thread_id: str) -> AgentState:
+        # An interrupted run picks up from its last completed stage instead of planning again
+        agent_state = self.load(thread_id)
+        if agent_state is not None and agent_state.scenes:
+            print(f"Resuming thread {thread_id} from its saved state")
+        elif self.stream:
+            return self._stream_run(topic, thread_id)
+        else:
+            agent_state = self.plan(topic, thread_id)
+        return self.rerun(agent_state)
+
+    def _stream_run(self, topic: str, thread_id: str) -> AgentState:
+        """`plan` + `rerun` with the scenes started while the Planner is still writing the later ones."""
+        video_output_dir = os.path.join(self.output_root, thread_id)
+        with trace_scope(thread_id=thread_id), span("rerun"), StateStore(video_output_dir) as store:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                started: Dict[int, tuple[Scene, Future]] = {}
+                checkpoint = StreamedCheckpoint(store)
+
+                def on_scene(scene: Scene) -> None:
+                    print(f"Planner has written scene {scene.id}, starting on it")
+                    started[scene.id] = (scene, executor.submit(contextvars.copy_context().run, self.run_scene, scene.model_copy(), video_output_dir, checkpoint))
+
+                with span("plan", stream=True):
+                    planner_output: PlannerOutput = self.planner.stream_scenes(self._planner_input(topic), on_scene)
+                print("Planner has generated the script")
+
+                agent_state = AgentState(thread_id=thread_id, topic=topic, scenes=planner_output.scenes)
+                checkpoint.commit(agent_state, self._kept_ids(agent_state, started))
+                return self._rerun(agent_state, video_output_dir, store, executor=executor, started=started)
+
+    def _kept_ids(self, agent_state: AgentState, started: Dict[int, tuple]) -> Set[int]:
+        """The streamed scenes the final plan kept as they were, the work already started on them carries on."""
+        final_scenes = {scene.id: scene for scene in agent_state.scenes}
+        return {
+            scene_id for scene_id, (streamed_scene, _) in started.items()
+            if scene_id in final_scenes and self._same_plan(streamed_scene, final_scenes[scene_id])
+        }
+
+    def rerun(self, agent_state: AgentState) -> AgentState:
+        """
+        Bring every scene of an existing state up to date, then re-assemble the final video.
+        Scenes whose stages are all current are skipped, so a fresh plan renders everything
+        while an edit to one scene only recomputes that scene.
+        """
+        video_output_dir = os.path.join(self.output_root, agent_state.thread_id)
+        with trace_scope(thread_id=agent_state.thread_id), span("rerun"), StateStore(video_output_dir) as store:
+            store.reset(agent_state)
+            return self._rerun(agent_state, video_output_dir, store)
+
+    def _rerun(
+        self,
+        agent_state: AgentState,
+        video_output_dir: str,
+        store: StateStore,
+        executor: Optional[ThreadPoolExecutor] = None,
+        started: Optional[Dict[int, tuple[Scene, Future]]] = None,
+    ) -> AgentState:
+        """`started` holds the scenes already running from the streamed plan, reused when the final plan kept them as is."""
+        dirty_scenes = [scene for scene in agent_state.scenes if self._stale_stages(scene)]
+        print(f"{len(dirty_scenes)}/{len(agent_state.scenes)} scenes need work")
+
+        start = time.perf_counter()
+        preview = self._start_preview(agent_state, video_output_dir, dirty_scenes)
+        with nullcontext(executor) if executor is not None else ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {}
+            for scene in dirty_scenes:
+                streamed_scene, future = (started or {}).get(scene.id, (None, None))
+                if future is not None and not self._same_plan(streamed_scene, scene):
+                    # Both runs would write the same scene files, the outdated one has to be out of the way first
+                    if not future.cancel():
+                        wait([future])
+                    future = None
+                if future is None:
+                    # Run each scene in a copy of this context, so its spans land in this run's trace
+                    future = executor.submit(contextvars.copy_context().run, self.run_scene, scene.model_copy(), video_output_dir, self._checkpoint(store))
+                futures[future] = scene.id
+
+            # Scenes the final plan dropped: stopped if they haven't started, waited for before assembling otherwise
+            orphans = [future for _, future in (started or {}).values() if future not in futures and not future.cancel()]
+
+            # Fold the scenes back in the order they finish, the reducer keeps them sorted by id
+            for future in as_completed(futures):
+                scene_id = futures[future]
+                try:
+                    updated_scene = future.result()
+                except Exception as e:
+                    print(f"[Scene {scene_id}] Failed: {e}")
+                    if preview is not None:
+                        preview.add_scene(scene_id, None)
+                    continue
+
+                agent_state.scenes = merge_scenes(agent_state.scenes, [updated_scene])
+                store.append_scenes([updated_scene])
+                if preview is not None:
+                    preview.add_scene(updated_scene.id, updated_scene.video_path)
+            wait(orphans)
+
+        self.print_report(len(dirty_scenes), time.perf_counter() - start)
+
+        if preview is not None:
+            preview.close()
+
+        if dirty_scenes or not os.path.exists(agent_state.final_video_path):
+            self.assemble(agent_state, video_output_dir)
+            store.append_meta(agent_state)
+        return agent_state
+
+    async def arun(self, topic: str, thread_id: str) -> AgentState:
+        """Same as `run`, but every scene shares the caller's event loop instead of a thread each."""
+        agent_state = self.load(thread_id)
+        if agent_state is not None and agent_state.scenes:
+            print(f"Resuming thread {thread_id} from its saved state")
+        elif self.stream:
+            return await self._astream_run(topic, thread_id)
+        else:
+            agent_state = await self.aplan(topic, thread_id)
+        return await self.arerun(agent_state)
+
+    async def _astream_run(self, topic: str, thread_id: str) -> AgentState:
+        video_output_dir = os.path.join(self.output_root, thread_id)
+        with trace_scope(thread_id=thread_id), span("rerun"), StateStore(video_output_dir) as store:
+            loop = asyncio.get_running_loop()
+            # Shared with the scenes `_arerun` starts, `max_concurrency` bounds them all
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            started: Dict[int, tuple[Scene, asyncio.Task]] = {}
+            checkpoint = StreamedCheckpoint(store)
+
+            async def bounded_run_scene(scene: Scene):
+                async with semaphore:
+                    return await self.arun_scene(scene, video_output_dir, checkpoint)
+
+            def on_scene(scene: Scene) -> None:
+                print(f"Planner has written scene {scene.id}, starting on it")
+                started[scene.id] = (scene, asyncio.ensure_future(bounded_run_scene(scene.model_copy())))
+
+            with span("plan", stream=True):
+                # With a sync client the Planner streams on a worker thread, the tasks are created on the loop
+                planner_output: PlannerOutput = await self.planner.astream_scenes(
+                    self._planner_input(topic), lambda scene: loop.call_soon_threadsafe(on_scene, scene)
+                )
+            # Let the callbacks scheduled by the last chunks run
+            await asyncio.sleep(0)
+            print("Planner has generated the script")
+
+            agent_state = AgentState(thread_id=thread_id, topic=topic, scenes=planner_output.scenes)
+            checkpoint.commit(agent_state, self._kept_ids(agent_state, started))
+            return await self._arerun(agent_state, video_output_dir, store, started=started, semaphore=semaphore)
+
+    async def arerun(self, agent_state: AgentState) -> AgentState:
+        video_output_dir = os.path.join(self.output_root, agent_state.thread_id)
+        with trace_scope(thread_id=agent_state.thread_id), span("rerun"), StateStore(video_output_dir) as store:
+            store.reset(agent_state)
+            return await self._arerun(agent_state, video_output_dir, store)
+
+    async def _arerun(
+        self,
+        agent_state: AgentState,
+        video_output_dir: str,
+        store: StateStore,
+        started: Optional[Dict[int, tuple[Scene, asyncio.Task]]] = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+    ) -> AgentState:
+        dirty_scenes = [scene for scene in agent_state.scenes if self._stale_stages(scene)]
+        print(f"{len(dirty_scenes)}/{len(agent_state.scenes)} scenes need work")
+
+        semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
+
+        start = time.perf_counter()
+        preview = self._start_preview(agent_state, video_output_dir, dirty_scenes)
+
+        async def bounded_run_scene(scene: Scene):
+            async with semaphore:
+                return await self.arun_scene(scene, video_output_dir, self._checkpoint(store))
+
+        async def scene_result(scene_id: int, task):
+            # as_completed drops which scene a result belongs to, a failure still has to name its scene
+            try:
+                return scene_id, await task, None
+            except Exception as e:
+                return scene_id, None, e
+
+        tasks, used = [], set()
+        for scene in dirty_scenes:
+            streamed_scene, task = (started or {}).get(scene.id, (None, None))
+            if task is not None and not self._same_plan(streamed_scene, scene):
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                task = None
+            used.add(task)
+            tasks.append(scene_result(scene.id, task or bounded_run_scene(scene.model_copy())))
+
+        # Scenes the final plan dropped would otherwise keep running, and rendering, for nothing
+        orphans = [task for _, task in (started or {}).values() if task not in used]
+        for task in orphans:
+            task.cancel()
+        await asyncio.gather(*orphans, return_exceptions=True)
+
+        for result in asyncio.as_completed(tasks):
+            scene_id, updated_scene, error = await result
+            if error is not None:
+                print(f"[Scene {scene_id}] Failed: {error}")
+                if preview is not None:
+                    await asyncio.to_thread(preview.add_scene, scene_id, None)
+                continue
+
+            agent_state.scenes = merge_scenes(agent_state.scenes, [updated_scene])
+            store.append_scenes([updated_scene])
+            if preview is not None:
+                # Remuxing into segments is file IO, keep it off the event loop
+                await asyncio.to_thread(preview.add_scene, updated_scene.id, updated_scene.video_path)
+
+        self.print_report(len(dirty_scenes), time.perf_counter() - start)
+
+        if preview is not None:
+            await asyncio.to_thread(preview.close)
+
+        if dirty_scenes or not os.path.exists(agent_state.final_video_path):
+            await asyncio.to_thread(self.assemble, agent_state, video_output_dir)
+            store.append_meta(agent_state)
+        return agent_state
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    with RenderPool(n_workers=int(os.getenv("RENDER_WORKERS", "2"))) as render_pool:
+        pipeline = Pipeline(
+            Groq(),
+            max_concurrency=int(os.getenv("SCENE_CONCURRENCY", "4")),
+            cache=CompletionCache(),
+            render_pool=render_pool,
+            renderer=RenderScheduler(pool=render_pool),
+            speculative_k=int(os.getenv("SPECULATIVE_K", "1")),
+            preview=os.getenv("PREVIEW_STREAM", "0") != "0",
+            stream=os.getenv("STREAM_COMPLETIONS", "0") != "0",
+            narrator=Narrator() if os.getenv("NARRATION", "0") != "0" else None,
+        )
+        pipeline.run("Pythagoras theorem", thread_id="test-thread")
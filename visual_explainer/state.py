@@ -1,6 +1,23 @@
+import hashlib
+import json
 from typing import Annotated, Dict, List, Literal, Optional, TypedDict, Union
 
 from pydantic import BaseModel, Field
+from pydantic.json_schema import SkipJsonSchema
+
+# The scene fields each stage consumes, in pipeline order: plan/script -> storyboard -> manim_code -> video
+STAGE_INPUTS: Dict[str, tuple] = {
+    "storyboard": ("scene_plan", "script"),
+    "animation": ("storyboard", "animation_instructions"),
+    "render": ("manim_code",),
+    # A side branch off the script, it runs next to the others instead of in line with them
+    "narration": ("script",),
+}
+STAGES = ["storyboard", "animation", "render"]
+
+
+def content_hash(*values) -> str:
+    return hashlib.sha256(json.dumps(values).encode("utf-8")).hexdigest()[:16]
 
 
 class Scene(BaseModel):
@@ -20,8 +37,31 @@ class Scene(BaseModel):
     
     # Generated using the code given by the animator; format will be "{thread_id}_segment{id}.mp4"
     audio_path: str = Field(default="", description="Path to where the final generated script audio file for this scene is at")
+    # Seconds of narration, the length the Animator aims the scene at
+    audio_duration: SkipJsonSchema[float] = Field(default=0.0)
     video_path: str = Field(default="", description="Path to where the final rendered video file of this scene is stored at")
 
+    # Bookkeeping only, hidden from the LLMs: hash of the inputs each stage consumed when it last completed
+    stage_hashes: SkipJsonSchema[Dict[str, str]] = Field(default_factory=dict)
+
+    def input_hash(self, stage: str) -> str:
+        return content_hash(*(getattr(self, field) for field in STAGE_INPUTS[stage]))
+
+    def is_stale(self, stage: str) -> bool:
+        return self.stage_hashes.get(stage) != self.input_hash(stage)
+
+    def stale_stages(self) -> List[str]:
+        """The first stage whose inputs changed since it last ran, and every stage downstream of it."""
+        for i, stage in enumerate(STAGES):
+            if self.is_stale(stage):
+                return STAGES[i:]
+        return []
+
+    def mark_done(self, *stages: str) -> "Scene":
+        return self.model_copy(update={
+            "stage_hashes": {**self.stage_hashes, **{stage: self.input_hash(stage) for stage in stages}}
+        })
+
 
 def merge_scenes(old_scenes: List[Scene], new_scenes: List[Scene]) -> List[Scene]:
     merged_scenes_dict = {scene.id: scene for scene in old_scenes}
@@ -40,6 +80,8 @@ def merge_scenes(old_scenes: List[Scene], new_scenes: List[Scene]) -> List[Scene
         old_scene.manim_code = new_scene.manim_code
         old_scene.video_path = new_scene.video_path
         old_scene.audio_path = new_scene.audio_path
+        old_scene.audio_duration = new_scene.audio_duration
+        old_scene.stage_hashes = new_scene.stage_hashes
             
     return sorted(merged_scenes_dict.values(), key=lambda x: x.id)
 
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+from typing import List, Optional, Union
+
+from visual_explainer.state import AgentState, Scene, merge_scenes
+
+
+class StateStore:
+    """
+    Durable per-thread store for the AgentState.
+    Every `merge_scenes` delta is appended to a JSONL journal (fsync'd in batches), and the journal is
+    periodically compacted into a snapshot. `load` rebuilds the full state from the snapshot plus the
+    journal, so an interrupted run can resume from the last completed stage.
+    """
+    def __init__(
+        self,
+        thread_dir: Union[str, os.PathLike],
+        fsync_every: int = 8,
+        fsync_interval: float = 1.0,
+        compact_every: int = 64,
+    ):
+        self.thread_dir = thread_dir
+        self.journal_path = os.path.join(thread_dir, "journal.jsonl")
+        self.snapshot_path = os.path.join(thread_dir, "snapshot.json")
+
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+
+        self._lock = threading.Lock()
+        self._state: Optional[AgentState] = None
+        self._journal = None
+        self._pending_fsync = 0
+        self._last_fsync = time.monotonic()
+        self._records_since_snapshot = 0
+
+        os.makedirs(thread_dir, exist_ok=True)
+
+    def __repr__(self):
+        return f"StateStore(dir={self.thread_dir}, records_since_snapshot={self._records_since_snapshot})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def load(self) -> Optional[AgentState]:
+        """Rebuild the last durable state, or None for a thread that was never saved."""
+        with self._lock:
+            state = None
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, "r") as f:
+                    state = AgentState.model_validate_json(f.read())
+
+            good_offset = 0
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, "rb") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            # A torn write from a crash, everything before it is intact
+                            break
+                        state = self._apply(state, record)
+                        good_offset += len(line)
+                        self._records_since_snapshot += 1
+
+                # Drop the torn tail so new records don't get appended after garbage
+                if good_offset < os.path.getsize(self.journal_path):
+                    with open(self.journal_path, "r+b") as f:
+                        f.truncate(good_offset)
+
+            self._state = state
+            return state.model_copy(deep=True) if state else None
+
+    @staticmethod
+    def _apply(state: Optional[AgentState], record: dict) -> Optional[AgentState]:
+        if record["op"] == "meta":
+            meta = {key: value for key, value in record.items() if key != "op"}
+            if state is None:
+                return AgentState(**meta)
+            return state.model_copy(update=meta)
+
+        if record["op"] == "scenes" and state is not None:
+            new_scenes = [Scene.model_validate(scene) for scene in record["scenes"]]
+            state.scenes = merge_scenes(state.scenes, new_scenes)
+        return state
+
+    def reset(self, agent_state: AgentState) -> None:
+        """Start the thread over from `agent_state` (a fresh plan, or a state edited by a reviewer)."""
+        with self._lock:
+            self._state = agent_state.model_copy(deep=True)
+            self._compact()
+
+    def append_meta(self, agent_state: AgentState) -> None:
+        self._append({
+            "op": "meta",
+            "thread_id": agent_state.thread_id,
+            "topic": agent_state.topic,
+            "final_video_path": agent_state.final_video_path,
+        })
+
+    def append_scenes(self, scenes: List[Scene]) -> None:
+        self._append({"op": "scenes", "scenes": [scene.model_dump() for scene in scenes]})
+
+    def _append(self, record: dict) -> None:
+        with self._lock:
+            self._state = self._apply(self._state, record)
+
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a")
+            self._journal.write(json.dumps(record) + "\n")
+            self._journal.flush()
+            self._pending_fsync += 1
+            self._records_since_snapshot += 1
+
+            if self._pending_fsync >= self.fsync_every or time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._fsync()
+            if self._records_since_snapshot >= self.compact_every:
+                self._compact()
+
+    def _fsync(self) -> None:
+        if self._journal is not None and self._pending_fsync:
+            os.fsync(self._journal.fileno())
+        self._pending_fsync = 0
+        self._last_fsync = time.monotonic()
+
+    def _compact(self) -> None:
+        """Write the full state as a new snapshot (atomically), then empty the journal."""
+        if self._state is None:
+            return
+
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(self._state.model_dump_json(indent=4))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        # Replaying a journal record that is already in the snapshot is harmless, so a crash
+        # between the rename and the truncate loses nothing
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, "w")
+        self._pending_fsync = 0
+        self._records_since_snapshot = 0
+
+    def flush(self) -> None:
+        with self._lock:
+            self._fsync()
+
+    def close(self) -> None:
+        with self._lock:
+            self._compact()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
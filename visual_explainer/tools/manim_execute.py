@@ -1,54 +1,330 @@
+import contextvars
 import glob
 import os
 import shutil
 import subprocess
-import tempfile
-from typing import Union
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional, Tuple, Union
 
+from visual_explainer.tracing import span
 
-def execute_manim_code(code, scene_id: int, video_path: Union[str, os.PathLike], timeout: int = 30) -> tuple[bool, str]:
-    """With a True boolean, you get the video_path. With false, you get the error associated to the code rendering."""
-    
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_script = os.path.join(temp_dir, f"script_scene_{scene_id}.py")
-        
-        with open(temp_script, "w") as f:
-            f.write(code) 
-        
+from .manim_segments import animation_ranges, serial_reason
+from .manim_validate import count_animations
+from .render_cache import default_render_cache
+from .render_pool import CANCELLED_MESSAGE, RenderLimits, RenderPool, final_videos, partial_movies
+from .render_timeout import ProgressWatch, RenderBudget
+from .video_assembly import concat_stream_copy
+
+# Processes a CLI render of one scene may be split over, by ranges of its animations
+RENDER_SEGMENTS = int(os.getenv("RENDER_SEGMENTS", "1"))
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+class RenderStalled(Exception):
+    pass
+
+
+def _drain(stream, chunks: list, watch: Optional[ProgressWatch]) -> None:
+    # Read what is available as it comes, tqdm redraws its bars with "\r" and never ends the line
+    for chunk in iter(lambda: os.read(stream.fileno(), 4096), b""):
+        text = chunk.decode("utf-8", errors="replace")
+        chunks.append(text)
+        if watch is not None:
+            watch.feed(text)
+
+
+def _run_manim(command: list, cwd: str, timeout: float, cancel_event: Optional[threading.Event] = None, limits: Optional[RenderLimits] = None, watch: Optional[ProgressWatch] = None) -> subprocess.CompletedProcess:
+    """
+    `subprocess.run` that can also be stopped early through `cancel_event`, or by `watch` when no new
+    animation shows up in Manim's progress output for too long. The process is killed either way.
+    """
+    with span("manim.spawn"):
+        env = limits.env() if limits is not None else None
+        process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        if limits is not None:
+            limits.apply_to(process.pid)
+
+    stdout, stderr = [], []
+    readers = [
+        threading.Thread(target=_drain, args=(process.stdout, stdout, None), daemon=True),
+        threading.Thread(target=_drain, args=(process.stderr, stderr, watch), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    deadline = time.monotonic() + timeout
+    with span("manim.render", pid=process.pid) as current:
         try:
-            res = subprocess.run(
-                ["manim", "-ql", "-v", "WARNING", f"script_scene_{scene_id}.py"],
-                cwd=temp_dir, 
-                capture_output=True,
-                text=True,
-                timeout=timeout
-            )
-            
-            if res.returncode == 0:
-                generated_videos = glob.glob(os.path.join(temp_dir, "media", "**", "*.mp4"), recursive=True)
-                
-                if generated_videos:
-                    os.makedirs(os.path.dirname(video_path), exist_ok=True)     # Check if the folder exists first, otherwise we get the No Directory found error
-
-                    # Then move the first found video to our controlled path
-                    shutil.move(generated_videos[0], video_path)
-                    
-                    print(f"[Scene {scene_id}] Video successfully saved to: {video_path}\n")
-                    return True, video_path
-                else:
-                    print(f"[{scene_id}] Error: Manim code executed successfully but no .mp4 file was generated.")
-                    return False, "Error: Manim code executed successfully but no .mp4 file was generated."
+            while True:
+                try:
+                    process.wait(timeout=0.25)
+                    break
+                except subprocess.TimeoutExpired:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise RenderCancelled()
+                    if watch is not None and watch.stalled():
+                        current.set(stalled=True, animations=watch.animations)
+                        raise RenderStalled()
+                    if time.monotonic() > deadline:
+                        raise
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            for reader in readers:
+                reader.join(timeout=5)
+            process.stdout.close()
+            process.stderr.close()
+
+        current.set(returncode=process.returncode)
+        return subprocess.CompletedProcess(command, process.returncode, "".join(stdout), "".join(stderr))
+
+
+def execute_manim_code(code, scene_id: int, video_path: Union[str, os.PathLike], timeout: Optional[float] = None, quality: str = "l", use_cache: bool = True, pool: Optional[RenderPool] = None, cancel_event: Optional[threading.Event] = None, limits: Optional[RenderLimits] = None, segments: Optional[int] = None) -> tuple[bool, str]:
+    """
+    With a True boolean, you get the video_path. With false, you get the error associated to the code rendering.
+    Without a `timeout`, the render gets a budget from the scene's estimated length (see `RenderBudget`), and
+    either way it is stopped early once no new animation finishes for a while.
+    Setting `cancel_event` kills the render early and returns `CANCELLED_MESSAGE`.
+    Attempts at a scene share its work dir (see `scene_work_dir`), which is removed once the video is accepted.
+    `limits` pins the render process to a set of cores and caps its memory (see `RenderScheduler`).
+    With `segments` > 1 (default `RENDER_SEGMENTS`), a CLI render is split over that many processes by
+    animation ranges and the parts are joined by stream copy; scenes with time-dependent or random state render serially.
+    """
+    with span("manim.execute", quality=quality, pool=pool is not None) as current:
+        execution_bool, status_str = _execute_manim_code(code, scene_id, video_path, timeout, quality, use_cache, pool, cancel_event, limits, segments or RENDER_SEGMENTS)
+        current.set(success=execution_bool, cancelled=status_str == CANCELLED_MESSAGE)
+        return execution_bool, status_str
+
+
+def reuse_cached_render(code, scene_id: int, video_path: Union[str, os.PathLike], quality: str = "l") -> bool:
+    """
+    The exact same code was already rendered at this quality: places that video at `video_path` and returns True.
+    Checked before the dry run too, a cached scene needs neither a manim process nor a validation.
+    """
+    render_cache = default_render_cache()
+    with span("manim.cache_lookup") as lookup:
+        cache_hit = render_cache.get(render_cache.make_key(code, f"-q{quality}"), video_path)
+        lookup.set(hit=cache_hit)
+    if cache_hit:
+        print(f"[Scene {scene_id}] Reused cached render: {video_path}\n")
+    return cache_hit
+
+
+def _execute_manim_code(code, scene_id: int, video_path: Union[str, os.PathLike], timeout: Optional[float], quality: str, use_cache: bool, pool: Optional[RenderPool], cancel_event: Optional[threading.Event], limits: Optional[RenderLimits], segments: int) -> tuple[bool, str]:
+    quality_flag = f"-q{quality}"
+
+    # The exact same code was already rendered at this quality, reuse that video instead of running manim again
+    if use_cache:
+        render_cache = default_render_cache()
+        cache_key = render_cache.make_key(code, quality_flag)
+        if reuse_cached_render(code, scene_id, video_path, quality):
+            return True, video_path
+
+    budget = RenderBudget(code, quality)
+    if timeout:
+        budget.timeout = timeout
+    watch = ProgressWatch(budget)
+
+    work_dir = scene_work_dir(video_path)
+    _prepare_work_dir(work_dir)
+    started_at = time.time()
+    ranges = _animation_ranges(code, scene_id, segments) if pool is None else None
+
+    # A warm worker skips the interpreter start-up and the manim import of a fresh CLI process
+    if pool is not None:
+        with span("manim.render", worker_pool=True):
+            execution_bool, status_str = pool.render(code, scene_id, video_path, quality=quality, timeout=budget.timeout, cancel_event=cancel_event, limits=limits, watch=watch, work_dir=work_dir)
+    elif ranges:
+        execution_bool, status_str = _render_cli_segments(code, scene_id, video_path, quality_flag, work_dir, ranges, budget, cancel_event, limits)
+    else:
+        execution_bool, status_str = _render_cli(code, scene_id, video_path, quality_flag, work_dir, watch, cancel_event, limits)
+
+    if execution_bool:
+        # The wall time of a split render says little about the speed of a single process
+        if not ranges:
+            budget.observe(watch.render_seconds())
+        if use_cache:
+            render_cache.put(cache_key, video_path)
+        # The scene's video is accepted, its partial movies can't help another attempt anymore
+        shutil.rmtree(work_dir, ignore_errors=True)
+        print(f"[Scene {scene_id}] Video successfully saved to: {video_path}\n")
+    else:
+        for media_dir in _media_dirs(work_dir):
+            _discard_unfinished_partial(media_dir, started_at)
+        if status_str != CANCELLED_MESSAGE:
+            print(f"[{scene_id}] Execution Error:\n{status_str[-100:]}\n")
+    return execution_bool, status_str
+
+
+def scene_work_dir(video_path: Union[str, os.PathLike]) -> str:
+    """
+    Where a scene renders, next to its video: `<thread dir>/renders/scene_<id>/`. It outlives the attempt,
+    so Manim finds the partial movie files of every `play` whose hash didn't change, also on a resumed run.
+    """
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(video_path)), "renders", base_name)
+
+
+def clear_scene_work_dir(video_path: Union[str, os.PathLike]) -> None:
+    shutil.rmtree(scene_work_dir(video_path), ignore_errors=True)
+
+
+def _media_dirs(work_dir: str) -> List[str]:
+    # The whole scene's, and one per animation range of a split render
+    return [os.path.join(work_dir, "media")] + sorted(glob.glob(os.path.join(work_dir, "segments", "*", "media")))
+
+
+def _prepare_work_dir(work_dir: str) -> None:
+    os.makedirs(work_dir, exist_ok=True)
+    # A scene video left by an earlier attempt must not pass for this attempt's output
+    for media_dir in _media_dirs(work_dir):
+        for video in final_videos(media_dir):
+            os.remove(video)
+
+
+def _animation_ranges(code: str, scene_id: int, segments: int) -> Optional[List[Tuple[int, Optional[int]]]]:
+    """The animation ranges to render in parallel, None to render the scene in one process."""
+    if segments <= 1:
+        return None
+    reason = serial_reason(code)
+    if reason:
+        print(f"[Scene {scene_id}] Rendering in one process, the scene {reason}")
+        return None
+    num_animations = count_animations(code, scene_id)
+    if num_animations is None:
+        return None
+    ranges = animation_ranges(num_animations, segments)
+    return ranges if len(ranges) > 1 else None
+
+
+def _discard_unfinished_partial(media_dir: str, started_at: float) -> None:
+    """
+    Manim writes a partial movie straight to its hashed name, so a render killed or failing mid-animation
+    leaves a truncated file that the next attempt would reuse. Drop the newest partial movie of this render.
+    """
+    written = [path for path in partial_movies(media_dir) if os.path.getmtime(path) >= started_at]
+    if written:
+        os.remove(max(written, key=os.path.getmtime))
+
+
+def _render_cli(code: str, scene_id: int, video_path: Union[str, os.PathLike], quality_flag: str, work_dir: str, watch: ProgressWatch, cancel_event: Optional[threading.Event], limits: Optional[RenderLimits]) -> tuple[bool, str]:
+    temp_script = os.path.join(work_dir, f"script_scene_{scene_id}.py")
+
+    with open(temp_script, "w") as f:
+        f.write(code)
+
+    try:
+        res = _run_manim(
+            ["manim", quality_flag, "-v", "WARNING", f"script_scene_{scene_id}.py"],
+            cwd=work_dir,
+            timeout=watch.budget.timeout,
+            cancel_event=cancel_event,
+            limits=limits,
+            watch=watch,
+        )
+
+        if res.returncode == 0:
+            generated_videos = final_videos(os.path.join(work_dir, "media"))
+
+            if generated_videos:
+                os.makedirs(os.path.dirname(video_path), exist_ok=True)     # Check if the folder exists first, otherwise we get the No Directory found error
+
+                # Then move the video of this render to our controlled path
+                with span("manim.move"):
+                    shutil.move(max(generated_videos, key=os.path.getmtime), video_path)
+                return True, video_path
             else:
-                error_msg = res.stderr or res.stdout
-                print(f"[{scene_id}] Execution Error:\n{error_msg[-100:]}\n")
-                return False, f"Error:\n{error_msg}"
+                return False, "Error: Manim code executed successfully but no .mp4 file was generated."
+        else:
+            error_msg = res.stderr or res.stdout
+            return False, f"Error:\n{error_msg}"
+
+    except RenderCancelled:
+        return False, CANCELLED_MESSAGE
+    except RenderStalled:
+        print(f"[{scene_id}] Render stalled after {watch.animations} animations")
+        return False, watch.stall_message()
+    except subprocess.TimeoutExpired:
+        return False, watch.timeout_message()
+    except Exception as e:
+        return False, f"System error during execution: {str(e)}"
+
+
+def _render_cli_segments(code: str, scene_id: int, video_path: Union[str, os.PathLike], quality_flag: str, work_dir: str, ranges: List[Tuple[int, Optional[int]]], budget: RenderBudget, cancel_event: Optional[threading.Event], limits: Optional[RenderLimits]) -> tuple[bool, str]:
+    """
+    Render each animation range in a process of its own with Manim's `-n start,end`, then join the parts.
+    Every part is Manim's stream copy of its partial movies, so the joined video has the same packets as a serial render.
+    """
+    script_name = f"script_scene_{scene_id}.py"
+    with open(os.path.join(work_dir, script_name), "w") as f:
+        f.write(code)
 
+    # Stops the other parts as soon as one fails, or when the whole render is cancelled
+    stop_event = threading.Event()
+
+    def render_segment(start: int, end: Optional[int]) -> tuple[bool, str]:
+        # A media dir per range: the parts would overwrite each other's scene video and partial movie list
+        media_dir = os.path.join(work_dir, "segments", f"{start}-{end if end is not None else 'end'}", "media")
+        watch = ProgressWatch(budget)
+        try:
+            res = _run_manim(
+                ["manim", quality_flag, "-v", "WARNING", "--media_dir", media_dir, "-n", f"{start},{end}" if end is not None else str(start), script_name],
+                cwd=work_dir,
+                timeout=budget.timeout,
+                cancel_event=stop_event,
+                limits=limits,
+                watch=watch,
+            )
+            if res.returncode != 0:
+                return False, f"Error:\n{res.stderr or res.stdout}"
+            generated_videos = final_videos(media_dir)
+            if not generated_videos:
+                return False, f"Error: Manim rendered animations {start} to {end if end is not None else 'the end'} but no .mp4 file was generated."
+            return True, max(generated_videos, key=os.path.getmtime)
+        except RenderCancelled:
+            return False, CANCELLED_MESSAGE
+        except RenderStalled:
+            return False, watch.stall_message()
         except subprocess.TimeoutExpired:
-            return False, f"Execution timed out. Code took longer than {timeout} seconds to execute, revise the code accordingly, keeping the details of the old scene in mind."
+            return False, watch.timeout_message()
         except Exception as e:
-            return False, f"System error during execution: {str(e)}"
-               
-             
+            # E.g. no manim executable: same contract as the serial render, and the other parts stop right away
+            stop_event.set()
+            return False, f"Error:\nSystem error during execution: {str(e)}"
+
+    with span("manim.segments", segments=len(ranges)), ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, render_segment, start, end) for start, end in ranges]
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            failed = any(not future.result()[0] for future in done)
+            if failed or (cancel_event is not None and cancel_event.is_set()):
+                stop_event.set()
+        results = [future.result() for future in futures]
+
+    if cancel_event is not None and cancel_event.is_set():
+        return False, CANCELLED_MESSAGE
+    # The first real error, not the parts that were stopped because of it
+    errors = [status_str for execution_bool, status_str in results if not execution_bool and status_str != CANCELLED_MESSAGE]
+    if errors:
+        return False, errors[0]
+
+    try:
+        os.makedirs(os.path.dirname(video_path), exist_ok=True)
+        with span("manim.move", segments=len(ranges)):
+            concat_stream_copy([segment_path for _, segment_path in results], video_path)
+    except Exception as e:
+        return False, f"System error while joining the rendered segments: {str(e)}"
+    print(f"[Scene {scene_id}] Rendered animation ranges {ranges} in {len(ranges)} processes")
+    return True, video_path
+
+
 if __name__ == "__main__":
     code = """
 from manim import *
@@ -0,0 +1,187 @@
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# The safe region the Animator prompt asks every mobject to stay in
+SAFE_X = float(os.getenv("LAYOUT_SAFE_X", "6"))
+SAFE_Y = float(os.getenv("LAYOUT_SAFE_Y", "3"))
+# `to_edge`/`to_corner` leave MED_LARGE_BUFF to the frame's edge, which is where the prompt puts titles: tolerated
+EDGE_BUFF = 0.5
+# Labels that only touch are fine, text boxes overlapping by more than this share of the smaller one are not
+OVERLAP_FRACTION = 0.1
+MAX_REPORTED = 5
+# First line of the feedback, which tells a layout failure apart from an error of the code
+FEEDBACK_HEADER = "The code runs, but the layout check found problems:"
+
+Box = Tuple[float, float, float, float]  # (x_min, x_max, y_min, y_max)
+
+
+def out_of_frame(box: Box, region: Box) -> bool:
+    x_min, x_max, y_min, y_max = region
+    return box[0] < x_min - 1e-3 or box[1] > x_max + 1e-3 or box[2] < y_min - 1e-3 or box[3] > y_max + 1e-3
+
+
+def overlap_area(a: Box, b: Box) -> float:
+    width = min(a[1], b[1]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[2], b[2])
+    return width * height if width > 0 and height > 0 else 0.0
+
+
+def overlaps(a: Box, b: Box) -> bool:
+    smaller = min((a[1] - a[0]) * (a[3] - a[2]), (b[1] - b[0]) * (b[3] - b[2]))
+    return smaller > 0 and overlap_area(a, b) > OVERLAP_FRACTION * smaller
+
+
+def find_violations(animation: int, region: Box, boxes: List[tuple[str, Box]], text_boxes: List[tuple[str, Box]]) -> List[Dict]:
+    """
+    Violations in one frame: `boxes` are the mobjects on screen, `text_boxes` the Text/MathTex among them
+    (and inside their groups), each with its description. `animation` is the play/wait the frame follows.
+    """
+    violations = [
+        {"kind": "out_of_frame", "animation": animation, "mobjects": [name], "box": [round(v, 2) for v in box]}
+        for name, box in boxes if out_of_frame(box, region)
+    ]
+    for i, (name_a, box_a) in enumerate(text_boxes):
+        for name_b, box_b in text_boxes[i + 1:]:
+            if overlaps(box_a, box_b):
+                violations.append({"kind": "overlap", "animation": animation, "mobjects": [name_a, name_b], "area": round(overlap_area(box_a, box_b), 2)})
+    return violations
+
+
+def format_violations(violations: List[Dict]) -> str:
+    """The violations as feedback for the Animator's next attempt."""
+    region = f"x in [-{SAFE_X:g}, {SAFE_X:g}], y in [-{SAFE_Y:g}, {SAFE_Y:g}]"
+    lines = [FEEDBACK_HEADER]
+    for violation in violations[:MAX_REPORTED]:
+        step = f"After self.play/self.wait call #{violation['animation'] + 1}"
+        if violation["kind"] == "out_of_frame":
+            x_min, x_max, y_min, y_max = violation["box"]
+            lines.append(f"- {step}, {violation['mobjects'][0]} spans x in [{x_min}, {x_max}], y in [{y_min}, {y_max}], outside the safe region {region}.")
+        else:
+            lines.append(f"- {step}, {violation['mobjects'][0]} overlaps {violation['mobjects'][1]}.")
+    if len(violations) > MAX_REPORTED:
+        lines.append(f"- ... and {len(violations) - MAX_REPORTED} more.")
+    lines.append("Reposition or rescale these mobjects (next_to, arrange, to_edge, scale_to_fit_width) and keep the rest of the scene as it is.")
+    return "\n".join(lines)
+
+
+def is_layout_error(status_str: str) -> bool:
+    """Whether a failed validation was failed by the layout check only."""
+    return FEEDBACK_HEADER in status_str
+
+
+class LayoutRecorder:
+    """
+    Hooked into a dry-run scene's renderer: after every play/wait (a wait is played as a `Wait` animation)
+    it measures the mobjects on screen, whose animations have jumped to their end state, and keeps the violations.
+    """
+    def __init__(self, scene, script_path: str):
+        from manim import MarkupText, Paragraph, SingleStringMathTex, Text, ThreeDScene
+
+        self.scene = scene
+        self.script_path = os.path.abspath(script_path)
+        self.text_types = (Text, MarkupText, SingleStringMathTex, Paragraph)
+        self.violations: List[Dict] = []
+        self._seen = set()
+        # Projected 3D mobjects have no flat bounding box to check
+        self.enabled = not isinstance(scene, ThreeDScene)
+
+        play = scene.renderer.play
+
+        def play_and_measure(*args, **kwargs):
+            result = play(*args, **kwargs)
+            if self.enabled:
+                try:
+                    self.measure(scene.renderer.num_plays - 1)
+                except Exception as e:
+                    # The layout check never fails a scene that renders
+                    print(f"[Layout] Measuring skipped: {e}", file=sys.stderr)
+                    self.enabled = False
+            return result
+        scene.renderer.play = play_and_measure
+
+    def _region(self) -> Box:
+        from manim import config
+
+        frame = getattr(self.scene.camera, "frame", None)
+        center_x, center_y, scale_x, scale_y = 0.0, 0.0, 1.0, 1.0
+        if frame is not None:
+            # MovingCameraScene: the region moves and zooms with the camera
+            center_x, center_y = (float(v) for v in frame.get_center()[:2])
+            scale_x, scale_y = frame.width / config.frame_width, frame.height / config.frame_height
+        half_x, half_y = (SAFE_X + EDGE_BUFF) * scale_x, (SAFE_Y + EDGE_BUFF) * scale_y
+        return center_x - half_x, center_x + half_x, center_y - half_y, center_y + half_y
+
+    def _names(self) -> Dict[int, str]:
+        """Variable names of the scene's mobjects, from the script's frames calling play and from `self.<attr>`."""
+        names = {id(value): f"self.{name}" for name, value in vars(self.scene).items()}
+        frame = sys._getframe()
+        while frame is not None:
+            if os.path.abspath(frame.f_code.co_filename) == self.script_path:
+                for name, value in frame.f_locals.items():
+                    if name != "self":
+                        names.setdefault(id(value), name)
+            frame = frame.f_back
+        return names
+
+    def _describe(self, mobject, names: Dict[int, str]) -> str:
+        text = getattr(mobject, "tex_string", None) or getattr(mobject, "text", None)
+        kind = f"{type(mobject).__name__} {text[:40]!r}" if isinstance(text, str) else type(mobject).__name__
+        name = names.get(id(mobject))
+        return f"`{name}` ({kind})" if name else kind
+
+    @staticmethod
+    def _visible(mobject) -> bool:
+        if not len(mobject.points):
+            return False
+        # Plain Mobjects (a ValueTracker keeps its value in its points) are never drawn
+        if not hasattr(mobject, "get_fill_opacity"):
+            return hasattr(mobject, "pixel_array")
+        stroked = mobject.get_stroke_opacity() > 0 and mobject.get_stroke_width() > 0
+        return stroked or mobject.get_fill_opacity() > 0
+
+    def _box(self, mobject) -> Optional[Box]:
+        import numpy as np
+
+        points = [sub.points for sub in mobject.get_family() if self._visible(sub)]
+        if not points:
+            return None
+        points = np.concatenate(points)
+        (x_min, y_min), (x_max, y_max) = points[:, :2].min(axis=0), points[:, :2].max(axis=0)
+        return float(x_min), float(x_max), float(y_min), float(y_max)
+
+    def _texts(self, mobject) -> List:
+        if isinstance(mobject, self.text_types):
+            return [mobject]
+        return [text for sub in mobject.submobjects for text in self._texts(sub)]
+
+    def measure(self, animation: int) -> None:
+        names = self._names()
+        boxes, text_boxes, text_ids = [], [], set()
+        for mobject in self.scene.mobjects:
+            box = self._box(mobject)
+            if box is None:
+                continue
+            boxes.append((self._describe(mobject, names), box))
+            for text in self._texts(mobject):
+                # A label added on its own and again in a group is one label, not two overlapping ones
+                if id(text) in text_ids:
+                    continue
+                text_ids.add(id(text))
+                text_box = self._box(text)
+                if text_box is not None:
+                    text_boxes.append((self._describe(text, names), text_box))
+
+        for violation in find_violations(animation, self._region(), boxes, text_boxes):
+            # A mobject stays out of frame over several animations, report it once
+            key = (violation["kind"], tuple(violation["mobjects"]))
+            if key not in self._seen:
+                self._seen.add(key)
+                self.violations.append(violation)
+
+
+if __name__ == "__main__":
+    region = (-SAFE_X - EDGE_BUFF, SAFE_X + EDGE_BUFF, -SAFE_Y - EDGE_BUFF, SAFE_Y + EDGE_BUFF)
+    title, label, axes = (-2.0, 2.0, 3.0, 3.5), (1.5, 3.0, 3.1, 3.4), (-7.5, 5.0, -3.0, 2.5)
+    violations = find_violations(2, region, [("`axes` (Axes)", axes)], [("`title` (Text 'Area')", title), ("`label` (MathTex 'a^2')", label)])
+    print(format_violations(violations))
@@ -0,0 +1,81 @@
+import ast
+from typing import List, Optional, Tuple
+
+# Calls whose effect depends on the time that passed, which a segment skipping its first animations doesn't replay
+TIME_DEPENDENT_CALLS = {
+    "add_updater": "an updater",
+    "always_redraw": "always_redraw",
+    "always": "an always() updater",
+    "f_always": "an f_always() updater",
+    "turn_animation_into_updater": "an animation turned into an updater",
+    "cycle_animation": "a cycled animation",
+    "begin_ambient_camera_rotation": "an ambient camera rotation",
+    "add_sound": "a sound track",
+}
+
+# Sources of state that differs from one process to the next
+NON_DETERMINISTIC_MODULES = {"random", "time", "datetime", "uuid", "secrets"}
+
+# Manim's `-n start,end` treats an end of 0 as "no end", so every segment spans at least two animations
+MIN_SEGMENT_ANIMATIONS = 2
+
+
+def serial_reason(code: str) -> Optional[str]:
+    """Why the scene has to be rendered in one process, or None when its animations can be rendered in any split."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return f"SyntaxError: {e.msg}"
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            name = node.func.attr if isinstance(node.func, ast.Attribute) else getattr(node.func, "id", "")
+            if name in TIME_DEPENDENT_CALLS:
+                return f"uses {TIME_DEPENDENT_CALLS[name]}"
+            # random_color(), random_bright_color(), ...
+            if name.startswith("random_"):
+                return f"uses {name}()"
+
+        # import random / from datetime import datetime / np.random.rand()
+        if isinstance(node, ast.Import):
+            modules = [alias.name.split(".")[0] for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [(node.module or "").split(".")[0]]
+        elif isinstance(node, ast.Attribute) and node.attr == "random":
+            modules = ["random"]
+        else:
+            modules = []
+        unsafe = [module for module in modules if module in NON_DETERMINISTIC_MODULES]
+        if unsafe:
+            return f"uses the {unsafe[0]} module"
+    return None
+
+
+def animation_ranges(num_animations: int, segments: int) -> List[Tuple[int, Optional[int]]]:
+    """
+    Split animations 0..num_animations-1 into at most `segments` contiguous (start, end) ranges, both ends
+    included as with Manim's `-n start,end`. The last range is open (end None) and renders to the end of the scene.
+    """
+    segments = max(1, min(segments, num_animations // MIN_SEGMENT_ANIMATIONS))
+    size, extra = divmod(num_animations, segments)
+
+    ranges, start = [], 0
+    for index in range(segments):
+        end = start + size + (1 if index < extra else 0) - 1
+        ranges.append((start, end if index < segments - 1 else None))
+        start = end + 1
+    return ranges
+
+
+if __name__ == "__main__":
+    code = """
+from manim import *
+
+class VideoScene(Scene):
+    def construct(self):
+        dot = Dot()
+        dot.add_updater(lambda mob, dt: mob.shift(RIGHT * dt))
+        self.play(Create(dot))
+    """
+    print(serial_reason(code))
+    print(animation_ranges(9, 4))
@@ -0,0 +1,216 @@
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import visual_explainer
+from visual_explainer.tracing import span
+
+from .manim_layout import format_violations
+from .render_pool import RenderPool, _find_scene_class
+
+# The dry run executes `python -m visual_explainer.tools.manim_validate`, make sure the child can import the package
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(visual_explainer.__file__)))
+
+# The dry run reports the animations it played (waits included) and the layout violations, as JSON on a line of its own
+REPORT_PREFIX = "DRY_RUN "
+MAX_DRY_RUNS = 1024
+# Reports by code hash, shared by every thread validating or rendering
+_dry_runs: "OrderedDict[str, Dict]" = OrderedDict()
+_dry_runs_lock = threading.Lock()
+
+# Out-of-frame and overlapping text fail the validation (and so go back to the Animator) unless this is 0.
+# They are heuristics: a scene gets at most LAYOUT_RETRIES attempts for them, after that it renders as it is
+LAYOUT_CHECK = os.getenv("LAYOUT_CHECK", "1") != "0"
+LAYOUT_RETRIES = int(os.getenv("LAYOUT_RETRIES", "1"))
+
+
+def _is_scene_base(base: ast.expr) -> bool:
+    # Scene, MovingCameraScene, ThreeDScene, manim.Scene, ...
+    name = base.attr if isinstance(base, ast.Attribute) else getattr(base, "id", "")
+    return name.endswith("Scene")
+
+
+def check_structure(code: str) -> Optional[str]:
+    """AST check for the structure the Animator prompt asks for. Returns the problem, or None if the code looks right."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return f"SyntaxError: {e.msg} (line {e.lineno})\n{(e.text or '').rstrip()}"
+
+    has_manim_import = any(
+        isinstance(node, ast.ImportFrom) and node.module == "manim" and any(alias.name == "*" for alias in node.names)
+        for node in tree.body
+    )
+    if not has_manim_import:
+        return "The code must start with `from manim import *`."
+
+    scene_classes = [
+        node for node in tree.body
+        if isinstance(node, ast.ClassDef) and any(_is_scene_base(base) for base in node.bases)
+    ]
+    if not scene_classes:
+        return "The code must define a class inheriting from `Scene` (named `VideoScene`)."
+
+    for scene_class in scene_classes:
+        if any(isinstance(node, ast.FunctionDef) and node.name == "construct" for node in scene_class.body):
+            return None
+    return f"The class `{scene_classes[0].name}` must define a `construct(self)` method."
+
+
+def check_compile(code: str, scene_id: int) -> Optional[str]:
+    # Catches what the parser lets through, e.g. `return` outside a function or misplaced `nonlocal`
+    try:
+        compile(code, f"script_scene_{scene_id}.py", "exec")
+    except SyntaxError as e:
+        return f"SyntaxError: {e.msg} (line {e.lineno})\n{(e.text or '').rstrip()}"
+    return None
+
+
+def dry_run(code: str, scene_id: int, timeout: int = 20, pool: Optional[RenderPool] = None) -> Optional[str]:
+    """
+    Execute `construct` with animations skipped and no file output, in a separate process:
+    a warm worker of the `pool` when there is one, otherwise a fresh interpreter. Returns the error, if any.
+    """
+    if pool is not None:
+        execution_bool, status_str = pool.dry_run(code, scene_id, timeout=timeout)
+        if not execution_bool:
+            return status_str
+        _remember(code, json.loads(status_str))
+        return None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_script = os.path.join(temp_dir, f"script_scene_{scene_id}.py")
+        with open(temp_script, "w") as f:
+            f.write(code)
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [PACKAGE_ROOT, env.get("PYTHONPATH")]))
+        try:
+            res = subprocess.run(
+                [sys.executable, "-m", "visual_explainer.tools.manim_validate", temp_script],
+                cwd=temp_dir,
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+                env=env,
+            )
+        except subprocess.TimeoutExpired:
+            return f"Execution timed out. Code took longer than {timeout} seconds to execute, revise the code accordingly, keeping the details of the old scene in mind."
+
+        if res.returncode != 0:
+            return res.stderr or res.stdout
+
+    for line in res.stdout.splitlines():
+        if line.startswith(REPORT_PREFIX):
+            _remember(code, json.loads(line[len(REPORT_PREFIX):]))
+    return None
+
+
+def _code_key(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def _remember(code: str, report: Dict) -> None:
+    with _dry_runs_lock:
+        _dry_runs[_code_key(code)] = report
+        _dry_runs.move_to_end(_code_key(code))
+        while len(_dry_runs) > MAX_DRY_RUNS:
+            _dry_runs.popitem(last=False)
+
+
+def _report(code: str, scene_id: int, timeout: int, pool: Optional[RenderPool]) -> Dict:
+    with _dry_runs_lock:
+        report = _dry_runs.get(_code_key(code))
+    if report is None:
+        # Normally the validation before the render already ran it
+        dry_run(code, scene_id, timeout=timeout, pool=pool)
+        with _dry_runs_lock:
+            report = _dry_runs.get(_code_key(code))
+    return report or {}
+
+
+def count_animations(code: str, scene_id: int, timeout: int = 20, pool: Optional[RenderPool] = None) -> Optional[int]:
+    """`self.play` and `self.wait` calls the scene makes, as numbered by Manim's `-n`. None if the dry run fails."""
+    return _report(code, scene_id, timeout, pool).get("num_plays")
+
+
+def layout_violations(code: str, scene_id: int, timeout: int = 20, pool: Optional[RenderPool] = None) -> Optional[List[Dict]]:
+    """
+    Out-of-frame mobjects and overlapping Text/MathTex after each play/wait of the dry run, as dicts with
+    the `kind`, the `animation` index and the `mobjects` involved. None if the dry run fails.
+    """
+    return _report(code, scene_id, timeout, pool).get("layout")
+
+
+def check_layout(code: str, scene_id: int, timeout: int = 20, pool: Optional[RenderPool] = None) -> Optional[str]:
+    # Measured by the dry run that just passed, this costs no extra process
+    violations = layout_violations(code, scene_id, timeout=timeout, pool=pool)
+    return format_violations(violations) if violations else None
+
+
+def validate_manim_code(code: str, scene_id: int, timeout: int = 20, enforce_layout: bool = LAYOUT_CHECK, pool: Optional[RenderPool] = None) -> tuple[bool, str]:
+    """
+    Cheap checks before a full render, from the cheapest to the most expensive one.
+    Same contract as `execute_manim_code`: (True, "") when the code may be rendered, (False, error) otherwise.
+    Without `enforce_layout`, a bad layout is only reported, the code still goes to the render.
+    With a `pool`, the dry run runs on one of its warm workers.
+    """
+    checks = [
+        ("structure", lambda: check_structure(code)),
+        ("compile", lambda: check_compile(code, scene_id)),
+        ("dry_run", lambda: dry_run(code, scene_id, timeout=timeout, pool=pool)),
+    ]
+    if enforce_layout:
+        checks.append(("layout", lambda: check_layout(code, scene_id, timeout=timeout, pool=pool)))
+    for name, check in checks:
+        with span(f"validate.{name}") as current:
+            error_msg = check()
+            current.set(passed=not error_msg)
+        if error_msg:
+            print(f"[{scene_id}] Validation Error:\n{error_msg[-100:]}\n")
+            return False, f"Error:\n{error_msg}"
+
+    violations = None if enforce_layout else layout_violations(code, scene_id, timeout=timeout, pool=pool)
+    if violations:
+        print(f"[{scene_id}] Rendering despite {len(violations)} layout violation(s):\n{format_violations(violations)}")
+    return True, ""
+
+
+def dry_run_report(script_path: str) -> Dict:
+    """Run the script's scene with animations skipped, in this process. Returns its animation count and layout violations."""
+    from manim import tempconfig
+
+    from visual_explainer.tools.manim_layout import LayoutRecorder
+
+    with tempfile.TemporaryDirectory() as media_dir:
+        job_config = {
+            "dry_run": True,
+            "media_dir": media_dir,
+            "input_file": script_path,
+            "verbosity": "WARNING",
+            "progress_bar": "none",
+            "disable_caching": True,
+        }
+        with tempconfig(job_config):
+            module_name = os.path.splitext(os.path.basename(script_path))[0]
+            namespace = {"__name__": module_name, "__file__": script_path}
+            with open(script_path) as f:
+                exec(compile(f.read(), script_path, "exec"), namespace)
+
+            # Animations jump straight to their end state, no frame is ever drawn or encoded
+            scene = _find_scene_class(namespace)(skip_animations=True)
+            # Bounding boxes after every play/wait, in place of rendering and looking at frames
+            recorder = LayoutRecorder(scene, script_path)
+            scene.render()
+            return {"num_plays": scene.renderer.num_plays, "layout": recorder.violations}
+
+
+if __name__ == "__main__":
+    print(f"{REPORT_PREFIX}{json.dumps(dry_run_report(sys.argv[1]))}")
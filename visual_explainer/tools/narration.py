@@ -0,0 +1,186 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
+
+import av
+
+from .render_cache import _place
+
+NARRATION_CACHE_DIR = os.path.join(os.path.abspath(os.path.curdir), "outputs", "cache", "narration")
+
+# Speaking rate of the engines, and of the stand-in's clip lengths
+WORDS_PER_MINUTE = int(os.getenv("TTS_WORDS_PER_MINUTE", "160"))
+STAND_IN_SAMPLE_RATE = 16000
+
+
+def audio_duration(audio_path: Union[str, os.PathLike]) -> float:
+    """Length of an audio file in seconds, from its container or else from its decoded samples."""
+    with av.open(str(audio_path)) as container:
+        if container.duration:
+            return container.duration / av.time_base
+        stream = container.streams.audio[0]
+        return sum(frame.samples for frame in container.decode(stream)) / stream.rate
+
+
+class TTSBackend:
+    """A local text-to-speech engine. `synthesize` writes the spoken `text` to `wav_path`."""
+    name = "base"
+
+    def __repr__(self):
+        return f"{type(self).__name__}(name={self.name})"
+
+    def synthesize(self, text: str, wav_path: str) -> None:
+        raise NotImplementedError
+
+
+class StandInBackend(TTSBackend):
+    """Silence as long as the text would take to read, deterministic and dependency free (tests, CI, benchmarks)."""
+    name = "stand-in"
+
+    def synthesize(self, text: str, wav_path: str) -> None:
+        seconds = max(1.0, len(text.split()) * 60 / WORDS_PER_MINUTE)
+        with wave.open(wav_path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(STAND_IN_SAMPLE_RATE)
+            wav.writeframes(b"\0\0" * int(seconds * STAND_IN_SAMPLE_RATE))
+
+
+class EspeakBackend(TTSBackend):
+    """The espeak-ng (or espeak) command line synthesizer."""
+    name = "espeak"
+
+    def __init__(self, voice: str = os.getenv("TTS_VOICE", "en-us")):
+        self.executable = shutil.which("espeak-ng") or shutil.which("espeak")
+        assert self.executable is not None, "espeak-ng or espeak has to be on the PATH"
+        self.voice = voice
+        self.name = f"espeak:{voice}"
+
+    def synthesize(self, text: str, wav_path: str) -> None:
+        subprocess.run(
+            [self.executable, "-v", self.voice, "-s", str(WORDS_PER_MINUTE), "-w", wav_path, text],
+            check=True, capture_output=True, timeout=120,
+        )
+
+
+class Pyttsx3Backend(TTSBackend):
+    """
+    pyttsx3, which drives the platform's own engine (espeak, SAPI5 or NSSpeechSynthesizer) offline.
+    The engine is bound to the thread that created it, so it is created and driven on one thread of its own.
+    """
+    name = "pyttsx3"
+
+    def __init__(self, voice: Optional[str] = os.getenv("TTS_VOICE")):
+        # One worker, so one thread for the engine's whole life, and one utterance at a time
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pyttsx3")
+        try:
+            self.engine, self.name = self._executor.submit(self._init_engine, voice).result()
+        except BaseException:
+            self._executor.shutdown(wait=False)
+            raise
+
+    @staticmethod
+    def _init_engine(voice: Optional[str]):
+        import pyttsx3
+
+        engine = pyttsx3.init()
+        engine.setProperty("rate", WORDS_PER_MINUTE)
+        if voice:
+            engine.setProperty("voice", voice)
+        return engine, f"pyttsx3:{engine.getProperty('voice')}"
+
+    def _speak(self, text: str, wav_path: str) -> None:
+        self.engine.save_to_file(text, wav_path)
+        self.engine.runAndWait()
+
+    def synthesize(self, text: str, wav_path: str) -> None:
+        self._executor.submit(self._speak, text, wav_path).result()
+
+
+def make_backend(name: Optional[str] = None) -> TTSBackend:
+    """
+    `name` (default the TTS_BACKEND env var) is pyttsx3, espeak, stand-in, or auto for the first engine available.
+    auto never picks the silent stand-in: a narrated video without a voice has to be asked for by name.
+    """
+    name = name or os.getenv("TTS_BACKEND", "auto")
+    if name == "pyttsx3":
+        return Pyttsx3Backend()
+    if name == "espeak":
+        return EspeakBackend()
+    if name == "stand-in":
+        return StandInBackend()
+    if name != "auto":
+        raise ValueError(f"Unknown TTS backend {name!r}, expected pyttsx3, espeak, stand-in or auto")
+
+    try:
+        return Pyttsx3Backend()
+    except Exception:
+        pass
+    if shutil.which("espeak-ng") or shutil.which("espeak"):
+        return EspeakBackend()
+    raise RuntimeError(
+        "No offline TTS engine found for narration: pip install pyttsx3, or install espeak-ng "
+        "(TTS_BACKEND=stand-in narrates with silence, for tests and benchmarks)"
+    )
+
+
+class Narrator:
+    """
+    Synthesizes scene scripts to WAV clips with a TTS backend. Clips are cached by the hash of the script,
+    the backend's voice and the speaking rate, so an unchanged script is never spoken twice, across scenes and threads.
+    """
+    def __init__(self, backend: Optional[TTSBackend] = None, cache_dir: Union[str, os.PathLike] = NARRATION_CACHE_DIR):
+        self.backend = backend or make_backend()
+        self.cache_dir = cache_dir
+        self.stats = {"hits": 0, "misses": 0}
+
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __repr__(self):
+        return f"Narrator(backend={self.backend}, stats={self.stats})"
+
+    def make_key(self, script: str) -> str:
+        # The rate sets the clip's length, and the scene is animated to that length
+        return hashlib.sha256("\0".join([self.backend.name, str(WORDS_PER_MINUTE), " ".join(script.split())]).encode("utf-8")).hexdigest()
+
+    def narrate(self, script: str, audio_path: Union[str, os.PathLike]) -> tuple[bool, str]:
+        """Same contract as `execute_manim_code`: (True, audio path) once the clip is at `audio_path`, (False, error) otherwise."""
+        if not script.strip():
+            return False, "Error: The scene has no script to narrate."
+
+        cached_path = os.path.join(self.cache_dir, f"{self.make_key(script)}.wav")
+        hit = os.path.exists(cached_path)
+        with self._lock:
+            self.stats["hits" if hit else "misses"] += 1
+
+        if not hit:
+            # Written next to the cache entry and moved in, a concurrent reader never sees half a clip
+            fd, temp_path = tempfile.mkstemp(suffix=".wav", dir=self.cache_dir)
+            os.close(fd)
+            try:
+                self.backend.synthesize(script, temp_path)
+                if not os.path.getsize(temp_path):
+                    return False, f"Error: {self.backend.name} produced an empty clip."
+                os.replace(temp_path, cached_path)
+            except Exception as e:
+                return False, f"Error: Narration with {self.backend.name} failed: {e}"
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        _place(cached_path, audio_path)
+        return True, str(audio_path)
+
+
+if __name__ == "__main__":
+    narrator = Narrator(StandInBackend())
+    VIDEO_OUTPUT_DIR = os.path.join(os.path.abspath(os.path.curdir), "outputs", "videos", "test-thread")
+    execution_bool, status_str = narrator.narrate("A right triangle has one angle of ninety degrees.", os.path.join(VIDEO_OUTPUT_DIR, "scene_1.wav"))
+    print(execution_bool, status_str, audio_duration(status_str) if execution_bool else None, narrator)
@@ -0,0 +1,219 @@
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Union
+
+import av
+
+from .video_assembly import _add_stream_from_template
+
+PLAYLIST_NAME = "playlist.m3u8"
+
+
+def segment_scene(
+    scene_path: Union[str, os.PathLike],
+    output_dir: Union[str, os.PathLike],
+    prefix: str,
+    segment_seconds: float,
+    max_seconds: Optional[float] = None,
+) -> Optional[List[tuple[str, float]]]:
+    """
+    Remux a scene video into MPEG-TS segments of about `segment_seconds` each, by stream copy.
+    Segments can only start on a keyframe, Manim starts every animation on one. Returns (file name, duration) pairs,
+    or None (and no segments) when the keyframes are too far apart to keep every segment within `max_seconds`.
+    """
+    segments: List[tuple[str, float]] = []
+
+    with av.open(str(scene_path)) as scene:
+        input_stream = scene.streams.video[0]
+        time_base = input_stream.time_base
+
+        output, output_stream, segment_start = None, None, None
+        segment_end = 0.0
+
+        def finish_segment():
+            output.close()
+            segments[-1] = (segments[-1][0], segment_end - segment_start)
+
+        for packet in scene.demux(input_stream):
+            # The demuxer yields an empty packet to flush, it has nothing to copy
+            if packet.dts is None:
+                continue
+            packet_time = float((packet.pts if packet.pts is not None else packet.dts) * time_base)
+            if output is not None and packet.is_keyframe and packet_time - segment_start >= segment_seconds - 1e-3:
+                finish_segment()
+                output = None
+
+            if output is None:
+                name = f"{prefix}_{len(segments):03d}.ts"
+                output = av.open(os.path.join(output_dir, name), "w", format="mpegts")
+                output_stream = _add_stream_from_template(output, input_stream)
+                segments.append((name, 0.0))
+                segment_start = packet_time
+
+            segment_end = max(segment_end, packet_time + float((packet.duration or 0) * time_base))
+            if max_seconds is not None and segment_end - segment_start > max_seconds + 1e-3:
+                output.close()
+                for name, _ in segments:
+                    os.remove(os.path.join(output_dir, name))
+                return None
+            packet.stream = output_stream
+            output.mux(packet)
+
+        if output is not None:
+            finish_segment()
+    return segments
+
+
+def add_keyframes(scene_path: Union[str, os.PathLike], output_path: Union[str, os.PathLike], every_seconds: float) -> None:
+    """Re-encode a scene's video with a keyframe every `every_seconds`, so it can be cut into segments that short."""
+    with av.open(str(scene_path)) as scene, av.open(str(output_path), "w", format="mpegts") as output:
+        input_stream = scene.streams.video[0]
+        fps = input_stream.average_rate or 15
+        keyint = max(1, round(every_seconds * fps))
+        output_stream = output.add_stream("libx264", rate=fps, options={"x264-params": f"keyint={keyint}:min-keyint={keyint}:scenecut=0"})
+        output_stream.width = input_stream.codec_context.width
+        output_stream.height = input_stream.codec_context.height
+        output_stream.pix_fmt = "yuv420p"
+
+        for index, frame in enumerate(scene.decode(input_stream)):
+            frame = frame.reformat(format="yuv420p")
+            frame.pts = index
+            frame.time_base = 1 / fps
+            output.mux(output_stream.encode(frame))
+        output.mux(output_stream.encode(None))
+
+
+class PreviewStream:
+    """
+    HLS playlist of the scenes rendered so far, for a player to start on while later scenes are still rendering.
+    Scenes are published in id order as soon as every scene before them is done (or failed), each one
+    after a discontinuity since its timestamps start over. `close` seals the playlist with an ENDLIST tag.
+    The target duration of an EVENT playlist can't change once players have read it: it is fixed to
+    `target_duration` (default twice `segment_seconds`), and a scene whose keyframes are further apart than that
+    is re-encoded with keyframes every `segment_seconds` before it is segmented.
+    """
+    def __init__(self, output_dir: Union[str, os.PathLike], scene_ids: List[int], segment_seconds: float = 4.0, target_duration: Optional[int] = None):
+        self.output_dir = output_dir
+        self.segment_seconds = segment_seconds
+        self.target_duration = target_duration or math.ceil(2 * segment_seconds)
+        assert self.target_duration >= segment_seconds, "target_duration must be at least segment_seconds"
+        self.playlist_path = os.path.join(output_dir, PLAYLIST_NAME)
+
+        self._pending = sorted(scene_ids)
+        self._ready: Dict[int, Optional[str]] = {}
+        self._entries: List[tuple[str, float, bool]] = []  # (segment, duration, discontinuity before it)
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.started_at = time.perf_counter()
+        self.time_to_first_frame: Optional[float] = None
+
+        os.makedirs(output_dir, exist_ok=True)
+        for name in os.listdir(output_dir):
+            # Segments of an earlier run of this thread
+            if name.endswith(".ts"):
+                os.remove(os.path.join(output_dir, name))
+        self._write_playlist()
+
+    def __repr__(self):
+        return f"PreviewStream(playlist={self.playlist_path}, segments={len(self._entries)}, pending={self._pending})"
+
+    def add_scene(self, scene_id: int, video_path: Optional[Union[str, os.PathLike]]) -> None:
+        """Hand over a finished scene, `video_path` None (or missing) when the scene has no video."""
+        with self._lock:
+            if video_path and not os.path.exists(video_path):
+                video_path = None
+            self._ready[scene_id] = video_path
+            self._publish()
+
+    def _publish(self) -> None:
+        published = False
+        while self._pending and self._pending[0] in self._ready:
+            scene_id = self._pending.pop(0)
+            video_path = self._ready.pop(scene_id)
+            if video_path is None:
+                print(f"[Preview] Scene {scene_id} has no video, skipping it")
+                continue
+
+            try:
+                segments = self._segment(scene_id, video_path)
+            except Exception as e:
+                print(f"[Preview] Could not segment scene {scene_id}: {e}")
+                continue
+            self._entries.extend((name, duration, i == 0 and bool(self._entries)) for i, (name, duration) in enumerate(segments))
+            published = True
+
+        if published:
+            self._write_playlist()
+            if self.time_to_first_frame is None:
+                self.time_to_first_frame = time.perf_counter() - self.started_at
+                print(f"[Preview] First frame playable after {self.time_to_first_frame:.1f}s: {self.playlist_path}")
+
+    def _segment(self, scene_id: int, video_path: Union[str, os.PathLike]) -> List[tuple[str, float]]:
+        prefix = f"scene_{scene_id}"
+        segments = segment_scene(video_path, self.output_dir, prefix, self.segment_seconds, max_seconds=self.target_duration)
+        if segments is not None:
+            return segments
+
+        # An animation longer than the target duration, without a keyframe to cut it on
+        print(f"[Preview] Scene {scene_id} has segments longer than {self.target_duration}s, re-encoding it with more keyframes")
+        keyframed_path = os.path.join(self.output_dir, f"{prefix}_keyframed.ts.tmp")
+        try:
+            add_keyframes(video_path, keyframed_path, self.segment_seconds)
+            return segment_scene(keyframed_path, self.output_dir, prefix, self.segment_seconds)
+        finally:
+            if os.path.exists(keyframed_path):
+                os.remove(keyframed_path)
+
+    def _write_playlist(self) -> None:
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{self.target_duration}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for name, duration, discontinuity in self._entries:
+            if discontinuity:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(name)
+        if self._closed:
+            lines.append("#EXT-X-ENDLIST")
+
+        # Players poll the playlist, they should never read a half-written one
+        temp_path = f"{self.playlist_path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.playlist_path)
+
+    def close(self) -> Dict[str, Optional[float]]:
+        """Seal the playlist, scenes that never arrived are left out. Returns the time-to-first-frame report."""
+        with self._lock:
+            for scene_id in self._pending:
+                self._ready.setdefault(scene_id, None)
+            self._publish()
+            self._closed = True
+            self._write_playlist()
+
+        report = {
+            "time_to_first_frame": self.time_to_first_frame,
+            "total_time": time.perf_counter() - self.started_at,
+            "segments": len(self._entries),
+        }
+        print(f"[Preview] Playlist complete: {report}")
+        return report
+
+
+if __name__ == "__main__":
+    import glob
+
+    VIDEO_OUTPUT_DIR = os.path.join(os.path.abspath(os.path.curdir), "outputs", "videos", "test-thread")
+    scene_paths = {int(path.rsplit("_", 1)[1][:-4]): path for path in glob.glob(os.path.join(VIDEO_OUTPUT_DIR, "scene_*.mp4"))}
+    preview = PreviewStream(os.path.join(VIDEO_OUTPUT_DIR, "preview"), list(scene_paths))
+    # Out of order on purpose: nothing is published until scene 1 lands
+    for scene_id in sorted(scene_paths, reverse=True):
+        preview.add_scene(scene_id, scene_paths[scene_id])
+    preview.close()
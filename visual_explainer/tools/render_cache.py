@@ -0,0 +1,116 @@
+import ast
+import hashlib
+import os
+import shutil
+import threading
+import time
+from functools import lru_cache
+from importlib import metadata
+from typing import Dict, Optional, Union
+
+RENDER_CACHE_DIR = os.path.join(os.path.abspath(os.path.curdir), "outputs", "cache", "renders")
+
+
+@lru_cache(maxsize=1)
+def manim_version() -> str:
+    try:
+        return metadata.version("manim")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def normalize_code(code: str) -> str:
+    """
+    Formatting-insensitive form of the code: comments, blank lines and whitespace
+    don't change the rendered video, so they shouldn't change the cache key either.
+    """
+    try:
+        return ast.dump(ast.parse(code))
+    except SyntaxError:
+        lines = [line.rstrip() for line in code.replace("\r\n", "\n").split("\n")]
+        return "\n".join(line for line in lines if line)
+
+
+def _place(source: str, destination: Union[str, os.PathLike]) -> None:
+    """Hard link `source` to `destination`, falling back to a copy across filesystems."""
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class RenderCache:
+    """
+    Stores rendered scene videos keyed on the normalized code, the quality flag and the Manim version.
+    The least recently used videos are evicted once the cache grows past `max_bytes`.
+    """
+    def __init__(self, cache_dir: Union[str, os.PathLike] = RENDER_CACHE_DIR, max_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __repr__(self):
+        return f"RenderCache(dir={self.cache_dir}, stats={self.stats})"
+
+    @staticmethod
+    def make_key(code: str, quality: str) -> str:
+        key_material = "\0".join([normalize_code(code), quality, manim_version()])
+        return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.mp4")
+
+    def get(self, key: str, video_path: Union[str, os.PathLike]) -> bool:
+        """On a hit, places the cached video at `video_path` and returns True."""
+        cached_path = self._path(key)
+        try:
+            _place(cached_path, video_path)
+        except FileNotFoundError:
+            with self._lock:
+                self.stats["misses"] += 1
+            return False
+
+        # mtime tracks the last use for the LRU order
+        now = time.time()
+        os.utime(cached_path, (now, now))
+        with self._lock:
+            self.stats["hits"] += 1
+        return True
+
+    def put(self, key: str, video_path: Union[str, os.PathLike]) -> None:
+        _place(video_path, self._path(key))
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries: Dict[str, os.stat_result] = {}
+            for file_name in os.listdir(self.cache_dir):
+                if file_name.endswith(".mp4"):
+                    entries[file_name] = os.stat(os.path.join(self.cache_dir, file_name))
+
+            total = sum(entry.st_size for entry in entries.values())
+            for file_name, entry in sorted(entries.items(), key=lambda item: item[1].st_mtime):
+                if total <= self.max_bytes:
+                    break
+                os.remove(os.path.join(self.cache_dir, file_name))
+                total -= entry.st_size
+                self.stats["evictions"] += 1
+
+
+_default_render_cache: Optional[RenderCache] = None
+
+
+def default_render_cache() -> RenderCache:
+    global _default_render_cache
+    if _default_render_cache is None:
+        _default_render_cache = RenderCache(
+            cache_dir=os.getenv("RENDER_CACHE_DIR", RENDER_CACHE_DIR),
+            max_bytes=int(os.getenv("RENDER_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024))),
+        )
+    return _default_render_cache
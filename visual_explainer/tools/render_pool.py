@@ -0,0 +1,400 @@
+import contextlib
+import glob
+import multiprocessing
+import os
+import queue
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+from .render_timeout import ProgressWatch
+
+# Manim's quality presets for the CLI's -q<letter> flags
+QUALITY_PRESETS = {
+    "l": "low_quality",
+    "m": "medium_quality",
+    "h": "high_quality",
+    "p": "production_quality",
+    "k": "fourk_quality",
+}
+
+CANCELLED_MESSAGE = "Render cancelled."
+
+# Sent by a worker after each finished animation, ahead of the job's result
+PROGRESS = "progress"
+# Tags a validation dry run among the render jobs sent to a worker
+DRY_RUN = "dry_run"
+
+# Thread pools that would otherwise size themselves to every core of the machine
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+
+def _mapped_bytes() -> int:
+    """Address space this process has mapped, what RLIMIT_AS counts (0 where /proc isn't there)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+class RenderLimits:
+    """The share of the machine one render may use: a set of cores and an address-space limit."""
+    def __init__(self, cores: List[int], memory_limit: Optional[int] = None):
+        self.cores = cores
+        self.memory_limit = memory_limit
+
+    def __repr__(self):
+        return f"RenderLimits(cores={self.cores}, memory_limit={self.memory_limit})"
+
+    def env(self, base: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        env = dict(os.environ if base is None else base)
+        for name in THREAD_ENV_VARS:
+            env[name] = str(len(self.cores))
+        return env
+
+    def apply_to(self, pid: int) -> None:
+        """
+        Pin a (just started) process to the cores and cap its memory. The encoder inside manim sizes its
+        thread count from the affinity mask, so pinning also caps the ffmpeg/libav threads.
+        Applied from the parent instead of a `preexec_fn`, which isn't safe with threads around.
+        """
+        if hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(pid, self.cores)
+            except OSError as e:
+                print(f"[RenderLimits] Could not pin {pid} to cores {self.cores}: {e}")
+        if self.memory_limit and hasattr(resource, "prlimit"):
+            try:
+                resource.prlimit(pid, resource.RLIMIT_AS, (self.memory_limit, self.memory_limit))
+            except (OSError, ValueError) as e:
+                print(f"[RenderLimits] Could not limit the memory of {pid}: {e}")
+
+    @contextlib.contextmanager
+    def applied(self) -> Iterator[None]:
+        """
+        The limits on this process for one job, for a warm worker that outlives it (`apply_to` is for fresh
+        processes: its hard limit could never be raised again). The memory cap is a soft limit counted from what
+        the worker already has mapped, manim and its libraries imported once for every job, and the worker gets
+        its cores and its old limit back afterwards.
+        """
+        previous_cores = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else None
+        previous_memory = resource.getrlimit(resource.RLIMIT_AS)
+        try:
+            if previous_cores is not None:
+                try:
+                    os.sched_setaffinity(0, self.cores)
+                except OSError as e:
+                    print(f"[RenderLimits] Could not pin the worker to cores {self.cores}: {e}")
+            if self.memory_limit:
+                soft, hard = _mapped_bytes() + self.memory_limit, previous_memory[1]
+                if hard != resource.RLIM_INFINITY:
+                    soft = min(soft, hard)
+                try:
+                    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+                except (OSError, ValueError) as e:
+                    print(f"[RenderLimits] Could not limit the memory of the worker: {e}")
+            yield
+        finally:
+            resource.setrlimit(resource.RLIMIT_AS, previous_memory)
+            if previous_cores is not None:
+                try:
+                    os.sched_setaffinity(0, previous_cores)
+                except OSError:
+                    pass
+
+
+def final_videos(media_dir: Union[str, os.PathLike]) -> List[str]:
+    """The scene videos Manim wrote under `media_dir`, without the partial movie files of single animations."""
+    videos = glob.glob(os.path.join(media_dir, "videos", "**", "*.mp4"), recursive=True)
+    return [video for video in videos if "partial_movie_files" not in video]
+
+
+def partial_movies(media_dir: Union[str, os.PathLike]) -> List[str]:
+    return glob.glob(os.path.join(media_dir, "videos", "**", "partial_movie_files", "**", "*.mp4"), recursive=True)
+
+
+def _find_scene_class(namespace: dict):
+    from manim import Scene
+
+    if isinstance(namespace.get("VideoScene"), type) and issubclass(namespace["VideoScene"], Scene):
+        return namespace["VideoScene"]
+
+    # Same as the CLI with a single scene in the file: render the one Scene subclass defined in the script
+    scene_classes = [
+        obj for obj in namespace.values()
+        if isinstance(obj, type) and issubclass(obj, Scene) and obj.__module__ == namespace["__name__"]
+    ]
+    if len(scene_classes) != 1:
+        raise ValueError(f"Expected exactly one Scene subclass (preferably `VideoScene`), found {len(scene_classes)}")
+    return scene_classes[0]
+
+
+def _render_job(code: str, scene_id: int, quality: str, video_path: Union[str, os.PathLike], temp_dir: str, heartbeat: Optional[Callable[[int], None]] = None) -> tuple[bool, str]:
+    """
+    Render the scene in this (already warm) process, with a config and media directory of its own.
+    `temp_dir` belongs to the parent, which removes it even when this process gets killed mid-render,
+    unless it is the scene's persistent work dir (see `scene_work_dir`).
+    `heartbeat` is called with the number of animations played after each one (a `wait` is played too).
+    """
+    from manim import tempconfig
+
+    module_name = f"script_scene_{scene_id}"
+    temp_script = os.path.join(temp_dir, f"{module_name}.py")
+    with open(temp_script, "w") as f:
+        f.write(code)
+
+    media_dir = os.path.join(temp_dir, "media")
+    job_config = {
+        "media_dir": media_dir,
+        "input_file": temp_script,
+        "quality": QUALITY_PRESETS[quality],
+        "verbosity": "WARNING",
+        "progress_bar": "none",
+    }
+    try:
+        with tempconfig(job_config):
+            namespace = {"__name__": module_name, "__file__": temp_script}
+            exec(compile(code, temp_script, "exec"), namespace)
+            scene = _find_scene_class(namespace)()
+            if heartbeat is not None:
+                play = scene.play
+
+                def play_with_heartbeat(*args, **kwargs):
+                    result = play(*args, **kwargs)
+                    heartbeat(scene.renderer.num_plays)
+                    return result
+
+                scene.play = play_with_heartbeat
+            scene.render()
+    except Exception:
+        return False, f"Error:\n{traceback.format_exc()}"
+
+    generated_videos = final_videos(media_dir)
+    if not generated_videos:
+        return False, "Error: Manim code executed successfully but no .mp4 file was generated."
+
+    os.makedirs(os.path.dirname(video_path), exist_ok=True)
+    shutil.move(max(generated_videos, key=os.path.getmtime), video_path)
+    return True, str(video_path)
+
+
+def _worker_main(conn, threads: Optional[int] = None) -> None:
+    # Thread pools are sized when their library loads, so their caps have to be in place before the imports
+    if threads:
+        for name in THREAD_ENV_VARS:
+            os.environ[name] = str(threads)
+
+    # Pay for the interpreter, the manim import and Cairo setup once per worker, not once per render
+    import manim  # noqa: F401
+
+    conn.send("ready")
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        if job[0] == DRY_RUN:
+            conn.send(_dry_run_job(*job[1:]))
+            continue
+        *render_args, limits = job
+        with limits.applied() if limits is not None else contextlib.nullcontext():
+            result = _render_job(*render_args, heartbeat=lambda num_plays: conn.send((PROGRESS, num_plays)))
+        conn.send(result)
+
+
+def _dry_run_job(code: str, scene_id: int, temp_dir: str) -> tuple[bool, str]:
+    """`manim_validate`'s dry run in this warm process: (True, its report as JSON) or (False, the traceback)."""
+    import json
+
+    from .manim_validate import dry_run_report
+
+    temp_script = os.path.join(temp_dir, f"script_scene_{scene_id}.py")
+    with open(temp_script, "w") as f:
+        f.write(code)
+    try:
+        return True, json.dumps(dry_run_report(temp_script))
+    except Exception:
+        return False, traceback.format_exc()
+
+
+class RenderWorker:
+    def __init__(self, context, startup_timeout: float = 120, threads: Optional[int] = None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, threads), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        self.threads = threads
+        self.startup_timeout = startup_timeout
+        self.jobs_done = 0
+        self._ready = False
+
+    def __repr__(self):
+        return f"RenderWorker(pid={self.process.pid}, jobs_done={self.jobs_done}, alive={self.is_alive()})"
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def _wait_ready(self) -> bool:
+        if not self._ready:
+            self._ready = self.conn.poll(self.startup_timeout) and self.conn.recv() == "ready"
+        return self._ready
+
+    def run(self, code: str, scene_id: int, quality: str, video_path: Union[str, os.PathLike], timeout: float, cancel_event: Optional[threading.Event] = None, limits: Optional[RenderLimits] = None, watch: Optional[ProgressWatch] = None, work_dir: Optional[str] = None) -> tuple[bool, str]:
+        temp_dir = work_dir or tempfile.mkdtemp()
+        try:
+            if not self._wait_ready():
+                self.kill()
+                return False, "System error during execution: render worker failed to start"
+
+            # The worker applies the job's cores and memory cap itself, and lifts them again once the job is done
+            self.conn.send((code, scene_id, quality, str(video_path), temp_dir, limits))
+            self.jobs_done += 1
+
+            # Wait in short slices so a cancelled or stalled job gives its worker back quickly
+            deadline = time.monotonic() + timeout
+            while time.monotonic() <= deadline:
+                if self.conn.poll(0.25):
+                    message = self.conn.recv()
+                    if message[0] != PROGRESS:
+                        return message
+                    if watch is not None:
+                        watch.progress(message[1])
+                    continue
+                if cancel_event is not None and cancel_event.is_set():
+                    self.kill()
+                    return False, CANCELLED_MESSAGE
+                if watch is not None and watch.stalled():
+                    self.kill()
+                    return False, watch.stall_message()
+
+            self.kill()
+            if watch is not None:
+                return False, watch.timeout_message()
+            return False, f"Execution timed out. Code took longer than {timeout} seconds to execute, revise the code accordingly, keeping the details of the old scene in mind."
+        except (EOFError, OSError):
+            # The worker died mid-render (segfault, OOM kill, ...), only this job is lost
+            self.kill()
+            return False, f"System error during execution: render worker crashed (exit code {self.process.exitcode})"
+        finally:
+            if work_dir is None:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def dry_run(self, code: str, scene_id: int, timeout: float) -> tuple[bool, str]:
+        temp_dir = tempfile.mkdtemp()
+        try:
+            if not self._wait_ready():
+                self.kill()
+                return False, "System error during execution: render worker failed to start"
+
+            self.conn.send((DRY_RUN, code, scene_id, temp_dir))
+            self.jobs_done += 1
+            if self.conn.poll(timeout):
+                return self.conn.recv()
+            self.kill()
+            return False, f"Execution timed out. Code took longer than {timeout} seconds to execute, revise the code accordingly, keeping the details of the old scene in mind."
+        except (EOFError, OSError):
+            self.kill()
+            return False, f"System error during execution: render worker crashed (exit code {self.process.exitcode})"
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def close(self) -> None:
+        if self.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(timeout=5)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class RenderPool:
+    """
+    Pool of persistent render processes that have `manim` imported already.
+    Each job renders in isolation with its own config and media directory. A worker that crashes or
+    times out is replaced, and workers are recycled after `max_jobs_per_worker` jobs to cap memory growth.
+    `threads` caps the thread pools of the workers (see `RenderLimits.env`), fixed when a worker starts.
+    """
+    def __init__(self, n_workers: int = 2, max_jobs_per_worker: int = 20, timeout: float = 30, threads: Optional[int] = None):
+        assert n_workers >= 1, "The pool needs at least one worker"
+
+        self.n_workers = n_workers
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.timeout = timeout
+        self.threads = threads
+
+        # Spawned (not forked) workers, so they never inherit the parent's threads or locks
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[RenderWorker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(n_workers):
+            self._idle.put(RenderWorker(self._context, threads=threads))
+
+    def __repr__(self):
+        return f"RenderPool(n_workers={self.n_workers}, idle={self._idle.qsize()})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def render(self, code: str, scene_id: int, video_path: Union[str, os.PathLike], quality: str = "l", timeout: Optional[float] = None, cancel_event: Optional[threading.Event] = None, limits: Optional[RenderLimits] = None, watch: Optional[ProgressWatch] = None, work_dir: Optional[str] = None) -> tuple[bool, str]:
+        """
+        Same contract as `execute_manim_code`: (True, video_path) or (False, error).
+        The job renders in `work_dir` when given (kept afterwards), otherwise in a temp dir of its own.
+        """
+        return self._on_worker(lambda worker: worker.run(code, scene_id, quality, video_path, timeout or self.timeout, cancel_event, limits, watch, work_dir), limits)
+
+    def dry_run(self, code: str, scene_id: int, timeout: Optional[float] = None) -> tuple[bool, str]:
+        """`manim_validate`'s dry run on a warm worker, without the interpreter start and manim import of a fresh process."""
+        return self._on_worker(lambda worker: worker.dry_run(code, scene_id, timeout or self.timeout))
+
+    def set_threads(self, threads: Optional[int]) -> None:
+        """Cap the thread pools of the workers, the idle ones are restarted with the cap right away."""
+        self.threads = threads
+        for _ in range(self.n_workers):
+            worker = self._idle.get()
+            if worker.threads != threads:
+                worker.close()
+                worker = RenderWorker(self._context, threads=threads)
+            self._idle.put(worker)
+
+    def _on_worker(self, job: Callable[[RenderWorker], tuple[bool, str]], limits: Optional[RenderLimits] = None) -> tuple[bool, str]:
+        assert not self._closed, "The render pool is closed"
+
+        worker = self._idle.get()
+        # Sized for more threads than the job has cores: a worker that would oversubscribe them is replaced first
+        if limits is not None and (worker.threads is None or worker.threads > len(limits.cores)):
+            worker.close()
+            worker = RenderWorker(self._context, threads=len(limits.cores))
+        try:
+            return job(worker)
+        finally:
+            if not worker.is_alive() or worker.jobs_done >= self.max_jobs_per_worker:
+                worker.close()
+                worker = RenderWorker(self._context, threads=worker.threads)
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in range(self.n_workers):
+            self._idle.get().close()
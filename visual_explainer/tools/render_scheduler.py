@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import os
+import statistics
+import threading
+import time
+from typing import Dict, List, Optional, Union
+
+from visual_explainer.tracing import span
+
+from .manim_execute import execute_manim_code
+from .render_pool import CANCELLED_MESSAGE, RenderLimits, RenderPool
+
+GiB = 1024 * 1024 * 1024
+
+
+def available_cores() -> List[int]:
+    # The cores this process may run on (containers and taskset), not every core of the host
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def available_memory() -> int:
+    """Memory that can be used without swapping, in bytes."""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+class RenderScheduler:
+    """
+    Priority queue in front of `execute_manim_code`, sized to the machine: `cores_per_render` cores and
+    `memory_per_render` bytes of available memory per concurrent render (unless `max_concurrency` says otherwise).
+    Each running render is pinned to its own cores and capped at `memory_limit` bytes of address space.
+    Lower priorities go first, by default the scene id so the opening scenes are ready first.
+    """
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        cores_per_render: int = 2,
+        memory_per_render: int = 1 * GiB,
+        memory_limit: Optional[int] = 4 * GiB,
+        pool: Optional[RenderPool] = None,
+    ):
+        cores = available_cores()
+        fits_cores = max(1, len(cores) // cores_per_render)
+        fits_memory = max(1, available_memory() // memory_per_render)
+        self.max_concurrency = max_concurrency or min(fits_cores, fits_memory)
+        self.pool = pool
+
+        # One fixed core set per slot; with more slots than the cores allow, neighbouring slots share cores
+        self._slot_limits = [
+            RenderLimits([cores[(slot * cores_per_render + i) % len(cores)] for i in range(min(cores_per_render, len(cores)))], memory_limit)
+            for slot in range(self.max_concurrency)
+        ]
+        self._free_slots = list(range(self.max_concurrency))
+        if pool is not None:
+            # The warm workers' thread pools were sized at start-up, they are restarted sized to a slot's cores
+            pool.set_threads(len(self._slot_limits[0].cores))
+        self._queue: List[tuple] = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+        self.jobs: List[Dict[str, Union[int, float, bool]]] = []
+        print(f"[RenderScheduler] {self.max_concurrency} concurrent renders ({len(cores)} cores, {available_memory() / GiB:.1f} GiB available)")
+
+    def __repr__(self):
+        return f"RenderScheduler(max_concurrency={self.max_concurrency}, queued={len(self._queue)}, free_slots={len(self._free_slots)})"
+
+    def _acquire(self, priority: float, cancel_event: Optional[threading.Event]) -> Optional[int]:
+        """Wait until this job is the most urgent one and a slot is free. None if it was cancelled while queued."""
+        with self._condition:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._queue, entry)
+            while not (self._free_slots and self._queue[0] == entry):
+                if cancel_event is not None and cancel_event.is_set():
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._condition.notify_all()
+                    return None
+                self._condition.wait(timeout=0.25)
+
+            heapq.heappop(self._queue)
+            slot = self._free_slots.pop()
+            # The next job in line may be able to take another free slot
+            self._condition.notify_all()
+            return slot
+
+    def _release(self, slot: int) -> None:
+        with self._condition:
+            self._free_slots.append(slot)
+            self._condition.notify_all()
+
+    def render(
+        self,
+        code: str,
+        scene_id: int,
+        video_path: Union[str, os.PathLike],
+        priority: Optional[float] = None,
+        quality: str = "l",
+        timeout: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> tuple[bool, str]:
+        """Same contract as `execute_manim_code`. `priority` defaults to the scene id."""
+        priority = scene_id if priority is None else priority
+
+        queued_at = time.perf_counter()
+        with span("render.queue", priority=priority):
+            slot = self._acquire(priority, cancel_event)
+        queue_wait = time.perf_counter() - queued_at
+        if slot is None:
+            return False, CANCELLED_MESSAGE
+
+        started_at = time.perf_counter()
+        try:
+            execution_bool, status_str = execute_manim_code(
+                code, scene_id=scene_id, video_path=video_path, timeout=timeout, quality=quality,
+                pool=self.pool, cancel_event=cancel_event, limits=self._slot_limits[slot],
+            )
+        finally:
+            self._release(slot)
+        render_time = time.perf_counter() - started_at
+
+        with self._condition:
+            self.jobs.append({"scene_id": scene_id, "priority": priority, "queue_wait": queue_wait, "render_time": render_time, "success": execution_bool})
+        print(f"[Scene {scene_id}] Waited {queue_wait:.1f}s for a render slot, rendered in {render_time:.1f}s")
+        return execution_bool, status_str
+
+    def report(self) -> Dict[str, float]:
+        """Queue wait versus render time over every job so far (seconds)."""
+        with self._condition:
+            waits = [job["queue_wait"] for job in self.jobs]
+            renders = [job["render_time"] for job in self.jobs]
+        if not self.jobs:
+            return {"jobs": 0}
+        return {
+            "jobs": len(waits),
+            "queue_wait_mean": statistics.mean(waits),
+            "queue_wait_max": max(waits),
+            "render_time_mean": statistics.mean(renders),
+            "render_time_max": max(renders),
+            "queue_share": sum(waits) / (sum(waits) + sum(renders) or 1),
+        }
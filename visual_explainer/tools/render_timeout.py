@@ -0,0 +1,216 @@
+import ast
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+# Wall-clock seconds of rendering per second of video, until a render at that quality has been measured
+DEFAULT_RENDER_SPEEDS = {"l": 1.0, "m": 2.5, "h": 6.0, "p": 10.0, "k": 20.0}
+
+# Interpreter start-up and the manim import of a CLI render, before its first animation
+STARTUP_SECONDS = float(os.getenv("RENDER_STARTUP_SECONDS", "15"))
+# Head room over the estimate, the AST can't see loops with a dynamic bound or updaters
+TIMEOUT_MARGIN = float(os.getenv("RENDER_TIMEOUT_MARGIN", "3"))
+MIN_STALL_SECONDS = float(os.getenv("RENDER_MIN_STALL_SECONDS", "10"))
+
+# tqdm description of Manim's progress bar, printed when an animation starts: "Animation 3: Create(Square)"
+ANIMATION_PROGRESS = re.compile(r"Animation (\d+)")
+
+# Manim's default `run_time` of a play and duration of a wait
+DEFAULT_DURATION = 1.0
+
+
+def _number(node: Optional[ast.expr]) -> Optional[float]:
+    try:
+        value = ast.literal_eval(node) if node is not None else None
+    except ValueError:
+        return None
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _keyword(call: ast.Call, name: str) -> Optional[ast.expr]:
+    return next((keyword.value for keyword in call.keywords if keyword.arg == name), None)
+
+
+def _call_duration(call: ast.Call) -> Optional[float]:
+    """Seconds of video a `play(...)` or `wait(...)` call adds, None for any other call."""
+    if not isinstance(call.func, ast.Attribute):
+        return None
+
+    if call.func.attr == "wait":
+        duration = _number(call.args[0]) if call.args else _number(_keyword(call, "duration"))
+        return DEFAULT_DURATION if duration is None else duration
+
+    if call.func.attr == "play":
+        run_time = _number(_keyword(call, "run_time"))
+        if run_time is not None:
+            return run_time
+        # Without its own run_time a play lasts as long as its longest animation
+        animation_run_times = [
+            _number(_keyword(arg, "run_time")) for arg in call.args if isinstance(arg, ast.Call)
+        ]
+        return max([value for value in animation_run_times if value is not None], default=DEFAULT_DURATION)
+    return None
+
+
+def _loop_count(loop: ast.For) -> int:
+    # for _ in range(n) with a literal n, anything else is counted once
+    if isinstance(loop.iter, ast.Call) and getattr(loop.iter.func, "id", None) == "range":
+        bounds = [_number(arg) for arg in loop.iter.args]
+        if bounds and all(bound is not None for bound in bounds):
+            start, stop = (0, bounds[0]) if len(bounds) == 1 else (bounds[0], bounds[1])
+            step = bounds[2] if len(bounds) > 2 and bounds[2] else 1
+            return max(0, int((stop - start) // step))
+    if isinstance(loop.iter, (ast.List, ast.Tuple)):
+        return len(loop.iter.elts)
+    return 1
+
+
+class SceneEstimate:
+    def __init__(self, seconds: float = 0.0, longest: float = 0.0, animations: int = 0):
+        self.seconds = seconds
+        self.longest = longest
+        self.animations = animations
+
+    def __repr__(self):
+        return f"SceneEstimate(seconds={self.seconds:.1f}, longest={self.longest:.1f}, animations={self.animations})"
+
+
+def estimate_scene(code: str) -> SceneEstimate:
+    """
+    Static estimate of the video length: the sum of every `play(run_time=...)` and `wait(...)`, loops
+    over a literal `range` counted that many times. Values the AST can't tell default to Manim's 1 second.
+    """
+    estimate = SceneEstimate()
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return estimate
+
+    def visit(node: ast.AST, repeat: int) -> None:
+        if isinstance(node, ast.For):
+            repeat *= _loop_count(node)
+        if isinstance(node, ast.Call):
+            duration = _call_duration(node)
+            if duration is not None:
+                estimate.seconds += duration * repeat
+                estimate.longest = max(estimate.longest, duration)
+                estimate.animations += repeat
+        for child in ast.iter_child_nodes(node):
+            visit(child, repeat)
+
+    visit(tree, 1)
+    return estimate
+
+
+class RenderSpeed:
+    """Exponential moving average of the render time per second of video, for each quality."""
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.speeds: Dict[str, float] = dict(DEFAULT_RENDER_SPEEDS)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"RenderSpeed({self.speeds})"
+
+    def get(self, quality: str) -> float:
+        with self._lock:
+            return self.speeds.get(quality, DEFAULT_RENDER_SPEEDS["h"])
+
+    def observe(self, quality: str, video_seconds: float, render_seconds: float) -> None:
+        # Scenes of a second or two are mostly fixed costs, they would overstate the speed
+        if video_seconds < 2:
+            return
+        with self._lock:
+            speed = render_seconds / video_seconds
+            previous = self.speeds.get(quality)
+            self.speeds[quality] = speed if previous is None else self.alpha * speed + (1 - self.alpha) * previous
+
+
+render_speed = RenderSpeed()
+
+
+class RenderBudget:
+    """
+    How long a render may take as a whole (`timeout`) and between two finished animations (`stall_timeout`),
+    from the scene's estimated length and the measured render speed of its quality.
+    """
+    def __init__(self, code: str, quality: str = "l", startup: float = STARTUP_SECONDS, margin: float = TIMEOUT_MARGIN):
+        self.estimate = estimate_scene(code)
+        self.quality = quality
+        speed = render_speed.get(quality)
+        self.timeout = startup + margin * speed * max(self.estimate.seconds, DEFAULT_DURATION)
+        self.stall_timeout = max(MIN_STALL_SECONDS, margin * speed * self.estimate.longest)
+        self.startup = startup
+
+    def __repr__(self):
+        return f"RenderBudget(timeout={self.timeout:.0f}s, stall_timeout={self.stall_timeout:.0f}s, {self.estimate})"
+
+    def observe(self, render_seconds: float) -> None:
+        render_speed.observe(self.quality, self.estimate.seconds, render_seconds)
+
+
+class ProgressWatch:
+    """Heartbeats of a running render: the index of the last animation seen and when it was seen."""
+    def __init__(self, budget: RenderBudget):
+        self.budget = budget
+        self.started_at = time.monotonic()
+        self.first_progress_at: Optional[float] = None
+        self.last_progress_at = self.started_at
+        self.animations = 0
+        self._lock = threading.Lock()
+
+    def progress(self, animations: int) -> None:
+        with self._lock:
+            if animations > self.animations or self.first_progress_at is None:
+                now = time.monotonic()
+                self.first_progress_at = self.first_progress_at or now
+                self.last_progress_at = now
+                self.animations = max(self.animations, animations)
+
+    def feed(self, output: str) -> None:
+        """Scan a chunk of Manim's stderr for its progress bars."""
+        indices = [int(index) for index in ANIMATION_PROGRESS.findall(output)]
+        if indices:
+            self.progress(max(indices))
+
+    def stalled(self) -> bool:
+        with self._lock:
+            # Before the first animation the process is still starting up
+            window = self.budget.stall_timeout + (self.budget.startup if self.first_progress_at is None else 0)
+            return time.monotonic() - self.last_progress_at > window
+
+    def render_seconds(self) -> float:
+        """Time spent on animations, without the start-up before the first one."""
+        return time.monotonic() - (self.first_progress_at or self.started_at)
+
+    def stall_message(self) -> str:
+        return (
+            f"Render stalled: no new animation finished in {self.budget.stall_timeout:.0f} seconds "
+            f"(after {self.animations} of about {self.budget.estimate.animations} animations). "
+            "Look for an animation or updater that never ends, or an expensive computation in construct, and revise the code accordingly."
+        )
+
+    def timeout_message(self) -> str:
+        return (
+            f"Execution timed out. Code took longer than {self.budget.timeout:.0f} seconds to execute "
+            f"(about {self.budget.estimate.seconds:.0f} seconds of video), revise the code accordingly, keeping the details of the old scene in mind."
+        )
+
+
+if __name__ == "__main__":
+    code = """
+from manim import *
+
+class VideoScene(Scene):
+    def construct(self):
+        square = Square()
+        self.play(Create(square), run_time=2)
+        for _ in range(3):
+            self.play(square.animate.rotate(PI / 4))
+        self.play(Transform(square, Circle(), run_time=1.5))
+        self.wait(2)
+    """
+    budget = RenderBudget(code, quality="l")
+    print(budget)
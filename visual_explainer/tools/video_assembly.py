@@ -0,0 +1,224 @@
+import itertools
+import os
+import time
+from fractions import Fraction
+from typing import Any, Dict, List, Optional, Union
+
+import av
+
+# The narration track of the final video, encoded once for the whole video
+NARRATION_SAMPLE_RATE = 44100
+
+
+def probe_video(video_path: Union[str, os.PathLike]) -> Dict[str, Any]:
+    """The stream parameters that have to match for two files to be joined without re-encoding."""
+    with av.open(str(video_path)) as container:
+        stream = container.streams.video[0]
+        codec_context = stream.codec_context
+        return {
+            "codec": codec_context.name,
+            "width": codec_context.width,
+            "height": codec_context.height,
+            "fps": stream.average_rate,
+            "pix_fmt": codec_context.pix_fmt,
+            "extradata": bytes(codec_context.extradata or b""),
+        }
+
+
+def _add_stream_from_template(container, template_stream):
+    # PyAV >= 14 renamed `add_stream(template=...)`
+    if hasattr(container, "add_stream_from_template"):
+        return container.add_stream_from_template(template_stream)
+    return container.add_stream(template=template_stream)
+
+
+def concat_stream_copy(scene_paths: List[Union[str, os.PathLike]], output_path: Union[str, os.PathLike]) -> List[float]:
+    """Join the scenes by copying their compressed packets, only the timestamps are shifted. Returns each scene's duration."""
+    durations = []
+    with av.open(str(output_path), "w") as output:
+        output_stream = None
+        offset = Fraction(0)   # in seconds, where the next scene starts
+
+        for scene_path in scene_paths:
+            with av.open(str(scene_path)) as scene:
+                input_stream = scene.streams.video[0]
+                if output_stream is None:
+                    output_stream = _add_stream_from_template(output, input_stream)
+
+                time_base = input_stream.time_base
+                shift = int(offset / time_base)
+                scene_end = offset
+
+                for packet in scene.demux(input_stream):
+                    # The demuxer yields an empty packet to flush, it has nothing to copy
+                    if packet.dts is None:
+                        continue
+                    packet_end = (packet.pts or packet.dts) + (packet.duration or 0)
+                    scene_end = max(scene_end, offset + packet_end * time_base)
+
+                    packet.pts = packet.pts + shift if packet.pts is not None else None
+                    packet.dts = packet.dts + shift
+                    packet.stream = output_stream
+                    output.mux(packet)
+
+                durations.append(float(scene_end - offset))
+                offset = scene_end
+    return durations
+
+
+def concat_transcode(scene_paths: List[Union[str, os.PathLike]], output_path: Union[str, os.PathLike], target: Dict[str, Any]) -> List[float]:
+    """Single normalizing encode to the `target` resolution and frame rate, for scenes that can't be stream copied."""
+    fps = Fraction(target["fps"])
+    durations = []
+    with av.open(str(output_path), "w") as output:
+        output_stream = output.add_stream("libx264", rate=fps)
+        output_stream.width = target["width"]
+        output_stream.height = target["height"]
+        output_stream.pix_fmt = "yuv420p"
+
+        next_index = 0
+        offset = 0.0
+        for scene_path in scene_paths:
+            with av.open(str(scene_path)) as scene:
+                input_stream = scene.streams.video[0]
+                scene_end = offset
+                for frame in scene.decode(input_stream):
+                    frame_time = offset + (frame.time or 0.0)
+                    scene_end = max(scene_end, frame_time + 1 / float(fps))
+
+                    # Resample to the target frame rate by dropping or repeating frames
+                    target_index = round(frame_time * fps)
+                    if target_index < next_index:
+                        continue
+                    frame = frame.reformat(width=target["width"], height=target["height"], format="yuv420p")
+                    while next_index <= target_index:
+                        frame.pts = next_index
+                        frame.time_base = 1 / fps
+                        output.mux(output_stream.encode(frame))
+                        next_index += 1
+                durations.append(scene_end - offset)
+                offset = scene_end
+
+        output.mux(output_stream.encode(None))
+    return durations
+
+
+def _silence(samples: int) -> av.AudioFrame:
+    frame = av.AudioFrame(format="fltp", layout="mono", samples=samples)
+    frame.planes[0].update(bytes(frame.planes[0].buffer_size))
+    return frame
+
+
+def _clip(frame: av.AudioFrame, samples: int) -> av.AudioFrame:
+    """The first `samples` samples of a mono fltp frame."""
+    clipped = av.AudioFrame(format="fltp", layout="mono", samples=samples)
+    clipped.planes[0].update(bytes(frame.planes[0])[:clipped.planes[0].buffer_size])
+    return clipped
+
+
+def _scene_audio(audio_path: Optional[Union[str, os.PathLike]], samples: int):
+    """Mono fltp frames of a narration clip, cut or padded with silence to exactly `samples` samples."""
+    written, cut = 0, False
+    if audio_path:
+        resampler = av.AudioResampler(format="fltp", layout="mono", rate=NARRATION_SAMPLE_RATE)
+        with av.open(str(audio_path)) as clip:
+            decoded = clip.decode(clip.streams.audio[0])
+            # None flushes the samples the resampler still holds
+            for frame in itertools.chain(decoded, [None]):
+                for resampled in resampler.resample(frame):
+                    if written + resampled.samples > samples:
+                        resampled, cut = _clip(resampled, samples - written), True
+                    written += resampled.samples
+                    if resampled.samples:
+                        yield resampled
+                    if cut:
+                        break
+                if cut:
+                    print(f"[Assembly] Narration {os.path.basename(str(audio_path))} is longer than its scene, cut at {samples / NARRATION_SAMPLE_RATE:.1f}s")
+                    break
+
+    # Scene by scene, so every clip starts with its own scene
+    while written < samples:
+        chunk = min(4096, samples - written)
+        written += chunk
+        yield _silence(chunk)
+
+
+def mux_narration(
+    video_path: Union[str, os.PathLike],
+    audio_paths: List[Optional[Union[str, os.PathLike]]],
+    scene_durations: List[float],
+    output_path: Union[str, os.PathLike],
+) -> None:
+    """
+    Add the scenes' narration to a joined video: the video packets are copied as they are, the clips are laid out
+    at the start of their scenes (scenes without one are silent) and encoded to a single AAC track in one pass.
+    """
+    with av.open(str(video_path)) as video, av.open(str(output_path), "w") as output:
+        input_stream = video.streams.video[0]
+        video_stream = _add_stream_from_template(output, input_stream)
+        audio_stream = output.add_stream("aac", rate=NARRATION_SAMPLE_RATE)
+        audio_stream.layout = "mono"
+
+        # The whole track goes first, the muxer interleaves it with the video (audio is small to hold)
+        position = 0
+        for audio_path, duration in zip(audio_paths, scene_durations):
+            for frame in _scene_audio(audio_path, round(duration * NARRATION_SAMPLE_RATE)):
+                frame.pts, frame.sample_rate, frame.time_base = position, NARRATION_SAMPLE_RATE, Fraction(1, NARRATION_SAMPLE_RATE)
+                position += frame.samples
+                output.mux(audio_stream.encode(frame))
+        output.mux(audio_stream.encode(None))
+
+        for packet in video.demux(input_stream):
+            if packet.dts is None:
+                continue
+            packet.stream = video_stream
+            output.mux(packet)
+
+
+def assemble_video(
+    scene_paths: List[Union[str, os.PathLike]],
+    output_path: Union[str, os.PathLike],
+    audio_paths: Optional[List[Optional[Union[str, os.PathLike]]]] = None,
+) -> tuple[bool, str]:
+    """
+    With a True boolean, you get the final video path. With false, you get the error associated to the assembly.
+    `audio_paths` (one per scene, None for a silent one) become the narration track.
+    """
+    if not scene_paths:
+        return False, "Error: No scene videos to assemble."
+
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        scene_params = [probe_video(scene_path) for scene_path in scene_paths]
+
+        narrated = audio_paths is not None and any(audio_paths)
+        # With narration the joined video is only an intermediate, the audio is added next to it
+        video_path = f"{os.path.splitext(str(output_path))[0]}.video.mp4" if narrated else output_path
+
+        if all(params == scene_params[0] for params in scene_params):
+            durations = concat_stream_copy(scene_paths, video_path)
+            mode = "stream copy"
+        else:
+            print("[Assembly] Scene videos differ in codec, resolution or fps, normalizing with a single transcode")
+            durations = concat_transcode(scene_paths, video_path, scene_params[0])
+            mode = "transcode"
+
+        if narrated:
+            mux_narration(video_path, audio_paths, durations, output_path)
+            os.remove(video_path)
+            mode += f", {sum(1 for audio_path in audio_paths if audio_path)} narration clips"
+    except Exception as e:
+        return False, f"System error during assembly: {str(e)}"
+
+    print(f"[Assembly] Joined {len(scene_paths)} scenes ({mode}) in {time.perf_counter() - start:.3f}s: {output_path}")
+    return True, str(output_path)
+
+
+if __name__ == "__main__":
+    import glob
+
+    VIDEO_OUTPUT_DIR = os.path.join(os.path.abspath(os.path.curdir), "outputs", "videos", "test-thread")
+    scene_paths = sorted(glob.glob(os.path.join(VIDEO_OUTPUT_DIR, "scene_*.mp4")), key=lambda path: int(path.rsplit("_", 1)[1][:-4]))
+    print(assemble_video(scene_paths, os.path.join(VIDEO_OUTPUT_DIR, "final.mp4")))
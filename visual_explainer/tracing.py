@@ -0,0 +1,186 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+TRACE_ROOT = os.path.join(os.path.abspath(os.path.curdir), "outputs", "traces")
+
+# Which run and scene the current code works for. Threads started through `copy_context().run`
+# and `asyncio` tasks inherit these, so spans deep inside an agent still know their scene
+_thread_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_thread_id", default=None)
+_scene_id: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("trace_scene_id", default=None)
+_parent_span_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_parent_span_id", default=None)
+
+
+class TraceSink:
+    """Appends finished spans to `<trace_dir>/<thread_id>.jsonl`, one JSON object per line."""
+    def __init__(self, trace_dir: Union[str, os.PathLike] = TRACE_ROOT, enabled: bool = True):
+        self.trace_dir = trace_dir
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"TraceSink(dir={self.trace_dir}, enabled={self.enabled})"
+
+    def trace_path(self, thread_id: str) -> str:
+        return os.path.join(self.trace_dir, f"{thread_id}.jsonl")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        # Spans outside of a run (a lone agent call, the tests) have nowhere to go
+        if not self.enabled or record.get("thread_id") is None:
+            return
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            with open(self.trace_path(record["thread_id"]), "a") as f:
+                f.write(line)
+
+    def load(self, thread_id: str) -> List[Dict[str, Any]]:
+        path = self.trace_path(thread_id)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+trace_sink = TraceSink(os.getenv("TRACE_DIR", TRACE_ROOT), enabled=os.getenv("TRACING", "1") != "0")
+
+
+@contextmanager
+def trace_scope(thread_id: Optional[str] = None, scene_id: Optional[int] = None) -> Iterator[None]:
+    """Key every span opened inside this block by `thread_id` and/or `scene_id`."""
+    tokens = []
+    if thread_id is not None:
+        tokens.append((_thread_id, _thread_id.set(thread_id)))
+    if scene_id is not None:
+        tokens.append((_scene_id, _scene_id.set(scene_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class Span:
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attrs = attrs
+
+    def __repr__(self):
+        return f"Span(name={self.name}, attrs={self.attrs})"
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """
+    Time the block as a span nested under the enclosing one. Attributes known only at the end
+    (tokens, success, ...) can be added through `Span.set`. The span is written when the block exits.
+    """
+    current = Span(name, attrs)
+    parent_id = _parent_span_id.get()
+    token = _parent_span_id.set(current.span_id)
+
+    status, error = "ok", None
+    start_time, start = time.time(), time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _parent_span_id.reset(token)
+        trace_sink.write({
+            "name": name,
+            "span_id": current.span_id,
+            "parent_id": parent_id,
+            "thread_id": _thread_id.get(),
+            "scene_id": _scene_id.get(),
+            "start": start_time,
+            "duration": time.perf_counter() - start,
+            "status": status,
+            "error": error,
+            "attrs": current.attrs,
+        })
+
+
+def critical_path(spans: List[Dict[str, Any]]) -> List[tuple[int, Dict[str, Any]]]:
+    """
+    The chain of spans that decided when the run ended, as (depth, span) in start order.
+    Walking back from the end of each span, the child that finished last is the one that was being
+    waited for, then the latest child that finished before it started, and so on.
+    """
+    children: Dict[Optional[str], List[Dict[str, Any]]] = defaultdict(list)
+    span_ids = {record["span_id"] for record in spans}
+    for record in spans:
+        record["end"] = record["start"] + record["duration"]
+        # Spans whose parent was never written (e.g. the run crashed) hang off the top
+        parent_id = record["parent_id"] if record["parent_id"] in span_ids else None
+        children[parent_id].append(record)
+
+    def walk(span_id: Optional[str], end: float, depth: int) -> List[tuple[int, Dict[str, Any]]]:
+        chain = []
+        cursor = end
+        for child in sorted(children[span_id], key=lambda record: record["end"], reverse=True):
+            if child["end"] <= cursor + 1e-3:
+                chain.append(child)
+                cursor = child["start"]
+
+        path = []
+        for child in reversed(chain):
+            path.append((depth, child))
+            path.extend(walk(child["span_id"], child["end"], depth + 1))
+        return path
+
+    return walk(None, max((record["end"] for record in spans), default=0.0), 0)
+
+
+def summarize(thread_id: str, sink: TraceSink = trace_sink) -> None:
+    """Print the time and tokens per span name, then the critical path of the run."""
+    spans = sink.load(thread_id)
+    if not spans:
+        print(f"No trace found for thread {thread_id} in {sink.trace_dir}")
+        return
+
+    run_start = min(record["start"] for record in spans)
+    run_end = max(record["start"] + record["duration"] for record in spans)
+    print(f"Trace {thread_id}: {len(spans)} spans over {run_end - run_start:.1f}s\n")
+
+    totals: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for record in spans:
+        total = totals[record["name"]]
+        total["count"] += 1
+        total["seconds"] += record["duration"]
+        total["errors"] += record["status"] == "error"
+        total["tokens"] += sum(record["attrs"].get(key) or 0 for key in ("prompt_tokens", "completion_tokens"))
+
+    print(f"{'span':<24}{'count':>7}{'total s':>10}{'mean s':>9}{'tokens':>9}{'errors':>8}")
+    for name, total in sorted(totals.items(), key=lambda item: item[1]["seconds"], reverse=True):
+        print(
+            f"{name:<24}{int(total['count']):>7}{total['seconds']:>10.2f}{total['seconds'] / total['count']:>9.2f}"
+            f"{int(total['tokens']):>9}{int(total['errors']):>8}"
+        )
+
+    print("\nCritical path:")
+    for depth, record in critical_path(spans):
+        scene = f" [scene {record['scene_id']}]" if record["scene_id"] is not None else ""
+        details = ", ".join(f"{key}={value}" for key, value in record["attrs"].items())
+        status = " ERROR" if record["status"] == "error" else ""
+        print(
+            f"  {record['start'] - run_start:>7.2f}s {'  ' * depth}{record['name']}{scene} "
+            f"{record['duration']:.2f}s{status}{f' ({details})' if details else ''}"
+        )
+
+
+if __name__ == "__main__":
+    # python -m visual_explainer.tracing <thread_id>
+    summarize(sys.argv[1] if len(sys.argv) > 1 else "test-thread")